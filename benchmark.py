@@ -0,0 +1,152 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from itertools import islice
+
+#Sizes and formats to benchmark by default
+SIZES = [1000, 10000, 100000, 1000000]
+FORMATS = ["stream", "nt", "turtle", "xml", "pretty-xml"]
+
+
+def _peak_rss():
+    """Determine the peak resident set size of this process
+
+    Returns:
+        int: peak resident set size in bytes or None if the platform can not tell
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    #Linux reports kilobytes and macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _rate(count, seconds):
+    return count / seconds if seconds > 0 else None
+
+
+def _run_case(size, formats, chunk_size, build_workers, seed):
+    """Benchmark every stage for one size of the datasets. Runs in a fresh process so that peak memory is its own
+
+    Args:
+        size (int): number of reports in each dataset
+        formats ([string]): serialization formats, "stream" to write N-Triples while building
+        chunk_size (int): number of rows to convert to triples at a time
+        build_workers (int): number of processes to convert rows with
+        seed (int): seed of the synthetic data
+
+    Returns:
+        dict: measurements of the case
+    """
+    from rdflib import Namespace
+    from src.entities import EntityRegistry
+    from src.mapping import ARREST_REPORTS, CRIME_REPORTS, RowConverter
+    from src.rdf import RDF_Graph, _map_chunk
+    from src.synthetic import generate_arrest_reports, generate_crime_reports
+
+    base_url = "https://data.lacity.org/"
+    arrest_reports = list(generate_arrest_reports(size, seed))
+    crime_reports = list(generate_crime_reports(size, seed))
+    rows = len(arrest_reports) + len(crime_reports) - 2
+    datasets = [(arrest_reports, ARREST_REPORTS), (crime_reports, CRIME_REPORTS)]
+    stages = {}
+
+    #Convert rows to literals and natural keys
+    start = time.perf_counter()
+    chunks = []
+    for reports, mapping in datasets:
+        converter = RowConverter(mapping, base_url)
+        remaining = iter(reports[1:])
+        for chunk in iter(lambda: list(islice(remaining, chunk_size)), []):
+            chunks.append(_map_chunk(chunk, converter))
+    seconds = time.perf_counter() - start
+    stages["map"] = {"seconds": seconds, "rows_per_second": _rate(rows, seconds)}
+
+    #Deduplicate entities by their natural keys
+    registry = EntityRegistry(Namespace(base_url))
+    lookups = 0
+    start = time.perf_counter()
+    for _, _, _, entity_columns, _ in chunks:
+        for class_name, keys, _, _, _ in entity_columns:
+            for key in keys:
+                registry.intern(class_name, key)
+            lookups += len(keys)
+    seconds = time.perf_counter() - start
+    stages["dedup"] = {"seconds": seconds, "lookups": lookups, "lookups_per_second": _rate(lookups, seconds), "entities": dict(registry.counters)}
+    del chunks, registry
+
+    #Build the in-memory graph. The report index is left out so that exports only measure serialization
+    start = time.perf_counter()
+    graph = RDF_Graph(base_url=base_url, arrest_reports=arrest_reports, crime_reports=crime_reports, chunk_size=chunk_size, build_workers=build_workers, index=False)
+    seconds = time.perf_counter() - start
+    triples = len(graph.graph)
+    stages["build"] = {"seconds": seconds, "rows_per_second": _rate(rows, seconds), "triples": triples, "triples_per_second": _rate(triples, seconds),
+        "metrics": graph.metrics.snapshot()}
+
+    #Serialize the graph in every format
+    stages["serialize"] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for format in formats:
+            destination = os.path.join(directory, "output." + format)
+            start = time.perf_counter()
+            if format == "stream":
+                RDF_Graph(base_url=base_url, arrest_reports=arrest_reports, crime_reports=crime_reports, chunk_size=chunk_size, build_workers=build_workers, index=False, output=destination)
+            else:
+                graph.export(destination, format=format)
+            seconds = time.perf_counter() - start
+            stages["serialize"][format] = {"seconds": seconds, "bytes": os.path.getsize(destination), "triples_per_second": _rate(triples, seconds)}
+
+    return {"size": size, "rows": rows, "stages": stages, "peak_rss_bytes": _peak_rss()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark building and exporting the RDF graph from synthetic LAPD-shaped datasets")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="number of reports in each dataset")
+    parser.add_argument("--formats", nargs="+", default=FORMATS, help="serialization formats, \"stream\" to write N-Triples while building")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="number of rows to convert to triples at a time")
+    parser.add_argument("--build-workers", type=int, default=1, help="number of processes to convert rows with")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic datasets")
+    parser.add_argument("--output", help="file to write the JSON report to instead of the standard output")
+    args = parser.parse_args()
+
+    #Progress messages go to the standard error to keep them out of the JSON report
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.INFO)
+
+    #Run every size in a fresh process
+    context = multiprocessing.get_context("spawn")
+    cases = []
+    for size in args.sizes:
+        logging.info("Benchmarking %s reports per dataset...", size)
+        with context.Pool(1) as pool:
+            cases.append(pool.apply(_run_case, (size, args.formats, args.chunk_size, args.build_workers, args.seed)))
+
+    import numpy
+    import pandas
+    import rdflib
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "versions": {"rdflib": rdflib.__version__, "pandas": pandas.__version__, "numpy": numpy.__version__},
+        "chunk_size": args.chunk_size,
+        "build_workers": args.build_workers,
+        "cases": cases}
+
+    if args.output:
+        with open(args.output, "wt") as fp:
+            json.dump(report, fp, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,243 @@
-from src.rdf import RDF_Graph
+import argparse
+import json
+import logging
 import os
+import sys
 
-#Variables
-filename = os.path.abspath("./output.rdf")
-arrest_reports_url = "https://data.lacity.org/resource/amvf-fr72"
-crime_reports_url = "https://data.lacity.org/resource/2nrs-mtv8"
-max_data_count = 1000
-done = False
-sucess_option_1 = False
-sucess_option_2 = False
-sucess_option_3 = False
-
-#CLI logic
-while (not done):
-
-    #Print instructions
-    print("Modeling RDF Data with LA Public Safety Data")
-
-    print(" This program will: \n     \u2022 Download datasets for Arrest Reports and Crime Reports \n     \u2022 Generate RDF graph from both reports \n     \u2022 Save RDF graph to a file")
-
-    print(" Parameters: \n     \u2022 Arrest Reports URL: %s \n     \u2022 Crime Reports URL: %s \n     \u2022 RDF Filename: %s \n     \u2022 Max Data Count to Download: %s" % (arrest_reports_url, crime_reports_url, filename, max_data_count))
-
-    print(" Options: \n     1. Run \n     2. Modify filename \n     3. Modify max max data count \n     4. Exit")
-
-    #User's input feedback
-    if sucess_option_1:
-        print("INFO: Successfully generate RDF file...")
-        sucess_option_1=False
-    elif sucess_option_2:
-        print("INFO: Successfully modify filename")
-        sucess_option_2=False
-    elif sucess_option_3:
-        print("INFO: Successfully modify max data count")
-        sucess_option_3=False
-
-    #Obtain user's input
-    user_input = input("Enter an option: ")
-
-    #Option 1: Generate RDF and save to file
-    if (user_input=="1"):
-        graph = RDF_Graph(arrest_reports_url=arrest_reports_url, crime_reports_url=crime_reports_url, max_data_count=max_data_count)
-        graph.export(filename)
-        sucess_option_1=True
-        pass
-
-    #Option 2: Modify filename
-    elif (user_input=="2"):
-        filename = input("Enter filename: ")
-        filename = os.path.abspath(filename)
-        sucess_option_2=True
-        pass
-
-    #Option 3: Modify max dataset size
-    elif (user_input=="3"):
-        max_data_count = int(input("Enter size: "))
-        sucess_option_3=True
-        pass
-
-    #Option 4: Exit
-    elif (user_input=="4"):
-        done = True
-        pass
-
-    #Clear terminal to prevent overcrowded 
-    os.system('cls' if os.name == 'nt' else 'clear')
+#Exit codes
+EXIT_OK = 0
+EXIT_BUILD_FAILED = 1
+EXIT_USAGE = 2
+EXIT_EXPORT_FAILED = 3
 
+#Format of each output inferred from its extension
+FORMATS = {
+    ".rdf": "pretty-xml",
+    ".xml": "xml",
+    ".ttl": "turtle",
+    ".nt": "nt",
+    ".n3": "n3",
+    ".nq": "nquads",
+    ".trig": "trig",
+    ".jsonld": "json-ld",
+    ".jsonl": "jsonld-lines",
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".snap": "snapshot"}
+
+logger = logging.getLogger(__name__)
+
+
+def _parser():
+    """Create the parser of the command line
+
+    Returns:
+        ArgumentParser: the parser
+    """
+    parser = argparse.ArgumentParser(description="Download the LA arrest and crime reports datasets, build an RDF graph from them and write it in one or more formats",
+        epilog="Exit codes: 0 on success, 1 if the graph could not be built, 2 on invalid arguments, 3 if any output could not be written")
+    parser.add_argument("-c", "--config", help="JSON file of default values of any option below, keyed by its name such as \"max_data_count\"")
+
+    datasets = parser.add_argument_group("datasets")
+    datasets.add_argument("--base-url", default="https://data.lacity.org/", help="base namespace for all resources")
+    datasets.add_argument("--arrest-reports-url", default="https://data.lacity.org/resource/amvf-fr72", help="URL of the arrest reports dataset")
+    datasets.add_argument("--crime-reports-url", default="https://data.lacity.org/resource/2nrs-mtv8", help="URL of the crime reports dataset")
+    datasets.add_argument("--arrest-reports-file", help="CSV file or directory of CSV files of the arrest reports to read instead of downloading them, CSV and Parquet outputs are then unavailable")
+    datasets.add_argument("--crime-reports-file", help="CSV file or directory of CSV files of the crime reports to read instead of downloading them, CSV and Parquet outputs are then unavailable")
+    datasets.add_argument("--datasets", nargs="+", choices=["ArrestReport", "CrimeReport"], help="datasets to build, by default both")
+    datasets.add_argument("--entities", nargs="+", help="entity classes to link the reports to such as Location Weapon, by default every class. Only the columns read are downloaded")
+    datasets.add_argument("--predicates", nargs="+", help="properties of the reports such as hasDate hasTime, by default every property. Only the columns read are downloaded")
+    datasets.add_argument("-n", "--max-data-count", type=int, default=1000, help="maximum number of reports to download or read from each dataset")
+
+    outputs = parser.add_argument_group("outputs")
+    outputs.add_argument("-o", "--output", action="append", default=[], help="file to write the graph to, repeat to write several formats from a single build")
+    outputs.add_argument("-f", "--format", action="append", default=[], help="format of each output in the same order, inferred from its extension if not given: %s" % ", ".join(sorted(set(FORMATS.values()))))
+    outputs.add_argument("--export-workers", type=int, help="number of processes to write N-Triples, Turtle and JSON-LD lines outputs with, a chunk of subjects at a time")
+    outputs.add_argument("--shards", action="store_true", help="write every chunk of subjects of chunked outputs to its own file")
+    outputs.add_argument("--stream-output", help="write triples to an N-Triples file while the graph is built instead of keeping it in memory")
+    outputs.add_argument("--compress", action="store_true", default=None, help="compress the streamed output with gzip, by default only if it ends with \".gz\"")
+    outputs.add_argument("--store", help="SQLite file to keep the graph in instead of memory")
+
+    build = parser.add_argument_group("build")
+    build.add_argument("--page-size", type=int, default=50000, help="number of rows to request per page")
+    build.add_argument("--workers", type=int, default=4, help="number of pages to download at the same time")
+    build.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for the server to accept a connection or to send more of a response before retrying (default: %(default)s)")
+    build.add_argument("--build-workers", type=int, default=1, help="number of processes to convert rows to triples with")
+    build.add_argument("--chunk-size", type=int, default=10000, help="number of rows to convert to triples at a time")
+    build.add_argument("--shared-entities", action="store_true", help="convert both datasets in the same build workers, one after the other, instead of starting workers for every dataset")
+    build.add_argument("--dedup-dir", help="deduplicate entities on disk in this directory and number them once every report has been read, for datasets larger than memory. Reports are then not indexed")
+    build.add_argument("--dedup-memory", type=int, default=256, help="megabytes of memory to deduplicate entities on disk with (default: %(default)s)")
+    build.add_argument("--streaming", action="store_true", help="add rows to the graph as they are downloaded instead of keeping the datasets, CSV and Parquet outputs are then unavailable")
+    build.add_argument("--checkpoint-dir", help="directory to save downloaded pages to so that an interrupted download can be resumed")
+    build.add_argument("--cache-dir", help="directory to cache responses in")
+    build.add_argument("--offline", action="store_true", help="serve every response from the cache")
+    build.add_argument("--staging-dir", help="directory to stage the datasets in as Parquet files and read them from on the next run, CSV and Parquet outputs are then unavailable")
+    build.add_argument("--state", help="file to save entities and the last report downloaded from each dataset to so that the next run only adds the reports published since to --store or --stream-output")
+    build.add_argument("--index", action="store_true", default=None, help="index the reports to count them and find them by location, by default unless --stream-output is given since the index keeps every report in memory. Not available with --dedup-dir and --state")
+    build.add_argument("--no-index", dest="index", action="store_false", help="do not index the reports")
+
+    instrumentation = parser.add_argument_group("instrumentation")
+    instrumentation.add_argument("--metrics-file", help="JSON file to write the timers and counters of the build to")
+    instrumentation.add_argument("--profile", help="file to save cProfile statistics of the build to")
+    instrumentation.add_argument("--trace-memory", action="store_true", help="trace memory allocations of the build")
+    instrumentation.add_argument("--progress-interval", type=float, help="seconds between progress reports")
+    instrumentation.add_argument("--log-json", action="store_true", help="log a JSON object per line")
+    instrumentation.add_argument("-q", "--quiet", action="store_true", help="only log warnings and errors")
+
+    return parser
+
+
+def _parse_arguments(parser, argv):
+    """Parse the command line on top of the values of the config file
+
+    Args:
+        parser (ArgumentParser): the parser
+        argv ([string]): arguments of the command line
+
+    Returns:
+        Namespace: the options
+    """
+    args = parser.parse_args(argv)
+    if args.config:
+        try:
+            with open(args.config, "rt") as fp:
+                config = json.load(fp)
+        except (OSError, ValueError) as error:
+            parser.error("can not read config file \"%s\": %s" % (args.config, error))
+
+        names = {action.dest for action in parser._actions} - {"help", "config"}
+        unknown = sorted(set(config) - names)
+        if unknown:
+            parser.error("unknown options in config file \"%s\": %s" % (args.config, ", ".join(unknown)))
+
+        #Options given on the command line override the config file. Options that can be repeated would be added to the values of
+        #the config file, so the values given on the command line replace them instead
+        given = {action.dest: getattr(args, action.dest) for action in parser._actions
+            if isinstance(action, argparse._AppendAction) and getattr(args, action.dest)}
+        parser.set_defaults(**config)
+        args = parser.parse_args(argv)
+        for name, values in given.items():
+            setattr(args, name, values)
+
+    #Local files are needed for every dataset that is built
+    for name, path in (("ArrestReport", args.arrest_reports_file), ("CrimeReport", args.crime_reports_file)):
+        if path is None and (args.arrest_reports_file or args.crime_reports_file) and (args.datasets is None or name in args.datasets):
+            parser.error("--arrest-reports-file and --crime-reports-file must be given for every dataset that is built")
+    return args
+
+
+def _outputs(parser, args):
+    """Pair every output with its format
+
+    Args:
+        parser (ArgumentParser): the parser
+        args (Namespace): the options
+
+    Returns:
+        [(string, string)]: outputs as (path, format)
+    """
+    if args.format and len(args.format) != len(args.output):
+        parser.error("--format must be given once per --output or not at all")
+
+    outputs = []
+    for index, path in enumerate(args.output):
+        format = args.format[index] if args.format else FORMATS.get(os.path.splitext(path)[1].lower())
+        if format is None:
+            parser.error("can not infer the format of \"%s\", use --format" % path)
+        outputs.append((os.path.abspath(path), format))
+
+    if not outputs and not args.stream_output and not args.store:
+        parser.error("nothing to write, give --output, --stream-output or --store")
+    if args.stream_output and any(format not in ("csv", "parquet") for _, format in outputs):
+        parser.error("RDF outputs are not available with --stream-output since the graph is not kept")
+
+    #CSV and Parquet outputs are written from the rows of the datasets, which are only kept when they are downloaded without streaming
+    if any(format in ("csv", "parquet") for _, format in outputs):
+        for option, value in (("--streaming", args.streaming), ("--staging-dir", args.staging_dir),
+                ("--arrest-reports-file", args.arrest_reports_file), ("--crime-reports-file", args.crime_reports_file)):
+            if value:
+                parser.error("CSV and Parquet outputs are not available with %s since the rows of the datasets are not kept" % option)
+
+    #A run that continues from a state only builds the newer reports, so they must be added to a graph that is kept between runs
+    if args.state and not args.store and not args.stream_output:
+        parser.error("--state needs --store or --stream-output to add the newer reports to, otherwise every output would only hold them")
+    if args.state and any(format in ("csv", "parquet") for _, format in outputs):
+        parser.error("CSV and Parquet outputs are not available with --state since they would only hold the newer reports")
+    if args.state and args.dedup_dir:
+        parser.error("--dedup-dir is not available with --state since the entities deduplicated on disk are not kept in the state")
+    if args.state and args.index:
+        parser.error("--index is not available with --state since the reports of previous runs are not kept in the state")
+    if args.dedup_dir and args.index:
+        parser.error("--index is not available with --dedup-dir since the entities deduplicated on disk are not kept in memory")
+    if args.state and (args.arrest_reports_file or args.crime_reports_file):
+        parser.error("--state is not available with --arrest-reports-file and --crime-reports-file since local reports have no publication time to continue from")
+    return outputs
+
+
+def _configure_logging(args):
+    handler = logging.StreamHandler()
+    if args.log_json:
+        from src.metrics import JsonFormatter
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO, handlers=[handler])
+
+
+def main(argv=None):
+    """Build the graph once and write it to every output
+
+    Args:
+        argv ([string], optional): arguments of the command line. Defaults to None to use sys.argv.
+
+    Returns:
+        int: exit code
+    """
+    parser = _parser()
+    try:
+        args = _parse_arguments(parser, argv)
+        outputs = _outputs(parser, args)
+    except SystemExit as exit:
+        return exit.code
+    _configure_logging(args)
+
+    #Import the graph builder once the arguments are known to be valid
+    from src.rdf import RDF_Graph
+    from src.serialize import FORMATS as CHUNKED_FORMATS
+
+    try:
+        graph = RDF_Graph(base_url=args.base_url, arrest_reports_url=args.arrest_reports_url, crime_reports_url=args.crime_reports_url,
+            max_data_count=args.max_data_count, page_size=args.page_size, workers=args.workers, timeout=args.timeout, checkpoint_dir=args.checkpoint_dir,
+            streaming=args.streaming, chunk_size=args.chunk_size, output=args.stream_output, compress=args.compress,
+            build_workers=args.build_workers, state=args.state, store=args.store, cache_dir=args.cache_dir, offline=args.offline,
+            staging_dir=args.staging_dir, index=args.index, metrics_file=args.metrics_file, profile=args.profile,
+            trace_memory=args.trace_memory, progress_interval=args.progress_interval, shared_entities=args.shared_entities,
+            arrest_reports=args.arrest_reports_file, crime_reports=args.crime_reports_file,
+            dedup_dir=args.dedup_dir, dedup_memory=args.dedup_memory << 20, datasets=args.datasets, entity_classes=args.entities,
+            predicates=args.predicates)
+    except KeyboardInterrupt:
+        raise
+    except Exception:
+        logger.exception("Failed to build the RDF graph")
+        return EXIT_BUILD_FAILED
+
+    #Write every output from the same graph and keep going if one of them fails
+    failed = 0
+    for path, format in outputs:
+        try:
+            if format in CHUNKED_FORMATS:
+                graph.export(path, format=format, workers=args.export_workers, shards=args.shards)
+            else:
+                graph.export(path, format=format)
+        except Exception:
+            logger.exception("Failed to write \"%s\" formatted as %s", path, format)
+            failed += 1
+
+    if failed:
+        logger.error("%s of %s outputs could not be written", failed, len(outputs))
+        return EXIT_EXPORT_FAILED
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
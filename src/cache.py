@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    def __init__(self, directory, max_size=1 << 30):
+        """Keep HTTP responses on disk by the hash of their URL, query and dataset version and evict the least recently used ones
+
+        Args:
+            directory (str): directory to keep responses in
+            max_size (int, optional): maximum total size of the responses in bytes. Defaults to 1 GiB.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        #Size of every response from least to most recently used
+        self.sizes = OrderedDict()
+        entries = []
+        for name in os.listdir(directory):
+            if name.endswith(".body"):
+                path = os.path.join(directory, name)
+                entries.append((os.path.getmtime(path), name[:-len(".body")], os.path.getsize(path)))
+        for _, key, size in sorted(entries):
+            self.sizes[key] = size
+        self.size = sum(self.sizes.values())
+
+
+    @staticmethod
+    def key(url, params, version=None):
+        """Create the key of a response
+
+        Args:
+            url (string): URL of the request
+            params (dict): query parameters of the request
+            version (string, optional): modification time of the dataset. Defaults to None.
+
+        Returns:
+            string: the key
+        """
+        request = json.dumps([url, sorted((str(name), str(value)) for name, value in params.items()), version])
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+
+    def _path(self, key, extension):
+        return os.path.join(self.directory, key + extension)
+
+
+    def get(self, key):
+        """Find a response and mark it as the most recently used
+
+        Args:
+            key (string): key of the response
+
+        Returns:
+            (bytes, dict): content and headers of the response or None if it is not cached
+        """
+        with self.lock:
+            if key not in self.sizes:
+                return None
+            try:
+                with open(self._path(key, ".body"), "rb") as fp:
+                    content = fp.read()
+                with open(self._path(key, ".json"), "rt", encoding="utf-8") as fp:
+                    headers = json.load(fp)
+            except OSError:
+                self._remove(key)
+                return None
+
+            os.utime(self._path(key, ".body"))
+            self.sizes.move_to_end(key)
+            return content, headers
+
+
+    def put(self, key, content, headers):
+        """Save a response and evict the least recently used ones until the cache fits in max_size
+
+        Args:
+            key (string): key of the response
+            content (bytes): content of the response
+            headers (dict): headers of the response needed to revalidate it
+        """
+        with self.lock:
+            if key in self.sizes:
+                self._remove(key)
+
+            #Write headers first so that a body is never found without them
+            with open(self._path(key, ".json.tmp"), "wt", encoding="utf-8") as fp:
+                json.dump(headers, fp)
+            os.replace(self._path(key, ".json.tmp"), self._path(key, ".json"))
+            with open(self._path(key, ".body.tmp"), "wb") as fp:
+                fp.write(content)
+            os.replace(self._path(key, ".body.tmp"), self._path(key, ".body"))
+
+            self.sizes[key] = len(content)
+            self.size += len(content)
+
+            #Evict least recently used responses but always keep the one just saved
+            while self.size > self.max_size and len(self.sizes) > 1:
+                self._remove(next(iter(self.sizes)))
+
+
+    def _remove(self, key):
+        """Delete a response
+
+        Args:
+            key (string): key of the response
+        """
+        self.size -= self.sizes.pop(key, 0)
+        for extension in (".body", ".json"):
+            try:
+                os.remove(self._path(key, extension))
+            except FileNotFoundError:
+                pass
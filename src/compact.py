@@ -0,0 +1,274 @@
+from array import array
+
+import numpy as np
+import pandas as pd
+from rdflib.store import Store
+
+
+class CompactStore(Store):
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+
+    def __init__(self, configuration=None, identifier=None):
+        """Keep the triples of an RDF graph in memory as columns of term numbers
+
+        Every distinct URI, blank node and literal is numbered once. Triples are three columns of 64-bit numbers
+        that are sorted and deduplicated by (s,p,o) on the first query after triples have been added, with
+        permutations by (p,o,s) and (o,s,p) built on demand. Terms are only looked up by their number when a
+        triple is returned. Use as Graph(store=CompactStore()).
+
+        Args:
+            configuration (str, optional): unused since the store is not persistent. Defaults to None.
+            identifier (URIRef, optional): identifier of the store. Defaults to None.
+        """
+        super().__init__(configuration, identifier)
+        self.identifier = identifier
+
+        #Number of every term and term of every number
+        self.ids = {}
+        self.terms = []
+
+        #Triples added one at a time and blocks of triples added as columns since the last query
+        self.pending = (array("q"), array("q"), array("q"))
+        self.blocks = []
+
+        #Sorted and deduplicated triples and permutations of them into other orders
+        self.columns = (np.empty(0, dtype=np.int64),) * 3
+        self.orders = {}
+
+        self.prefixes = {}
+        self.uris = {}
+
+
+    @classmethod
+    def of_graph(cls, graph):
+        """Find the compact store of a graph or copy its triples to one
+
+        Args:
+            graph (Graph): an RDF graph
+
+        Returns:
+            CompactStore: the triples of the graph
+        """
+        if isinstance(graph.store, cls):
+            return graph.store
+        store = cls()
+        for triple in graph.triples((None, None, None)):
+            store.add(triple, None)
+        return store
+
+
+    def term_id(self, term, create=True):
+        """Find the number of a term
+
+        Args:
+            term (Identifier): a URI, blank node or literal
+            create (bool, optional): number the term if it does not have a number yet. Defaults to True.
+
+        Returns:
+            int: number of the term or None if it does not have a number and create is False
+        """
+        id = self.ids.get(term)
+        if id is None and create:
+            id = self.ids[term] = len(self.terms)
+            self.terms.append(term)
+        return id
+
+
+    def encode(self, terms):
+        """Find the numbers of a column of terms, looking up each distinct object only once
+
+        Args:
+            terms (ndarray): a column of terms. Rows that share a term object are only hashed by their identity.
+
+        Returns:
+            ndarray: number of every term
+        """
+        terms = np.asarray(terms, dtype=object)
+        codes, _ = pd.factorize(np.fromiter(map(id, terms), dtype=np.int64, count=len(terms)))
+        _, first_rows = np.unique(codes, return_index=True)
+        ids = np.fromiter((self.term_id(term) for term in terms[first_rows]), dtype=np.int64, count=len(first_rows))
+        return ids[codes]
+
+
+    def add_columns(self, subjects, predicates, objects):
+        """Add triples given as columns of term numbers
+
+        Args:
+            subjects (ndarray or int): numbers of the subjects or a single number for every triple
+            predicates (ndarray or int): numbers of the predicates or a single number for every triple
+            objects (ndarray or int): numbers of the objects or a single number for every triple
+        """
+        count = max(np.size(subjects), np.size(predicates), np.size(objects))
+        self.blocks.append(tuple(np.broadcast_to(np.asarray(column, dtype=np.int64), count) for column in (subjects, predicates, objects)))
+
+
+    def add(self, triple, context, quoted=False):
+        """Add a triple
+
+        Args:
+            triple ((Identifier, Identifier, Identifier)): subject, predicate and object of the triple
+            context (Graph): graph the triple is added to
+            quoted (bool, optional): unsupported. Defaults to False.
+        """
+        Store.add(self, triple, context, quoted)
+        for column, term in zip(self.pending, triple):
+            column.append(self.term_id(term))
+
+
+    def addN(self, quads):
+        """Add triples from (subject, predicate, object, context) quads
+
+        Args:
+            quads (iterable): quads to add
+        """
+        for subject, predicate, object, context in quads:
+            self.add((subject, predicate, object), context)
+
+
+    def _merge(self):
+        """Sort and deduplicate the triples together with the ones added since the last query"""
+        if len(self.pending[0]):
+            self.blocks.append(tuple(np.frombuffer(column, dtype=np.int64).copy() for column in self.pending))
+            self.pending = (array("q"), array("q"), array("q"))
+        if not self.blocks:
+            return
+
+        subjects, predicates, objects = (np.concatenate([self.columns[i]] + [block[i] for block in self.blocks]) for i in range(3))
+        self.blocks = []
+
+        order = np.lexsort((objects, predicates, subjects))
+        subjects, predicates, objects = subjects[order], predicates[order], objects[order]
+        unique = np.ones(len(subjects), dtype=bool)
+        unique[1:] = (subjects[1:] != subjects[:-1]) | (predicates[1:] != predicates[:-1]) | (objects[1:] != objects[:-1])
+        self.columns = (subjects[unique], predicates[unique], objects[unique])
+        self.orders = {}
+
+
+    def sorted_columns(self):
+        """Find the triples sorted by (s,p,o)
+
+        Returns:
+            (ndarray, ndarray, ndarray): numbers of the subjects, predicates and objects
+        """
+        self._merge()
+        return self.columns
+
+
+    def _order(self, position):
+        """Find the permutation that sorts the triples by the term at a position
+
+        Args:
+            position (int): 0 to sort by (s,p,o), 1 by (p,o,s) or 2 by (o,s,p)
+
+        Returns:
+            (ndarray, ndarray): positions of the triples in that order and the sorted terms at the position
+        """
+        if position not in self.orders:
+            subjects, predicates, objects = self.columns
+            if position == 0:
+                order = np.arange(len(subjects))
+            elif position == 1:
+                order = np.lexsort((subjects, objects, predicates))
+            else:
+                order = np.lexsort((predicates, subjects, objects))
+            self.orders[position] = (order, self.columns[position][order])
+        return self.orders[position]
+
+
+    def _match(self, triple_pattern):
+        """Find the positions of the triples that match a triple pattern
+
+        Args:
+            triple_pattern ((Identifier, Identifier, Identifier)): subject, predicate and object or None for any term
+
+        Returns:
+            ndarray: positions of the matching triples
+        """
+        self._merge()
+        ids = []
+        for term in triple_pattern:
+            id = None if term is None else self.term_id(term, False)
+            if term is not None and id is None:
+                return np.empty(0, dtype=np.int64)
+            ids.append(id)
+
+        #Narrow the triples down to a range of the order of the first bound term, then filter by the others
+        bound = [position for position, id in enumerate(ids) if id is not None]
+        if not bound:
+            return np.arange(len(self.columns[0]))
+        order, keys = self._order(bound[0])
+        positions = order[np.searchsorted(keys, ids[bound[0]], side="left"):np.searchsorted(keys, ids[bound[0]], side="right")]
+        for position in bound[1:]:
+            positions = positions[self.columns[position][positions] == ids[position]]
+        return positions
+
+
+    def triples(self, triple_pattern, context=None):
+        """Find the triples that match a triple pattern
+
+        Args:
+            triple_pattern ((Identifier, Identifier, Identifier)): subject, predicate and object or None for any term
+            context (Graph, optional): unused since the store holds a single graph. Defaults to None.
+
+        Yields:
+            ((Identifier, Identifier, Identifier), iterator): a matching triple and its contexts
+        """
+        positions = self._match(triple_pattern)
+        terms = self.terms
+        subjects, predicates, objects = (column[positions].tolist() for column in self.columns)
+        for subject, predicate, object in zip(subjects, predicates, objects):
+            yield (terms[subject], terms[predicate], terms[object]), iter(())
+
+
+    def remove(self, triple_pattern, context=None):
+        """Remove the triples that match a triple pattern
+
+        Args:
+            triple_pattern ((Identifier, Identifier, Identifier)): subject, predicate and object or None for any term
+            context (Graph, optional): unused since the store holds a single graph. Defaults to None.
+        """
+        positions = self._match(triple_pattern)
+        if len(positions):
+            kept = np.ones(len(self.columns[0]), dtype=bool)
+            kept[positions] = False
+            self.columns = tuple(column[kept] for column in self.columns)
+            self.orders = {}
+
+
+    def __len__(self, context=None):
+        self._merge()
+        return len(self.columns[0])
+
+
+    def contexts(self, triple=None):
+        return iter(())
+
+
+    def bind(self, prefix, namespace, override=True):
+        """Bind a namespace to a prefix
+
+        Args:
+            prefix (string): the prefix
+            namespace (URIRef): the namespace
+            override (bool, optional): replace an existing binding of the prefix or namespace. Defaults to True.
+        """
+        if not override and (prefix in self.prefixes or namespace in self.uris):
+            return
+        self.uris.pop(self.prefixes.pop(prefix, None), None)
+        self.prefixes.pop(self.uris.pop(namespace, None), None)
+        self.prefixes[prefix] = namespace
+        self.uris[namespace] = prefix
+
+
+    def namespace(self, prefix):
+        return self.prefixes.get(prefix)
+
+
+    def prefix(self, namespace):
+        return self.uris.get(namespace)
+
+
+    def namespaces(self):
+        yield from list(self.prefixes.items())
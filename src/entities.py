@@ -0,0 +1,115 @@
+from rdflib.namespace import RDF
+
+
+class EntityRegistry:
+    def __init__(self, namespace):
+        """Intern entities of the RDF graph by their natural key so that each distinct entity is only created once
+
+        Args:
+            namespace (Namespace): base namespace for all resources
+        """
+        self.namespace = namespace
+
+        #Number of instances allocated for each class
+        self.counters = {}
+
+        #Map of natural key to URI for each class
+        self.entities = {}
+
+
+    def next_id(self, class_name, count=1):
+        """Allocate a block of consecutive identifiers for a class
+
+        Args:
+            class_name (string): name of the class such as "Report"
+            count (int, optional): number of identifiers to allocate. Defaults to 1.
+
+        Returns:
+            int: the first identifier of the allocated block
+        """
+        first_id = self.counters.get(class_name, 0)
+        self.counters[class_name] = first_id + count
+        return first_id
+
+
+    def uri(self, class_name, id):
+        """Create the URI of an instance of a class
+
+        Args:
+            class_name (string): name of the class such as "Report"
+            id (int): identifier of the instance
+
+        Returns:
+            URIRef: URI of the instance
+        """
+        return self.namespace[class_name + "#" + str(id)]
+
+
+    def intern(self, class_name, properties):
+        """Find an instance of a class by its natural key or allocate a new one
+
+        Args:
+            class_name (string): name of the class such as "Person"
+            properties (tuple): natural key of the instance as a tuple of (predicate, Literal) pairs
+
+        Returns:
+            (URIRef, boolean): URI of the instance and True if the instance has just been allocated
+        """
+        entities = self.entities.setdefault(class_name, {})
+
+        #Reuse an existing instance
+        entity = entities.get(properties)
+        if entity is not None:
+            return entity, False
+
+        #Allocate a new instance
+        entity = self.uri(class_name, self.next_id(class_name))
+        entities[properties] = entity
+        return entity, True
+
+
+    def insert(self, graph, class_name, properties, id, remember=True):
+        """Add an instance numbered elsewhere, such as by an ExternalDedup, to the graph
+
+        Args:
+            graph (Graph): an RDF graph
+            class_name (string): name of the class such as "Person"
+            properties (tuple): natural key of the instance as a tuple of (predicate, Literal) pairs
+            id (int): identifier of the instance
+            remember (bool, optional): keep the natural key to find the instance again. Defaults to True.
+
+        Returns:
+            URIRef: URI of the instance
+        """
+        entity = self.uri(class_name, id)
+        if remember:
+            self.entities.setdefault(class_name, {})[properties] = entity
+        self.counters[class_name] = max(self.counters.get(class_name, 0), id + 1)
+
+        graph.add((entity, RDF.type, self.namespace[class_name]))
+        for predicate, value in properties:
+            graph.add((entity, predicate, value))
+
+        return entity
+
+
+    def add(self, graph, class_name, properties):
+        """Add an instance of a class to the graph unless an instance with the same natural key already exists
+
+        Args:
+            graph (Graph): an RDF graph
+            class_name (string): name of the class such as "Person"
+            properties (tuple): natural key of the instance as a tuple of (predicate, Literal) pairs
+
+        Returns:
+            URIRef: URI of the instance
+        """
+        entity, is_new = self.intern(class_name, properties)
+
+        #Add the new instance and its properties to the graph
+        if is_new:
+            graph.add((entity, RDF.type, self.namespace[class_name]))
+            for predicate, value in properties:
+                graph.add((entity, predicate, value))
+
+        return entity
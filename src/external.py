@@ -0,0 +1,337 @@
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+
+import numpy as np
+
+from src.literals import quiet
+from src.ntriples import from_ntriples, to_ntriples
+
+
+#Fewest records to keep in memory, and to read from a run at a time while merging, whatever the budget
+MIN_RECORDS = 1 << 12
+MIN_BLOCK = 1 << 8
+
+#Every row of an entity class as its natural key, its report and where the natural key is kept on disk for the first row of a key in a chunk
+ROW = np.dtype([("class", np.int64), ("high", np.int64), ("low", np.int64), ("report", np.int64), ("offset", np.int64), ("length", np.int64)])
+
+#First row of every natural key
+FIRST = np.dtype([("class", np.int64), ("report", np.int64), ("high", np.int64), ("low", np.int64), ("offset", np.int64), ("length", np.int64)])
+
+#Number of every natural key
+NUMBER = np.dtype([("class", np.int64), ("high", np.int64), ("low", np.int64), ("id", np.int64)])
+
+
+def _not_after(records, bound):
+    """Compare records with a bound by their fields in order
+
+    Args:
+        records (ndarray): structured records
+        bound (void): a record of the same type
+
+    Returns:
+        ndarray: True for every record that is not sorted after the bound
+    """
+    after = np.zeros(len(records), dtype=bool)
+    equal = np.ones(len(records), dtype=bool)
+    for name in records.dtype.names:
+        after |= equal & (records[name] > bound[name])
+        equal &= records[name] == bound[name]
+    return ~after
+
+
+class ExternalSorter:
+    def __init__(self, dtype, directory, budget):
+        """Sort more records than fit in memory by spilling sorted runs to disk and merging them a block at a time
+
+        Records are sorted by all of their fields in order.
+
+        Args:
+            dtype (dtype): structured type of the records
+            directory (str): directory to spill runs to
+            budget (int): bytes of records to keep in memory while records are added and while runs are merged,
+                with room for at least MIN_RECORDS records
+        """
+        self.dtype = np.dtype(dtype)
+        self.directory = directory
+        self.capacity = max(budget // self.dtype.itemsize, MIN_RECORDS)
+        self.buffer = []
+        self.buffered = 0
+        self.runs = []
+
+
+    def _sort(self, records):
+        return records[np.lexsort([records[name] for name in reversed(self.dtype.names)])]
+
+
+    def add(self, records):
+        """Add records, spilling them as a sorted run once the memory budget is reached
+
+        Args:
+            records (ndarray): records of the type of the sorter
+        """
+        self.buffer.append(records)
+        self.buffered += len(records)
+        if self.buffered >= self.capacity:
+            self._spill()
+
+
+    def _spill(self):
+        path = os.path.join(self.directory, "run-%s-%05d.npy" % (id(self), len(self.runs)))
+        np.save(path, self._sort(np.concatenate(self.buffer)))
+        self.runs.append(path)
+        self.buffer = []
+        self.buffered = 0
+
+
+    def __iter__(self):
+        """Read the records in order, as many times as needed
+
+        Yields:
+            ndarray: the next block of sorted records
+        """
+        #Records that all fit in memory are sorted once and kept
+        if not self.runs:
+            if len(self.buffer) > 1:
+                self.buffer = [self._sort(np.concatenate(self.buffer))]
+            elif self.buffer:
+                self.buffer = [self._sort(self.buffer[0])]
+            yield from self.buffer
+            return
+        if self.buffer:
+            self._spill()
+
+        #Load a block of every run and output the records that no unread record can come before
+        runs = [np.load(path, mmap_mode="r") for path in self.runs]
+        size = max(self.capacity // (len(runs) + 1), MIN_BLOCK)
+        positions = [0] * len(runs)
+        blocks = [np.empty(0, dtype=self.dtype)] * len(runs)
+        while True:
+            for index, run in enumerate(runs):
+                if not len(blocks[index]) and positions[index] < len(run):
+                    blocks[index] = np.array(run[positions[index]:positions[index] + size])
+                    positions[index] += len(blocks[index])
+            if not any(len(block) for block in blocks):
+                return
+
+            #Unread records of a run are not before the last loaded record of that run
+            bounds = [block[-1] for block, position, run in zip(blocks, positions, runs) if len(block) and position < len(run)]
+            if bounds:
+                bound = self._sort(np.array(bounds, dtype=self.dtype))[0]
+                counts = [int(np.count_nonzero(_not_after(block, bound))) for block in blocks]
+            else:
+                counts = [len(block) for block in blocks]
+
+            yield self._sort(np.concatenate([block[:count] for block, count in zip(blocks, counts)]))
+            blocks = [block[count:] for block, count in zip(blocks, counts)]
+
+
+class _Stream:
+    def __init__(self, blocks):
+        """Take records from blocks a given number at a time
+
+        Args:
+            blocks (iterator): blocks of records
+        """
+        self.blocks = iter(blocks)
+        self.pending = []
+        self.available = 0
+
+
+    def take(self, count):
+        while self.available < count:
+            block = next(self.blocks)
+            self.pending.append(block)
+            self.available += len(block)
+        records = np.concatenate(self.pending) if len(self.pending) != 1 else self.pending[0]
+        self.pending = [records[count:]]
+        self.available -= count
+        return records[:count]
+
+
+def _groups(blocks, names):
+    """Find the rows of sorted blocks that start a group of rows sharing the given fields, across blocks
+
+    Args:
+        blocks (iterator): sorted blocks of records
+        names ([string]): fields of a group
+
+    Yields:
+        (ndarray, ndarray): a block and True for every row that starts a group
+    """
+    previous = None
+    for block in blocks:
+        starts = np.zeros(len(block), dtype=bool)
+        for name in names:
+            shifted = np.empty(len(block), dtype=block.dtype[name])
+            shifted[1:] = block[name][:-1]
+            if previous is not None:
+                shifted[0] = previous[name]
+            starts |= block[name] != shifted
+        if previous is None:
+            starts[0] = True
+        previous = block[-1]
+        yield block, starts
+
+
+class ExternalDedup:
+    def __init__(self, directory, budget=1 << 28):
+        """Deduplicate entities by their natural key on disk, numbering them once every report has been read
+
+        Every row of an entity class is spilled as the fingerprint of its natural key and its report. Once every report
+        has been read the rows are sorted by fingerprint, every natural key is numbered in the order of its first report,
+        which is the order the entities would have been numbered in memory, and the numbers are joined back onto the reports.
+        Natural keys are kept as 128-bit BLAKE2 fingerprints, so two keys are only confused if their fingerprints collide.
+
+        Args:
+            directory (str): directory to keep the spilled rows and natural keys in until the entities are numbered
+            budget (int, optional): bytes of rows to keep in memory. Defaults to 256 MiB.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix="dedup-", dir=directory)
+        self.budget = budget
+
+        #Classes and the predicate that links reports to them
+        self.classes = []
+        self.predicates = []
+
+        #Number of distinct natural keys of every chunk for each class
+        self.keys = {}
+
+        self.rows = ExternalSorter(ROW, self.directory, budget)
+        self.fp = open(os.path.join(self.directory, "keys"), "wb")
+        self.size = 0
+
+
+    def add(self, class_name, predicate, first_report, keys, codes):
+        """Spill the rows of an entity class in a chunk of reports
+
+        Args:
+            class_name (string): name of the class such as "Person"
+            predicate (URIRef): predicate that links the reports to the class
+            first_report (int): number of the first report of the chunk
+            keys ([tuple]): natural keys as tuples of (predicate, Literal) pairs in order of first appearance
+            codes (ndarray): code of the natural key of every row
+        """
+        if class_name not in self.classes:
+            self.classes.append(class_name)
+            self.predicates.append(predicate)
+        self.keys[class_name] = self.keys.get(class_name, 0) + len(keys)
+
+        #Keep the natural keys on disk as a line per (predicate, Literal) pair. Every key of a class has the same predicates
+        prefixes = [to_ntriples(predicate) + " " for predicate, _ in keys[0]] if keys else []
+        texts = ["\n".join(prefix + to_ntriples(value) for prefix, (_, value) in zip(prefixes, key)).encode("utf-8") for key in keys]
+        lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+        offsets = self.size + np.cumsum(lengths) - lengths
+        self.fp.write(b"".join(texts))
+        self.size += int(lengths.sum())
+
+        fingerprints = np.frombuffer(b"".join(hashlib.blake2b(class_name.encode("utf-8") + b"\n" + text, digest_size=16).digest() for text in texts),
+            dtype=np.int64).reshape(-1, 2)
+
+        #A row for every report, with the location of the natural key for the first row of every key
+        rows = np.empty(len(codes), dtype=ROW)
+        rows["class"] = self.classes.index(class_name)
+        rows["high"] = fingerprints[codes, 0]
+        rows["low"] = fingerprints[codes, 1]
+        rows["report"] = first_report + np.arange(len(codes))
+        rows["offset"] = -1
+        rows["length"] = 0
+        _, first_rows = np.unique(codes, return_index=True)
+        rows["offset"][first_rows] = offsets[codes[first_rows]]
+        rows["length"][first_rows] = lengths[codes[first_rows]]
+        self.rows.add(rows)
+
+
+    def _key(self, keys, offset, length, parse):
+        """Read a natural key back
+
+        Args:
+            keys (mmap): natural keys on disk
+            offset (int): position of the key
+            length (int): size of the key
+            parse (function): from_ntriples or a cached version of it
+
+        Returns:
+            tuple: natural key as a tuple of (predicate, Literal) pairs
+        """
+        lines = keys[offset:offset + length].decode("utf-8").split("\n")
+        return tuple((parse(predicate), parse(value)) for predicate, value in (line.split(" ", 1) for line in lines))
+
+
+    def resolve(self):
+        """Number every natural key in the order of its first report and join the numbers back onto the reports
+
+        Yields:
+            (string, ...): ("entity", class, number, natural key) for every entity in order, then
+                ("link", class, predicate, reports, numbers) for blocks of reports
+        """
+        self.fp.close()
+        with open(os.path.join(self.directory, "keys"), "rb") as fp:
+            keys = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+
+        #Find the first row of every natural key and sort them by report
+        first = ExternalSorter(FIRST, self.directory, self.budget // 2)
+        for block, starts in _groups(self.rows, ("class", "high", "low")):
+            records = block[starts]
+            rows = np.empty(len(records), dtype=FIRST)
+            for name in FIRST.names:
+                rows[name] = records[name]
+            first.add(rows)
+
+        #Number natural keys of every class in that order. Predicates and many values are shared by several keys so recent terms are kept
+        numbers = ExternalSorter(NUMBER, self.directory, self.budget // 2)
+        counters = [0] * len(self.classes)
+        parse = lru_cache(maxsize=1 << 16)(from_ntriples)
+        for block in first:
+            ids = np.empty(len(block), dtype=np.int64)
+            for position, (index, offset, length) in enumerate(zip(block["class"].tolist(), block["offset"].tolist(), block["length"].tolist())):
+                ids[position] = counters[index]
+                counters[index] += 1
+                with quiet():
+                    key = self._key(keys, offset, length, parse)
+                yield "entity", self.classes[index], ids[position], key
+
+            rows = np.empty(len(block), dtype=NUMBER)
+            for name in ("class", "high", "low"):
+                rows[name] = block[name]
+            rows["id"] = ids
+            numbers.add(rows)
+
+        #Join the numbers back onto the rows, both sorted by natural key
+        stream = _Stream(numbers)
+        current = None
+        for block, starts in _groups(self.rows, ("class", "high", "low")):
+            ids = stream.take(int(np.count_nonzero(starts)))["id"]
+            groups = np.cumsum(starts) - 1
+            if current is not None:
+                ids = np.concatenate(([current], ids))
+                groups = groups + 1
+            row_ids = ids[groups]
+            current = row_ids[-1]
+            for index, class_name in enumerate(self.classes):
+                rows = block["class"] == index
+                if rows.any():
+                    yield "link", class_name, self.predicates[index], block["report"][rows], row_ids[rows]
+
+        if self.size:
+            keys.close()
+
+
+    def counts(self):
+        """Count the distinct natural keys of every chunk
+
+        Returns:
+            dict: number of distinct natural keys of every chunk summed for each class
+        """
+        return dict(self.keys)
+
+
+    def close(self):
+        """Remove the spilled rows and natural keys"""
+        if not self.fp.closed:
+            self.fp.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,211 @@
+import numpy as np
+import pandas as pd
+
+
+class ReportIndex:
+    def __init__(self, namespace, entities):
+        """Keep a column per predicate of the reports so that reports can be found and counted without scanning the graph
+
+        Columns are filled as chunks of reports are added to the graph and turned into categoricals of strings on the first query.
+
+        Args:
+            namespace (Namespace): base namespace for all resources
+            entities (EntityRegistry): registry of the entities linked to the reports
+        """
+        self.namespace = namespace
+        self.entities = entities
+
+        #Chunks of reports as (class, first report number, {predicate: column})
+        self.chunks = []
+
+        #Table of every report built from the chunks and columns derived from it
+        self.table = None
+
+
+    def __getstate__(self):
+        #The table is rebuilt from the chunks when needed
+        state = self.__dict__.copy()
+        state["table"] = None
+        return state
+
+
+    def add(self, report_class, first_report, predicates, objects):
+        """Add a chunk of reports to the index
+
+        Args:
+            report_class (string): name of the class of the reports such as "CrimeReport"
+            first_report (int): number of the first report of the chunk
+            predicates ([URIRef]): predicates of the reports
+            objects ([ndarray]): a column of objects for every predicate
+        """
+        columns = {self._name(predicate): column for predicate, column in zip(predicates, objects)}
+        self.chunks.append((report_class, first_report, columns))
+        self.table = None
+
+
+    def _name(self, predicate):
+        """Strip the base namespace from a predicate
+
+        Args:
+            predicate (URIRef): a predicate
+
+        Returns:
+            string: name of the predicate such as "hasDate"
+        """
+        return str(predicate)[len(self.namespace):]
+
+
+    def _table(self):
+        """Build the table of every report from the chunks
+
+        Returns:
+            DataFrame: a row per report with the class, the number and a categorical column per predicate
+        """
+        if self.table is not None:
+            return self.table
+
+        names = []
+        for _, _, columns in self.chunks:
+            names.extend(name for name in columns if name not in names)
+
+        #Concatenate the chunks with an empty column for predicates that a class of reports does not have
+        data = {"class": [], "report": []}
+        data.update((name, []) for name in names)
+        for report_class, first_report, columns in self.chunks:
+            count = len(next(iter(columns.values()))) if columns else 0
+            data["class"].append(np.full(count, report_class, dtype=object))
+            data["report"].append(np.arange(first_report, first_report + count))
+            for name in names:
+                data[name].append(columns[name] if name in columns else np.full(count, None, dtype=object))
+
+        table = pd.DataFrame({"report": np.concatenate(data["report"]) if data["report"] else np.empty(0, dtype=int)})
+        for name, arrays in data.items():
+            if name == "report":
+                continue
+            column = np.concatenate(arrays) if arrays else np.empty(0, dtype=object)
+
+            #Compare literals and URIs by their text, converting each distinct term only once
+            codes, uniques = pd.factorize(column)
+            categories, remap = np.unique(np.array([str(value) for value in uniques], dtype=object), return_inverse=True)
+            if len(categories):
+                codes = np.where(codes >= 0, remap[codes], -1)
+            table[name] = pd.Categorical.from_codes(codes, categories)
+
+        self.table = table
+        return table
+
+
+    def column(self, path):
+        """Find or derive a column of the table
+
+        Args:
+            path (string): name of a predicate such as "hasWeapon", a predicate of a linked entity such as
+                "hasLocation/hasAreaName", or "month" for the year and month of hasDate
+
+        Returns:
+            Categorical: the column
+        """
+        table = self._table()
+        if path in table:
+            return table[path]
+
+        #Year and month of the date of the reports
+        if path == "month":
+            column = table["hasDate"].map(lambda date: date[:7])
+
+        #Property of the entity linked to the reports
+        elif "/" in path:
+            predicate, property = path.split("/", 1)
+            uri = str(self.namespace[property])
+            values = {}
+            for entities in self.entities.entities.values():
+                for key, entity in entities.items():
+                    for key_predicate, value in key:
+                        if str(key_predicate) == uri:
+                            values[str(entity)] = str(value)
+            column = table[predicate].map(values)
+
+        else:
+            raise KeyError("Reports have no predicate \"%s\"" % path)
+
+        table[path] = column.astype("category")
+        return table[path]
+
+
+    def report_numbers(self):
+        """Find the number of every report in the order of the columns
+
+        Returns:
+            ndarray: the numbers of the reports
+        """
+        return self._table()["report"].to_numpy()
+
+
+    def _mask(self, report_class=None, start=None, end=None, where=None):
+        """Select reports by class, date range and values
+
+        Args:
+            report_class (string, optional): name of the class of the reports such as "CrimeReport". Defaults to None.
+            start (string, optional): first date as "YYYY-MM-DD". Defaults to None.
+            end (string, optional): date after the last date as "YYYY-MM-DD". Defaults to None.
+            where (dict, optional): value of each column as accepted by column. Defaults to None.
+
+        Returns:
+            ndarray: True for every selected report
+        """
+        table = self._table()
+        mask = np.ones(len(table), dtype=bool)
+        if report_class is not None:
+            mask &= (table["class"] == report_class).to_numpy()
+
+        #Dates are in ISO format so they are compared as text, once per distinct date
+        if start is not None or end is not None:
+            dates = table["hasDate"]
+            categories = np.asarray(dates.cat.categories, dtype=object)
+            selected = np.ones(len(categories), dtype=bool)
+            if start is not None:
+                selected &= categories >= start
+            if end is not None:
+                selected &= categories < end
+            codes = dates.cat.codes.to_numpy()
+            mask &= (codes >= 0) & np.append(selected, False)[codes]
+
+        for path, value in (where or {}).items():
+            mask &= (self.column(path) == str(value)).to_numpy()
+
+        return mask
+
+
+    def reports(self, report_class=None, start=None, end=None, where=None):
+        """Find reports by class, date range and values
+
+        Args:
+            report_class (string, optional): name of the class of the reports such as "CrimeReport". Defaults to None.
+            start (string, optional): first date as "YYYY-MM-DD". Defaults to None.
+            end (string, optional): date after the last date as "YYYY-MM-DD". Defaults to None.
+            where (dict, optional): value of each column such as {"hasLocation/hasAreaName": "Central"}. Defaults to None.
+
+        Returns:
+            [URIRef]: URIs of the reports
+        """
+        numbers = self.report_numbers()[self._mask(report_class, start, end, where)]
+        return [self.namespace["Report#" + str(number)] for number in numbers]
+
+
+    def count(self, by, report_class=None, start=None, end=None, where=None):
+        """Count reports by the values of one or more columns
+
+        Args:
+            by ([string]): columns to group reports by such as ["hasLocation/hasAreaName", "month"]
+            report_class (string, optional): name of the class of the reports such as "CrimeReport". Defaults to None.
+            start (string, optional): first date as "YYYY-MM-DD". Defaults to None.
+            end (string, optional): date after the last date as "YYYY-MM-DD". Defaults to None.
+            where (dict, optional): value of each column such as {"hasLocation/hasAreaName": "Central"}. Defaults to None.
+
+        Returns:
+            Series: number of reports for each group, largest first
+        """
+        mask = self._mask(report_class, start, end, where)
+        columns = pd.DataFrame({path: self.column(path)[mask] for path in by})
+        counts = columns.groupby(list(by), observed=True).size()
+        return counts.sort_values(ascending=False, kind="stable")
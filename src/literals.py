@@ -0,0 +1,144 @@
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from rdflib import Literal
+from rdflib.namespace import XSD
+
+
+#Lexical forms that rdflib can parse for each datatype it converts, everything else is ill-typed
+PATTERNS = {
+    XSD.integer: r"\s*[+-]?\d+\s*",
+    XSD.double: r"\s*(?:[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?|[+-]?INF|[+-]?inf|NaN|nan)\s*",
+    XSD.date: r"-?\d{4,}-\d{2}-\d{2}(?:T[\d:.]*)?",
+    XSD.time: r"\d{2}(?::?\d{2}(?::?\d{2}(?:\.\d+)?)?)?"}
+
+#Number of ill-typed values to keep as examples for each column
+SAMPLES = 10
+
+
+@contextmanager
+def quiet():
+    """Silence the warning and traceback that rdflib logs for every ill-typed literal"""
+    logger = logging.getLogger("rdflib.term")
+    disabled = logger.disabled
+    logger.disabled = True
+    try:
+        yield
+    finally:
+        logger.disabled = disabled
+
+
+class LiteralCache:
+    def __init__(self, max_size=1 << 18):
+        """Convert raw values to typed literals, creating each distinct literal once and remembering the most recent ones
+
+        Values are checked against the lexical forms of their datatype in a batch per column. Ill-typed values such as
+        an empty integer are still converted as rdflib would, but without its warning, and are counted per column instead.
+
+        Args:
+            max_size (int, optional): maximum number of literals to remember. Defaults to 262144.
+        """
+        self.max_size = max_size
+
+        #Literal and whether it is well-typed for each (datatype, raw value)
+        self.literals = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+        #Number of rows with an ill-typed value and examples of such values for each column
+        self.invalid = {}
+        self.samples = {}
+
+
+    def _create(self, values, datatype):
+        """Convert distinct raw values that are not remembered yet
+
+        Args:
+            values (ndarray): distinct raw values
+            datatype (URIRef): datatype of the literals
+
+        Returns:
+            (ndarray, ndarray): a literal for every value and True for every well-typed value
+        """
+        if datatype in PATTERNS:
+            valid = pd.Series(values, dtype=object).astype(str).str.fullmatch(PATTERNS[datatype]).to_numpy(dtype=bool)
+        else:
+            valid = np.ones(len(values), dtype=bool)
+
+        #Values that match the lexical form can still be out of range, such as a time of 25:00, which rdflib leaves without a value
+        literals = np.empty(len(values), dtype=object)
+        with quiet():
+            for position, value in enumerate(values.tolist()):
+                literals[position] = Literal(value, datatype=datatype)
+        if datatype in PATTERNS:
+            valid = valid & np.fromiter((literal.value is not None for literal in literals.tolist()), dtype=bool, count=len(literals))
+        return literals, valid
+
+
+    def convert(self, series, datatype, column=None):
+        """Convert a column to literals
+
+        Args:
+            series (Series): a column of the dataset
+            datatype (URIRef): datatype of the literals
+            column (string, optional): name of the column to count ill-typed values under. Defaults to None.
+
+        Returns:
+            ndarray: a literal for every row of the column
+        """
+        codes, uniques = pd.factorize(series)
+        uniques = np.asarray(uniques, dtype=object)
+        literals = np.empty(len(uniques), dtype=object)
+        valid = np.ones(len(uniques), dtype=bool)
+
+        #Reuse remembered literals
+        missing = []
+        for position, value in enumerate(uniques.tolist()):
+            entry = self.literals.get((datatype, value))
+            if entry is None:
+                missing.append(position)
+                continue
+            self.literals.move_to_end((datatype, value))
+            literals[position], valid[position] = entry
+        self.hits += len(uniques) - len(missing)
+        self.misses += len(missing)
+
+        #Convert the other ones in a batch and remember them, forgetting the least recently used
+        if missing:
+            created, created_valid = self._create(uniques[missing], datatype)
+            literals[missing] = created
+            valid[missing] = created_valid
+            for value, literal, is_valid in zip(uniques[missing].tolist(), created.tolist(), created_valid.tolist()):
+                self.literals[(datatype, value)] = (literal, is_valid)
+            while len(self.literals) > self.max_size:
+                self.literals.popitem(last=False)
+
+        #Count rows with an ill-typed value
+        if column is not None and not valid.all():
+            self.invalid[column] = self.invalid.get(column, 0) + int(np.count_nonzero(~valid[codes]))
+            samples = self.samples.setdefault(column, [])
+            for value in uniques[~valid].tolist():
+                if len(samples) >= SAMPLES:
+                    break
+                if value not in samples:
+                    samples.append(value)
+
+        return literals[codes]
+
+
+    def take_stats(self):
+        """Collect the counters since the last call and reset them
+
+        Returns:
+            dict: hits and misses of the cache, number of rows with an ill-typed value and examples of them for each column
+        """
+        stats = {"hits": self.hits, "misses": self.misses, "invalid": self.invalid, "samples": self.samples}
+        self.hits = 0
+        self.misses = 0
+        self.invalid = {}
+        self.samples = {}
+        return stats
@@ -0,0 +1,132 @@
+import csv
+import os
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pcsv
+
+from src.mapping import used_columns
+
+
+#Bytes of CSV that a thread parses at a time
+BLOCK_SIZE = 1 << 24
+
+#Extensions of dataset files in a directory
+EXTENSIONS = (".csv", ".csv.gz", ".csv.bz2")
+
+
+class LocalReports:
+    def __init__(self, path, mapping, max_data_count=None, block_size=BLOCK_SIZE):
+        """Read reports from a CSV dump on local disk, or from a directory of CSV parts read in order of their names
+
+        Files are memory-mapped, or decompressed as a stream if they end with ".gz" or ".bz2", and split into blocks that are
+        parsed by several threads. Only the columns read by the mapping are converted, into strings that stay in Arrow memory.
+        Columns are matched to the mapping by their position, as for downloaded datasets, so a dump may have either its display
+        names or field names.
+
+        Args:
+            path (str): location of the CSV file or of the directory
+            mapping (dict): mapping of the dataset such as ARREST_REPORTS
+            max_data_count (int, optional): maximum number of reports to read. Defaults to None to read every report.
+            block_size (int, optional): bytes of CSV that a thread parses at a time. Defaults to 16 MiB.
+        """
+        if os.path.isdir(path):
+            self.paths = sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(EXTENSIONS))
+            if not self.paths:
+                raise ValueError("No CSV files in \"%s\"" % path)
+        elif os.path.exists(path):
+            self.paths = [path]
+        else:
+            raise ValueError("No such CSV file or directory \"%s\"" % path)
+        self.max_data_count = max_data_count
+        self.block_size = block_size
+
+        self.columns = mapping["columns"]
+
+        #Columns read by the mapping, report ID first so that every chunk has a column to count its reports by
+        used = used_columns(mapping)
+        self.include = [self.columns[0]] + [column for column in self.columns[1:] if column in used]
+
+
+    def _open(self, path):
+        #Plain files are mapped instead of read
+        if path.lower().endswith(".csv"):
+            return pa.memory_map(path, "r")
+        return pa.input_stream(path)
+
+
+    def _header(self, path):
+        """Read the header of a CSV file
+
+        Args:
+            path (str): location of the CSV file
+
+        Returns:
+            [string]: names of the columns
+        """
+        with self._open(path) as source:
+            line = source.read(min(self.block_size, 1 << 20)).decode("utf-8-sig").splitlines()
+        return next(csv.reader(line[:1]), [])
+
+
+    def _batches(self, path):
+        """Parse a CSV file with several threads
+
+        Args:
+            path (str): location of the CSV file
+
+        Yields:
+            RecordBatch: the next block of reports with the columns named as in the mapping
+        """
+        #Name the columns as in the mapping by their position, and any column beyond the mapping by its position
+        header = self._header(path)
+        names = [self.columns[index] if index < len(self.columns) else "column%s" % index for index in range(len(header))]
+        types = {column: pa.string() for column in self.include}
+
+        #Empty fields are kept as empty strings, and so are the fields of missing columns as for rows that are too short
+        read_options = pcsv.ReadOptions(use_threads=True, block_size=self.block_size, skip_rows=1, column_names=names)
+        convert_options = pcsv.ConvertOptions(column_types=types, include_columns=self.include, include_missing_columns=True,
+            strings_can_be_null=False, quoted_strings_can_be_null=False)
+        missing = [column not in names for column in self.include]
+        with self._open(path) as source:
+            for batch in pcsv.open_csv(source, read_options=read_options, convert_options=convert_options):
+                if any(missing):
+                    batch = pa.RecordBatch.from_arrays([pc.fill_null(array, "") if is_missing else array for array, is_missing in zip(batch.columns, missing)],
+                        names=batch.schema.names)
+                yield batch
+
+
+    def iter_chunks(self, chunk_size):
+        """Read reports a chunk at a time
+
+        Args:
+            chunk_size (int): number of reports per chunk
+
+        Yields:
+            DataFrame: a chunk of reports with the columns read by the mapping
+        """
+        remaining = self.max_data_count
+        pending = []
+        count = 0
+        for path in self.paths:
+            for batch in self._batches(path):
+                if remaining is not None:
+                    if remaining <= 0:
+                        break
+                    batch = batch.slice(0, remaining)
+                    remaining -= batch.num_rows
+                pending.append(batch)
+                count += batch.num_rows
+
+                #Blocks of the file do not line up with chunks
+                if count >= chunk_size:
+                    table = pa.Table.from_batches(pending)
+                    start = 0
+                    while count - start >= chunk_size:
+                        yield table.slice(start, chunk_size).to_pandas()
+                        start += chunk_size
+                    pending = table.slice(start).to_batches()
+                    count -= start
+
+        if count:
+            yield pa.Table.from_batches(pending, schema=pending[0].schema).to_pandas()
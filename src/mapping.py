@@ -0,0 +1,268 @@
+from itertools import zip_longest
+
+import pandas as pd
+from rdflib import Namespace
+from rdflib.namespace import XSD
+
+
+#A mapping describes how the rows of a dataset become reports in the graph, as a dict of
+#   "class": name of the class of the reports such as "ArrestReport"
+#   "columns": names of the columns of the CSV in order
+#   "fields": names of the same columns in the dataset served by Socrata, to select them with $select
+#   "properties": properties of the reports as (column, predicate, datatype)
+#   "entities": entities linked to the reports as (predicate, class, [(column, predicate, datatype)]), an instance per distinct natural key
+
+#Mapping of the arrest reports dataset
+ARREST_REPORTS = {
+    "class": "ArrestReport",
+    "columns": ['ReportID', 'ReportType', 'ArrestDate', 'Time', 'Area',
+        'AreaName', 'ReportDistrict', 'Age', 'SexCode',
+        'DescendentCode', 'ChargeGroupCode', 'ChargeGroupDescription', 'ArrestType',
+        'Charge', 'ChargeDescription', 'DispositionDescription', 'Address',
+        'CrossStreet', 'lat', 'lon', 'location',
+        'BookingDate', 'BookingTime', 'BookingLocation', 'BookingLocationCode'],
+    "fields": ['rpt_id', 'report_type', 'arst_date', 'time', 'area',
+        'area_desc', 'rd', 'age', 'sex_cd',
+        'descent_cd', 'chrg_grp_cd', 'grp_description', 'arst_typ_cd',
+        'charge', 'chrg_desc', 'disp_desc', 'address',
+        'cross_street', 'lat', 'lon', 'location',
+        'bkg_date', 'bkg_time', 'bkg_location', 'bkg_loc_cd'],
+    "properties": [
+        ('ReportID', "hasID", XSD.integer),
+        ('ArrestDate', "hasDate", XSD.date),
+        ('Time', "hasTime", XSD.time),
+        ('ReportType', "hasReporType", XSD.string),
+        ('ArrestType', "hasArrestType", XSD.string),
+        ('DispositionDescription', "hasDispositionDescription", XSD.string)],
+    "entities": [
+        ("hasPerson", "Person", [
+            ('Age', "hasAge", XSD.integer),
+            ('SexCode', "hasSex", XSD.string),
+            ('DescendentCode', "hasDescendent", XSD.string)]),
+        ("hasLocation", "Location", [
+            ('ReportDistrict', "hasReportingDistrictNumber", XSD.integer),
+            ('Area', "hasAreaID", XSD.integer),
+            ('AreaName', "hasAreaName", XSD.string),
+            ('Address', "hasAddress", XSD.string),
+            ('CrossStreet', "hasCrossStreet", XSD.string),
+            ('lat', "hasLatitude", XSD.double),
+            ('lon', "hasLongtitude", XSD.double)]),
+        ("hasBooking", "Booking", [
+            ('BookingDate', "hasBookingDate", XSD.date),
+            ('BookingTime', "hasBookingTime", XSD.time),
+            ('BookingLocation', "hasBookingLocation", XSD.string),
+            ('BookingLocationCode', "hasBookingCode", XSD.integer)]),
+        ("hasCharge", "Charge", [
+            ('ChargeGroupCode', "hasChargeGroupCode", XSD.integer),
+            ('ChargeGroupDescription', "hasChargeGroupDescription", XSD.string),
+            ('Charge', "hasChargeCode", XSD.integer),
+            ('ChargeDescription', "hasChargeDescription", XSD.string)])]}
+
+#Mapping of the crime reports dataset. Predicates and datatypes are kept as they have been published, even where they differ from the arrest reports
+CRIME_REPORTS = {
+    "class": "CrimeReport",
+    "columns": ['ReportID', 'DataReported', 'DateOCC', 'TimeOCC', 'Area',
+        'AreaName', 'ReportDistrict', 'Part-1-2', 'CrimeCommited',
+        'CrimeDescription', 'Mocodes', 'Age', 'SexCode',
+        'DescendentCode', 'PremiseCode', 'PremiseDescription',
+        'WeaponCode', 'WeaponDescription', 'Status',
+        'StatusDescription', 'CrimCommited1', 'CrimCommited2',
+        'CrimCommited3', 'CrimCommited4', 'location',
+        'CrossStreet', 'lat', 'lon'],
+    "fields": ['dr_no', 'date_rptd', 'date_occ', 'time_occ', 'area',
+        'area_name', 'rpt_dist_no', 'part_1_2', 'crm_cd',
+        'crm_cd_desc', 'mocodes', 'vict_age', 'vict_sex',
+        'vict_descent', 'premis_cd', 'premis_desc',
+        'weapon_used_cd', 'weapon_desc', 'status',
+        'status_desc', 'crm_cd_1', 'crm_cd_2',
+        'crm_cd_3', 'crm_cd_4', 'location',
+        'cross_street', 'lat', 'lon'],
+    "properties": [
+        ('ReportID', "hasID", XSD.integer),
+        ('TimeOCC', "hasTime", XSD.time),
+        ('DateOCC', "hasDate", XSD.date),
+        ('DataReported', "hasDateReported", XSD.date),
+        ('Mocodes', "hasMocodes", XSD.string),
+        ('Part-1-2', "hasPart1-2", XSD.integer)],
+    "entities": [
+        ("hasPerson", "Person", [
+            ('Age', "hasAge", XSD.integer),
+            ('SexCode', "hasSex", XSD.string),
+            ('DescendentCode', "hasDescendent", XSD.string)]),
+        ("hasLocation", "Location", [
+            ('ReportDistrict', "hasReportingDisctrictNumber", XSD.integer),
+            ('Area', "hasAreaID", XSD.string),
+            ('AreaName', "hasAreaName", XSD.string),
+            ('location', "hasAddress", XSD.string),
+            ('CrossStreet', "hasCrossStreet", XSD.string),
+            ('lat', "hasLatitude", XSD.double),
+            ('lon', "hasLongitude", XSD.double)]),
+        ("hasPremise", "Premise", [
+            ('PremiseCode', "hasPremiseCode", XSD.integer),
+            ('PremiseDescription', "hasPremiseDescription", XSD.string)]),
+        ("hasWeapon", "Weapon", [
+            ('WeaponCode', "hasWeaponCode", XSD.integer),
+            ('WeaponDescription', "hasWeaponDescription", XSD.string)]),
+        ("hasStatus", "Status", [
+            ('Status', "hasStatusCode", XSD.string),
+            ('StatusDescription', "hasStatusDescription", XSD.string)]),
+        ("hasCrime", "Crime", [
+            ('CrimeCommited', "hasCrimeCommitted", XSD.integer),
+            ('CrimeDescription', "hasCrimeCrimmitedDescription", XSD.string),
+            ('CrimCommited1', "hasCrimeCommited1", XSD.integer),
+            ('CrimCommited2', "hasCrimeCommited2", XSD.integer),
+            ('CrimCommited3', "hasCrimeCommited3", XSD.integer),
+            ('CrimCommited4', "hasCrimeCommited4", XSD.integer)])]}
+
+
+def column_datatypes(mapping):
+    """Find the datatype of the literals of each column
+
+    Args:
+        mapping (dict): mapping of a dataset such as ARREST_REPORTS
+
+    Returns:
+        dict: datatype of each column
+    """
+    datatypes = {column: datatype for column, _, datatype in mapping["properties"]}
+    for _, _, properties in mapping["entities"]:
+        datatypes.update((column, datatype) for column, _, datatype in properties)
+    return datatypes
+
+
+def used_columns(mapping):
+    """Find the columns read by a mapping
+
+    Args:
+        mapping (dict): mapping of a dataset such as ARREST_REPORTS
+
+    Returns:
+        set: names of the columns
+    """
+    used = {column for column, _, _ in mapping["properties"]}
+    for _, _, properties in mapping["entities"]:
+        used.update(column for column, _, _ in properties)
+    return used
+
+
+def project(mapping, entities=None, predicates=None):
+    """Keep only some entity classes and properties of the reports of a mapping
+
+    Args:
+        mapping (dict): mapping of a dataset such as ARREST_REPORTS
+        entities ([string], optional): names of the entity classes to keep such as ["Location", "Weapon"]. Defaults to None to keep every class.
+        predicates ([string], optional): predicates of the properties of the reports to keep such as ["hasDate"]. Defaults to None to keep every property.
+
+    Returns:
+        dict: the projected mapping, with every column of the CSV
+    """
+    projected = dict(mapping)
+    if predicates is not None:
+        projected["properties"] = [(column, predicate, datatype) for column, predicate, datatype in mapping["properties"] if predicate in predicates]
+    if entities is not None:
+        projected["entities"] = [(predicate, class_name, properties) for predicate, class_name, properties in mapping["entities"] if class_name in entities]
+    return projected
+
+
+def narrow(mapping):
+    """Keep only the columns read by a mapping, so that it reads the rows of a dataset downloaded with $select of its fields
+
+    The report ID is always kept first so that every row has a field even when no column is read.
+
+    Args:
+        mapping (dict): mapping of a dataset such as ARREST_REPORTS
+
+    Returns:
+        dict: the mapping with fewer columns
+    """
+    used = used_columns(mapping)
+    positions = [0] + [position for position, column in enumerate(mapping["columns"]) if position > 0 and column in used]
+    narrowed = dict(mapping)
+    narrowed["columns"] = [mapping["columns"][position] for position in positions]
+    narrowed["fields"] = [mapping["fields"][position] for position in positions]
+    return narrowed
+
+
+def _key_function(predicates):
+    """Generate a function that builds natural keys with the given predicates
+
+    Args:
+        predicates ([URIRef]): predicates of the natural key
+
+    Returns:
+        function: takes a literal for every predicate and returns the natural key as a tuple of (predicate, Literal) pairs
+    """
+    arguments = ", ".join("value%d" % position for position in range(len(predicates)))
+    pairs = "".join("(predicate%d, value%d), " % (position, position) for position in range(len(predicates)))
+    constants = {"predicate%d" % position: predicate for position, predicate in enumerate(predicates)}
+    exec("def key(%s):\n    return (%s)\n" % (arguments, pairs), constants)
+    return constants["key"]
+
+
+class RowConverter:
+    def __init__(self, mapping, base_url):
+        """Compile the mapping of a dataset once into what is needed to convert chunks of its rows
+
+        Predicates, positions of the columns and datatypes are resolved here, and natural keys are built by a function
+        generated for the predicates of each entity class. The converter is sent to worker processes as its mapping
+        and compiled again there.
+
+        Args:
+            mapping (dict): mapping of the dataset such as ARREST_REPORTS
+            base_url (string): base namespace for all resources
+        """
+        self.mapping = mapping
+        self.base_url = base_url
+        self.report_class = mapping["class"]
+        namespace = Namespace(base_url)
+
+        #Columns of the properties of the reports as (column, datatype)
+        self.literals = [(column, datatype) for column, _, datatype in mapping["properties"]]
+
+        #Entity classes as (class, [(column, datatype)], function that builds the natural key)
+        self.entities = [(class_name, [(column, datatype) for column, _, datatype in properties], _key_function([namespace[predicate] for _, predicate, _ in properties]))
+            for _, class_name, properties in mapping["entities"]]
+
+        #Predicates of the reports, properties first then entities
+        self.predicates = [namespace[predicate] for _, predicate, _ in mapping["properties"]] + [namespace[predicate] for predicate, _, _ in mapping["entities"]]
+
+        #Columns read by the mapping and their position in the rows of the CSV
+        used = used_columns(mapping)
+        self.positions = [(column, position) for position, column in enumerate(mapping["columns"]) if column in used]
+        self.width = len(mapping["columns"])
+
+
+    def __reduce__(self):
+        return RowConverter, (self.mapping, self.base_url)
+
+
+    def columns(self, rows):
+        """Split a chunk into the columns read by the mapping
+
+        Args:
+            rows ([[string]] or DataFrame): rows of reports without header
+
+        Returns:
+            dict: Series of every column read by the mapping
+        """
+        if isinstance(rows, pd.DataFrame):
+            return {column: rows[column] for column, _ in self.positions}
+
+        #Only the columns that are read are copied, missing fields of short rows are empty as missing values are in the CSV
+        transposed = list(zip_longest(*rows, fillvalue=""))
+        missing = ("",) * len(rows)
+        return {column: pd.Series(transposed[position] if position < len(transposed) else missing, dtype=object) for column, position in self.positions}
+
+
+    def malformed(self, rows):
+        """Count the rows that do not have a field for every column, such as a truncated line of the CSV
+
+        Args:
+            rows ([[string]] or DataFrame): rows of reports without header
+
+        Returns:
+            int: number of rows with missing or extra fields
+        """
+        if isinstance(rows, pd.DataFrame):
+            return 0
+        return sum(len(row) != self.width for row in rows)
@@ -0,0 +1,198 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics:
+    def __init__(self):
+        """Collect counters and the time spent in each stage of a build
+
+        Counters and timers may be updated from several threads at once.
+        """
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.timers = {}
+        self.durations = {}
+        self.extra = {}
+
+
+    def count(self, name, value=1):
+        """Add to a counter
+
+        Args:
+            name (string): name of the counter such as "rows_parsed"
+            value (int, optional): amount to add. Defaults to 1.
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+    def get(self, name):
+        with self.lock:
+            return self.counters.get(name, 0)
+
+
+    def last(self, name):
+        """Find how long the last call of a stage took
+
+        Args:
+            name (string): name of the stage such as "serialize"
+
+        Returns:
+            float: duration in seconds or 0 if the stage has not run
+        """
+        with self.lock:
+            return self.durations.get(name, 0.0)
+
+
+    @contextmanager
+    def timer(self, name):
+        """Add the time spent in a block to a stage
+
+        Args:
+            name (string): name of the stage such as "map"
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self.lock:
+                total, calls = self.timers.get(name, (0.0, 0))
+                self.timers[name] = (total + seconds, calls + 1)
+                self.durations[name] = seconds
+
+
+    @contextmanager
+    def span(self, name, **fields):
+        """Time a stage and log when it starts and ends
+
+        Args:
+            name (string): name of the stage such as "serialize"
+            fields: extra fields to log with the stage
+        """
+        logger.info("%s started", name, extra={"event": name + ".start", "fields": fields})
+        start = time.perf_counter()
+        with self.timer(name):
+            yield
+        seconds = time.perf_counter() - start
+        logger.info("%s finished in %.3fs", name, seconds, extra={"event": name + ".end", "fields": dict(fields, seconds=seconds)})
+
+
+    def snapshot(self):
+        """Copy the current counters and timers
+
+        Returns:
+            dict: counters, seconds and calls of every stage, and extra measurements
+        """
+        with self.lock:
+            return {
+                "elapsed_seconds": time.time() - self.started,
+                "counters": dict(self.counters),
+                "stages": {name: {"seconds": seconds, "calls": calls} for name, (seconds, calls) in self.timers.items()},
+                **self.extra}
+
+
+    def write(self, path):
+        """Write a snapshot to a JSON file
+
+        Args:
+            path (str): location of the metrics file
+        """
+        with open(path, "wt") as fp:
+            json.dump(self.snapshot(), fp, indent=2, default=str)
+
+
+class ProgressReporter:
+    def __init__(self, metrics, interval=10.0):
+        """Periodically log how many rows have been parsed out of the number expected, their rate and the remaining time
+
+        Args:
+            metrics (Metrics): metrics of the build with the "rows_parsed" and "rows_expected" counters
+            interval (float, optional): seconds between reports. Defaults to 10.0.
+        """
+        self.metrics = metrics
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="progress", daemon=True)
+
+
+    def _run(self):
+        start = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            parsed = self.metrics.get("rows_parsed")
+            expected = self.metrics.get("rows_expected")
+            seconds = time.perf_counter() - start
+            rate = parsed / seconds if seconds > 0 else 0.0
+            eta = (expected - parsed) / rate if rate > 0 and expected > parsed else None
+            logger.info("%s/%s rows parsed, %.0f rows/s, ETA %s", parsed, expected or "?", rate, "%.0fs" % eta if eta is not None else "?",
+                extra={"event": "progress", "fields": {"rows_parsed": parsed, "rows_expected": expected, "rows_per_second": rate, "eta_seconds": eta}})
+
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+
+    def __exit__(self, *args):
+        self.stopped.set()
+        self.thread.join()
+
+
+@contextmanager
+def profiled(metrics, profile=None, trace_memory=False):
+    """Optionally profile a block with cProfile and trace its memory allocations with tracemalloc
+
+    Args:
+        metrics (Metrics): metrics to add the peak traced memory and the top allocation sites to
+        profile (str, optional): location to save cProfile statistics to. Defaults to None to disable profiling.
+        trace_memory (bool, optional): trace memory allocations. Defaults to False.
+    """
+    profiler = None
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+    if trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile)
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:10]
+            tracemalloc.stop()
+            with metrics.lock:
+                metrics.extra["tracemalloc"] = {
+                    "peak_bytes": peak,
+                    "top": [{"location": str(statistic.traceback), "bytes": statistic.size, "blocks": statistic.count} for statistic in top]}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        """Format a log record as a line of JSON with the event and fields given by Metrics
+
+        Args:
+            record (LogRecord): the log record
+
+        Returns:
+            string: the record as JSON
+        """
+        entry = {"time": record.created, "level": record.levelname, "logger": record.name, "message": record.getMessage()}
+        if hasattr(record, "event"):
+            entry["event"] = record.event
+        if hasattr(record, "fields"):
+            entry.update(record.fields)
+        return json.dumps(entry, default=str)
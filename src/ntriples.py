@@ -0,0 +1,134 @@
+import gzip
+import logging
+import re
+import sys
+
+from rdflib import BNode, Literal, URIRef
+
+
+logger = logging.getLogger(__name__)
+
+
+def _quote(lexical):
+    """Escape a lexical form for N-Triples
+
+    Args:
+        lexical (string): lexical form of a literal
+
+    Returns:
+        string: the escaped lexical form
+    """
+    return lexical.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def to_ntriples(term):
+    """Format an RDF term as N-Triples
+
+    Args:
+        term (Identifier): a URI, blank node or literal
+
+    Returns:
+        string: the term formatted as N-Triples
+    """
+    if isinstance(term, Literal):
+        if term.language:
+            return "\"%s\"@%s" % (_quote(str(term)), term.language)
+        if term.datatype:
+            return "\"%s\"^^<%s>" % (_quote(str(term)), term.datatype)
+        return "\"%s\"" % _quote(str(term))
+    return term.n3()
+
+
+def _unquote(lexical):
+    """Undo the escaping of a lexical form by _quote
+
+    Args:
+        lexical (string): escaped lexical form of a literal
+
+    Returns:
+        string: the lexical form
+    """
+    return re.sub(r"\\(.)", lambda match: {"n": "\n", "r": "\r"}.get(match.group(1), match.group(1)), lexical)
+
+
+def from_ntriples(text):
+    """Parse an RDF term formatted by to_ntriples
+
+    Args:
+        text (string): the term formatted as N-Triples
+
+    Returns:
+        Identifier: the URI, blank node or literal
+    """
+    if text.startswith("<"):
+        return URIRef(text[1:-1])
+    if text.startswith("_:"):
+        return BNode(text[2:])
+
+    #Language tags and datatypes never contain quotes so the lexical form ends at the last one
+    end = text.rfind("\"")
+    lexical, suffix = _unquote(text[1:end]), text[end + 1:]
+    if suffix.startswith("@"):
+        return Literal(lexical, lang=suffix[1:])
+    if suffix.startswith("^^"):
+        return Literal(lexical, datatype=URIRef(suffix[3:-1]))
+    return Literal(lexical)
+
+
+class NTriplesWriter:
+    def __init__(self, destination, compress=None, context=None, append=False):
+        """Write triples to an N-Triples file as soon as they are added instead of keeping them in memory
+
+        Args:
+            destination (str): location and filename to write triples to. Use "-" to write to the standard output
+            compress (bool, optional): compress the file with gzip. Defaults to None to compress filenames ending with ".gz"
+            context (URIRef, optional): name of the graph to write N-Quads instead of N-Triples. Defaults to None.
+            append (bool, optional): add triples to the end of an existing file instead of overwriting it. Defaults to False.
+        """
+        self.destination = destination
+        self.context = " " + context.n3() if context is not None else ""
+        self.count = 0
+
+        logger.info("Writing triples to \"%s\"...", destination)
+
+        #Open the destination. Appending to a gzip file adds a new member which gzip readers concatenate
+        if compress is None:
+            compress = destination.endswith(".gz")
+        mode = "at" if append else "wt"
+        if destination == "-":
+            self.fp = sys.stdout
+        elif compress:
+            self.fp = gzip.open(destination, mode, encoding="utf-8")
+        else:
+            self.fp = open(destination, mode, encoding="utf-8")
+
+
+    def add(self, triple):
+        """Write a triple to the destination
+
+        Args:
+            triple ((Identifier, Identifier, Identifier)): subject, predicate and object of the triple
+        """
+        subject, predicate, object = triple
+        self.fp.write("%s %s %s%s .\n" % (subject.n3(), predicate.n3(), to_ntriples(object), self.context))
+        self.count += 1
+
+
+    def __len__(self):
+        return self.count
+
+
+    def close(self):
+        """Flush all triples and close the destination"""
+        if self.fp is sys.stdout:
+            self.fp.flush()
+        else:
+            self.fp.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
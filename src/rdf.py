@@ -1,105 +1,460 @@
 import csv
-from rdflib import Graph, Namespace, Literal
-from rdflib.namespace import RDFS, RDF, XSD
+import logging
+import os
+import pickle
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from itertools import chain, islice, repeat
+from rdflib import Graph, Namespace
+from rdflib.namespace import RDFS, RDF
+import numpy as np
 import pandas as pd
 
-from contextlib import closing
-import requests
+from src import mapping
+from src.compact import CompactStore
+from src.entities import EntityRegistry
+from src.index import ReportIndex
+from src.literals import SAMPLES, LiteralCache, quiet
+from src.mapping import RowConverter, column_datatypes, narrow, project, used_columns
+from src.metrics import Metrics, ProgressReporter, profiled
+from src.ntriples import NTriplesWriter
+
+
+logger = logging.getLogger(__name__)
+
+#Literals converted by this process, shared by every chunk
+_literals = LiteralCache()
+
+#Version of the state saved for the next run
+STATE_VERSION = 2
+
+
 
 class RDF_Graph:
-    def __init__(self, base_url = "https://data.lacity.org/",  arrest_reports_url ="https://data.lacity.org/resource/amvf-fr72", crime_reports_url = "https://data.lacity.org/resource/2nrs-mtv8", max_data_count = 1000 ):
+    #Mappings of the datasets to the graph
+    ARREST_REPORTS = mapping.ARREST_REPORTS
+    CRIME_REPORTS = mapping.CRIME_REPORTS
+
+    #Datasets that can be built by the class of their reports
+    DATASETS = {"ArrestReport": ARREST_REPORTS, "CrimeReport": CRIME_REPORTS}
+
+    #Filenames of the staged datasets
+    STAGED_FILENAMES = {"ArrestReport": "arrest_reports.parquet", "CrimeReport": "crime_reports.parquet"}
+
+    def __init__(self, base_url = "https://data.lacity.org/",  arrest_reports_url ="https://data.lacity.org/resource/amvf-fr72", crime_reports_url = "https://data.lacity.org/resource/2nrs-mtv8", max_data_count = 1000, page_size = 50000, workers = 4, timeout = 60.0, checkpoint_dir = None, streaming = False, chunk_size = 10000, output = None, compress = None, build_workers = 1, state = None, store = None, cache_dir = None, offline = False, staging_dir = None, index = None, arrest_reports = None, crime_reports = None, metrics_file = None, profile = None, trace_memory = False, progress_interval = None, shared_entities = False, dedup_dir = None, dedup_memory = 1 << 28, datasets = None, entity_classes = None, predicates = None, lazy = False):
         # Initalize URL
         self.base_url=base_url
         self.arrest_reports_url = arrest_reports_url
         self.crime_reports_url = crime_reports_url
 
-        # Initialize rdf graph and namespace
-        self.graph = Graph()
+        # Initialize counters and timers of every stage of the build, written to a JSON file if a metrics file is given
+        self.metrics = Metrics()
+        self.metrics_file = metrics_file
+
+        # Initialize namespace and registry of entities to deduplicate instances of each class
         self.namespace = Namespace(base_url)
+        self.entities = EntityRegistry(self.namespace)
+
+        # Initialize index of the reports to find and count them without scanning the graph. The index keeps a column of every predicate
+        # of every report and the natural key of every entity in memory, so by default reports are not indexed when triples are written out.
+        # Builds that deduplicate entities on disk or continue from a state, which only holds the entities and not the reports of the
+        # previous runs, never index them
+        if index is None:
+            index = output is None and dedup_dir is None and state is None
+        elif index and state is not None:
+            raise ValueError("Reports of previous runs are not kept in the state, so a build with a state can not index the reports")
+        elif index and dedup_dir is not None:
+            raise ValueError("Entities deduplicated on disk are not kept in memory, so a build with dedup_dir can not index the reports")
+        self.index = ReportIndex(self.namespace, self.entities) if index else None
+        self.spatial = None
+
+        # Publication time and row identifier of the last report downloaded from each dataset
+        self.watermarks = {}
+
+        # Choose the datasets to build and the entity classes and properties of their reports. Columns that are not needed are
+        # never converted, and not even downloaded when only some entity classes or properties are chosen
+        self.mappings = self._project(datasets, entity_classes, predicates)
+        self.selective = entity_classes is not None or predicates is not None
+
+        # Rows of the datasets kept for CSV and Parquet exports, and mapping of the columns of those rows
+        self.dataset_rows = {}
+        self.layouts = dict(self.mappings)
+
+        # Continue numbering and deduplication from the state saved by a previous run and only fetch the reports published since.
+        # Reports that are not downloaded have no publication time to continue from
+        if state is not None and (arrest_reports is not None or crime_reports is not None):
+            raise ValueError("A build from given or local reports can not be continued from a state, since they have no publication time")
+        self.state = state
+
+        # Write triples straight to an N-Triples file if an output is given, otherwise keep them in memory or in a persistent store
+        self.output = output
+        self.compress = compress
+        self.store = store
+        self._graph = None
+
+        #Downloader of datasets, created when a build downloads them, caching responses on disk if a cache directory is given
+        self.downloader_options = {"page_size": page_size, "workers": workers, "timeout": timeout, "checkpoint_dir": checkpoint_dir, "cache_dir": cache_dir, "offline": offline}
+        self._downloader = None
+
+        #Number of rows to convert to triples at a time and number of processes to convert them with
+        self.chunk_size = chunk_size
+        self.build_workers = build_workers
+
+        #Convert the datasets in the same worker processes, one after the other, instead of a pool of processes per dataset
+        self.shared_entities = shared_entities
+
+        #Deduplicate entities on disk and number them once every report has been read, keeping the memory of deduplication under a budget
+        if dedup_dir is not None and state is not None:
+            raise ValueError("Entities deduplicated on disk can not be continued from a state")
+        self.dedup_dir = dedup_dir
+        self.dedup_memory = dedup_memory
+        self.dedup = None
+
+        #Build the graph now, or when it is first needed if the build is lazy
+        self.build_options = (max_data_count, streaming, staging_dir, arrest_reports, crime_reports)
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.progress_interval = progress_interval
+        self.built = False
+        if not lazy:
+            self.build()
+
+
+    @property
+    def graph(self):
+        """Graph of the reports, built when it is first needed"""
+        if self._graph is None:
+            self.build()
+        return self._graph
+
+
+    @graph.setter
+    def graph(self, graph):
+        self._graph = graph
+
+
+    @property
+    def downloader(self):
+        """Downloader of the datasets, created when it is first needed since builds from local or staged datasets do not download anything"""
+        if self._downloader is None:
+            from src.socrata import SocrataDownloader
+            self._downloader = SocrataDownloader(metrics=self.metrics, **self.downloader_options)
+        return self._downloader
+
+
+    @property
+    def arrest_reports_dataset(self):
+        """Rows of the arrest reports, header first, or None if they have not been kept"""
+        return self.dataset_rows.get("ArrestReport")
+
+
+    @property
+    def crime_reports_dataset(self):
+        """Rows of the crime reports, header first, or None if they have not been kept"""
+        return self.dataset_rows.get("CrimeReport")
+
+
+    def _project(self, datasets, entity_classes, predicates):
+        """Choose the datasets to build and the entity classes and properties of their reports
 
-        #Get datasets
-        self.arrest_reports_dataset = self._get_dataset(self.arrest_reports_url, max_data_count)
-        self.crime_reports_dataset = self._get_dataset(self.crime_reports_url, max_data_count)
+        Args:
+            datasets ([string]): classes of the reports of the datasets such as ["CrimeReport"] or None for every dataset
+            entity_classes ([string]): entity classes to link the reports to such as ["Location", "Weapon"] or None for every class
+            predicates ([string]): properties of the reports such as ["hasDate", "hasTime"] or None for every property
 
-        #Add arrest reports dataset to the graph
-        self.graph = self._add_arrest_reports_to_graph(self.arrest_reports_dataset, self.graph,self.namespace)
+        Returns:
+            dict: mapping of every chosen dataset by the class of its reports
+        """
+        names = list(self.DATASETS) if datasets is None else list(datasets)
+        unknown = [name for name in names if name not in self.DATASETS]
+        if unknown:
+            raise ValueError("Unknown datasets: %s" % ", ".join(unknown))
 
-        #Add crime reports dataset to the graph
-        self.graph = self._add_crime_reports_to_graph(self.crime_reports_dataset, self.graph,self.namespace)
+        #Classes and properties must exist in at least one of the chosen datasets
+        chosen = [self.DATASETS[name] for name in names]
+        for kind, selected, known in (("entity classes", entity_classes, {class_name for chosen_mapping in chosen for _, class_name, _ in chosen_mapping["entities"]}),
+                ("predicates", predicates, {predicate for chosen_mapping in chosen for _, predicate, _ in chosen_mapping["properties"]})):
+            unknown = sorted(set(selected or ()) - known)
+            if unknown:
+                raise ValueError("Unknown %s of the chosen datasets: %s" % (kind, ", ".join(unknown)))
 
-  
-    def _validate_url(self, url):
-        """Validate the URL to ensure that it is accessible. 
+        return {name: project(dataset, entity_classes, predicates) for name, dataset in self.DATASETS.items() if name in names}
 
-        Args:
-            url (string): the URL to check
+
+    def build(self):
+        """Get the datasets and build the graph, unless it has already been built
+
+        A graph created with lazy=True is built by the first call to this method, export, query or spatial_index, or by the first
+        use of graph. A build that fails is not run again.
 
         Returns:
-            boolean: True if the URL can be accessed else False
+            RDF_Graph: this graph
         """
+        if self.built:
+            return self
+        self.built = True
+
+        # Continue numbering and deduplication from the state saved by a previous run and only fetch the reports published since
+        incremental = self.state is not None and os.path.exists(self.state)
+        if incremental:
+            self._load_state(self.state)
+
+        # Initialize rdf graph. Write triples straight to an N-Triples file if an output is given, after the triples of the previous run.
+        # Otherwise keep them in memory as numbers of terms or in a persistent store given as a SQLite filename or any rdflib Store
+        if self.output:
+            self.graph = NTriplesWriter(self.output, compress=self.compress, append=incremental)
+        elif self.store is not None:
+            from src.store import SQLiteStore
+            self.graph = Graph(store=SQLiteStore(self.store) if isinstance(self.store, str) else self.store)
+        else:
+            self.graph = Graph(store=CompactStore())
 
-        #Print out the process
-        print("INFO: Validating \"%s\"..." % url)
+        if self.dedup_dir is not None:
+            from src.external import ExternalDedup
+            self.dedup = ExternalDedup(self.dedup_dir, self.dedup_memory)
 
-        #Make a GET request
-        request = requests.get(url)
+        #Build the graph, timing every stage and reporting progress while it runs
+        with ExitStack() as stack:
+            stack.enter_context(profiled(self.metrics, self.profile, self.trace_memory))
+            if self.progress_interval:
+                stack.enter_context(ProgressReporter(self.metrics, self.progress_interval))
+            with self.metrics.span("build"):
+                self._build(stack, *self.build_options)
+        self._write_metrics()
+        return self
+
+
+    def _build(self, stack, max_data_count, streaming, staging_dir, arrest_reports, crime_reports):
+        """Get the chosen datasets and add them to the graph
+
+        Args:
+            stack (ExitStack): stack that stops the downloads in the background when the build ends, however it ends
+            max_data_count (int): maximum number of data to download for a given dataset
+            streaming (bool): add rows to the graph as they are downloaded instead of keeping the datasets
+            staging_dir (str): directory to stage the datasets in or None
+            arrest_reports ([[string]] or str): rows of the arrest reports, header first, a CSV file or a directory of CSV files, or None to download them
+            crime_reports ([[string]] or str): rows of the crime reports, header first, a CSV file or a directory of CSV files, or None to download them
+        """
+        reports = {"ArrestReport": arrest_reports, "CrimeReport": crime_reports}
+        urls = {"ArrestReport": self.arrest_reports_url, "CrimeReport": self.crime_reports_url}
+
+        #Read datasets dumped to local disk with several threads instead of downloading them. pyarrow is only needed to read local files
+        local = any(isinstance(reports[name], str) for name in self.mappings)
+        if local:
+            from src.local import LocalReports
+            for name, dataset in self.mappings.items():
+                if isinstance(reports[name], str):
+                    reports[name] = LocalReports(reports[name], dataset, max_data_count)
+
+        #Read datasets staged by a previous run with every column the mappings read and enough reports instead of downloading them.
+        #A build with a state skips them since they lack the publication time of their reports, and staging only the reports published since would overwrite them
+        given = any(reports[name] is not None for name in self.mappings)
+        if staging_dir is not None and self.state is not None:
+            logger.info("Staged datasets are neither read nor written by a build with a state")
+            staging_dir = None
+        staged = not given and staging_dir is not None and all(self._is_staged(staging_dir, dataset, max_data_count) for dataset in self.mappings.values())
+
+        #Use datasets given as rows, header first, instead of downloading them
+        if given:
+            missing = [name for name in self.mappings if reports[name] is None]
+            if missing:
+                raise ValueError("Reports of every chosen dataset must be given, %s are missing" % " and ".join(missing))
+            for name in self.mappings:
+                if isinstance(reports[name], list):
+                    self.dataset_rows[name] = reports[name]
+                    self.metrics.count("rows_expected", max(len(reports[name]) - 1, 0))
+
+        elif staged:
+            #pyarrow is only needed to stage datasets
+            from src.staging import StagedReports
+            for name in self.mappings:
+                reports[name] = StagedReports(os.path.join(staging_dir, self.STAGED_FILENAMES[name]), max_data_count)
+                self.metrics.count("rows_expected", len(reports[name]))
 
-        #Check respond from the Get request
-        if request.status_code == 200:
-            return True
         else:
-            print("Error: URL returns "+request.status_code)
-            return False
+            #Only download the columns that the mappings read when some entity classes or properties are left out
+            if self.selective:
+                self.layouts = {name: narrow(dataset) for name, dataset in self.mappings.items()}
+            select = {name: ",".join(layout["fields"]) if self.selective else None for name, layout in self.layouts.items()}
+
+            #Datasets after the first are downloaded in the background while the first one is downloaded and added to the graph
+            for position, name in reversed(list(enumerate(self.mappings))):
+                where = self._where(name)
+
+                #Stream rows straight from the responses into the graph without keeping the datasets, a few pages ahead
+                if streaming:
+                    if position:
+                        reports[name] = stack.enter_context(self.downloader.prefetch(urls[name], max_data_count, where, select=select[name]))
+                    else:
+                        reports[name] = self.downloader.iter_rows(urls[name], max_data_count, where, select[name])
+
+                #Get datasets and keep them as they are added to the graph
+                elif position:
+                    self.dataset_rows[name] = []
+                    reports[name] = _keep(stack.enter_context(self.downloader.prefetch(urls[name], max_data_count, where, select=select[name])), self.dataset_rows[name])
+                else:
+                    self.dataset_rows[name] = reports[name] = self._get_dataset(urls[name], max_data_count, where, select[name])
+
+        #Stage datasets as they are added to the graph, unless they are already on local disk
+        if staging_dir is not None and not staged and not local:
+            from src.staging import stage_rows
+            os.makedirs(staging_dir, exist_ok=True)
+            for name, layout in self.layouts.items():
+                reports[name] = stage_rows(reports[name], os.path.join(staging_dir, self.STAGED_FILENAMES[name]),
+                    layout["columns"], column_datatypes(self.DATASETS[name]), max_data_count=None if given else max_data_count)
+
+        #Add the datasets to the graph at the same time, or one after the other
+        datasets = [(reports[name], self.layouts[name]) for name in self.mappings]
+        if self.shared_entities:
+            self.graph = self._add_datasets_to_graph(datasets, self.graph, self.namespace)
+        else:
+            for dataset_reports, layout in datasets:
+                self.graph = self._add_reports_to_graph(dataset_reports, layout, self.graph, self.namespace)
+
+        #Continue the next run after the last report downloaded from every dataset
+        if not given and not staged:
+            for name in self.mappings:
+                if urls[name] in self.downloader.watermarks:
+                    self.watermarks[name] = self.downloader.watermarks[urls[name]]
+
+        #Number the entities deduplicated on disk and link the reports to them
+        if self.dedup is not None:
+            try:
+                self._resolve_entities(self.graph, self.namespace)
+            finally:
+                self.dedup.close()
+
+        #Flush the N-Triples file and save the spatial index next to it, or commit the persistent store
+        if self.output:
+            self.graph.close()
+            if self.index is not None and self.output != "-":
+                self._save_spatial_index(self.output)
+        elif self.store is not None:
+            self.graph.commit()
+
+        #Save the state for the next run once every triple has been written
+        if self.state:
+            self._save_state(self.state)
 
-    
-    def _get_dataset(self, url, max_data_count):
+  
+    def _get_dataset(self, url, max_data_count, where=None, select=None):
         """Downalod dataset and decode them as csv
 
         Args:
             url (string): URL to download dataset
             max_data_count (int): maximum number of data to download for a given dataset
+            where (string, optional): SoQL condition that the data must match. Defaults to None.
+            select (string, optional): fields to download separated by commas. Defaults to None for every field.
 
         Returns:
             [string]: List of data formatted as CSV
         """
 
-        #Check if url is available
-        isAvailable = self._validate_url(url)
+        #Download the dataset page by page
+        return self.downloader.download(url, max_data_count, where, select)
+
+
+    def _is_staged(self, staging_dir, dataset, max_data_count):
+        """Check that a dataset has been staged with every column that its mapping reads and enough reports
+
+        Args:
+            staging_dir (str): directory the datasets are staged in
+            dataset (dict): mapping of the dataset such as ARREST_REPORTS
+            max_data_count (int): maximum number of reports to read or None for every report
+
+        Returns:
+            bool: True if the staged dataset can be read instead of downloading it
+        """
+        path = os.path.join(staging_dir, self.STAGED_FILENAMES[dataset["class"]])
+        if not os.path.exists(path):
+            return False
+
+        #pyarrow is only needed to stage datasets
+        from src.staging import staged_columns, staged_rows
+        if not used_columns(dataset) <= set(staged_columns(path)):
+            return False
+
+        #A dataset downloaded with a limit has every report if it has fewer than the limit, otherwise it must have as many as are read now
+        rows, limit = staged_rows(path)
+        return limit is None or rows < limit or (max_data_count is not None and rows >= max_data_count)
+
+
+    def _load_state(self, path):
+        """Load entities, counters and watermarks saved by a previous run
+
+        Args:
+            path (string): location of the state file
+        """
+        logger.info("Resuming from \"%s\"...", path)
+
+        with open(path, "rb") as fp:
+            state = pickle.load(fp)
 
-        #If url is available
-        if isAvailable:
+        #States saved before watermarks were publication times hold the highest report ID, which does not follow publication
+        if state.get("version") != STATE_VERSION:
+            raise ValueError("State \"%s\" has been saved by an older version and can not be continued from, build again without it" % path)
+        self.entities.counters = state["counters"]
+        self.entities.entities = state["entities"]
+        self.watermarks = state["watermarks"]
 
-            #Check how many data are available
-            available_data_count = int(requests.get(url+".json?$query=SELECT COUNT(*)").json()[0]["COUNT"])
 
-            #Determine how many data should be download based on available_data_count and max_data_count
-            nums_data_to_download = max_data_count if (max_data_count< available_data_count) else available_data_count
+    def _save_state(self, path):
+        """Save entities, counters and watermarks so that the next run only adds the reports published since
 
-            #Print out the process
-            print("INFO: Downloading %s data from \"%s\"..." %(nums_data_to_download, url))
+        Args:
+            path (string): location of the state file
+        """
+        logger.info("Saving state to \"%s\"...", path)
+
+        #Save the state atomically so that a killed run never leaves a partial state behind. The index is not saved since it grows with every report
+        state = {"version": STATE_VERSION, "counters": self.entities.counters, "entities": self.entities.entities, "watermarks": self.watermarks}
+        with open(path + ".tmp", "wb") as fp:
+            pickle.dump(state, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+
+    def _where(self, report_class):
+        """Create a SoQL condition that only matches reports downloaded after the ones added by a previous run
 
-            #Start downloading data and convert them to csv
-            with closing(requests.get(url+".csv?$limit="+str(nums_data_to_download),stream=True)) as response:
-                decoded_dataset = [line.decode('utf-8') for line in response.iter_lines()]
-                dataset = csv.reader(decoded_dataset, delimiter=',')
-                return list(dataset) 
+        Reports are downloaded in the order they were published, then by row identifier since many reports are published at the
+        same time, so the condition matches the reports after the last one of the previous run in that order. Report IDs can not
+        be used since they start with the year and area of the report rather than following publication.
+
+        Args:
+            report_class (string): name of the class of the reports such as "CrimeReport"
+
+        Returns:
+            string: the condition or None to match every report
+        """
+        if report_class not in self.watermarks:
+            return None
+        published, row_id = self.watermarks[report_class]
+        return "(:created_at > '%s' OR (:created_at = '%s' AND :id > '%s'))" % (published, published, row_id)
                 
   
-    def export(self, destination=None, format="pretty-xml"):
+    def export(self, destination=None, format="pretty-xml", workers=None, shards=False):
         """Export RDF graph as a string or a file. Set destination to export as a file
 
         Args:
             destination (str, optional): specific location and filename to save the RDF export file to. Default to None.
-            format (str, optional): format of the export RDF graph. Defaults to "xml". Can also be CSV
+            format (str, optional): format of the export RDF graph. Defaults to "xml". Can also be CSV or Parquet to export the datasets,
+                or "snapshot" for a binary snapshot to open with SnapshotStore
+            workers (int, optional): number of processes to serialize chunks of subjects with, for "nt", "turtle" and "jsonld-lines". Defaults to None.
+            shards (bool, optional): write every chunk of subjects to its own file instead of a single file. Defaults to False.
 
         Returns:
             [output]: The seralized result of RDF graph
         """
-         #Print out the process
-        print("INFO: Exporting RDF graph formatted as %s..." % format)
+        self.build()
+        logger.info("Exporting RDF graph formatted as %s...", format)
+
+        #If export format is set as CSV or Parquet
+        if format=="csv" or format=="parquet":
 
-        #If export format is set as CSV
-        if format=="csv":
+            #Datasets are only kept when they are downloaded without streaming or given as rows
+            if any(name not in self.dataset_rows for name in self.mappings):
+                raise ValueError("%s export needs the rows of the datasets, which are not kept when they are streamed or read from staged datasets or local files" % format.upper())
 
             #Export to a file
             if destination:
@@ -108,461 +463,500 @@ class RDF_Graph:
                 paths= destination.split('.')
                 filename = paths[len(paths)-2]
 
-                #Create filepath for arrest reports csv
-                paths[len(paths)-2]=filename+"_arrest_reports"
-                arrest_reports_filepath = '.'.join(paths)
-
-                #Create filepath for crime report csv
-                paths[len(paths)-2]=filename+"_crime_reports"
-                crime_reports_filepath = '.'.join(paths)
-
-                #Write arrest reports csv CSV to file
-                with open(arrest_reports_filepath, "wt") as fp:
-                    writer = csv.writer(fp,delimiter=",")
-                    writer.writerows(self.arrest_reports_dataset)
-
-                #Write crime report csv to file
-                with open(crime_reports_filepath, "wt") as fp:
-                    writer = csv.writer(fp,delimiter=",")
-                    writer.writerows(self.crime_reports_dataset)
+                #Write every chosen dataset to its own file, such as "graph_arrest_reports.csv"
+                for name in self.mappings:
+                    paths[len(paths)-2]=filename+"_"+os.path.splitext(self.STAGED_FILENAMES[name])[0]
+                    filepath = '.'.join(paths)
+
+                    #Write datasets to typed columnar files
+                    if format=="parquet":
+                        from src.staging import write_rows
+                        write_rows(self.dataset_rows[name], filepath, self.layouts[name]["columns"], column_datatypes(self.DATASETS[name]))
+
+                    #Write dataset to CSV file
+                    else:
+                        with open(filepath, "wt") as fp:
+                            writer = csv.writer(fp,delimiter=",")
+                            writer.writerows(self.dataset_rows[name])
             
             #Export as variables
-            else:
+            elif format=="csv":
                 return self.arrest_reports_dataset, self.crime_reports_dataset
+            else:
+                raise ValueError("Parquet export needs a destination")
         #If export as other formats
         else:
+            #Triples have already been written out while the graph was built
+            if self.output:
+                raise ValueError("RDF graph has already been written to \"%s\" while it was built" % self.output)
+
+            #Export to a binary snapshot that SnapshotStore opens without parsing it
+            if format == "snapshot":
+                if not destination:
+                    raise ValueError("Snapshot export needs a destination")
+                from src.snapshot import write_snapshot
+                with self.metrics.span("serialize", format=format):
+                    size = write_snapshot(self.graph, destination)
+                self._record_throughput(format, size)
+                if self.index is not None:
+                    self._save_spatial_index(destination)
+                self._write_metrics()
+
+            #Export to a file a chunk of subjects at a time
+            elif workers is not None or shards or format == "jsonld-lines":
+                if not destination:
+                    raise ValueError("Chunked export needs a destination")
+                from src.serialize import serialize, shard_path
+                with self.metrics.span("serialize", format=format, workers=workers or 1):
+                    files = serialize(self.graph, destination, format=format, workers=workers or 1, shards=shards)
+                paths = [shard_path(destination, index) for index in range(files)] if shards else [destination]
+                self._record_throughput(format, sum(os.path.getsize(path) for path in paths))
+                if self.index is not None:
+                    self._save_spatial_index(destination)
+                self._write_metrics()
+
             #Export to a file
-            if destination:
-                self.graph.serialize(destination=destination,format=format)
+            elif destination:
+                with self.metrics.span("serialize", format=format):
+                    self.graph.serialize(destination=destination,format=format)
+                self._record_throughput(format, os.path.getsize(destination))
+                if self.index is not None:
+                    self._save_spatial_index(destination)
+                self._write_metrics()
             #Export as variables
             else:
-                return self.graph.serialize(format=format).decode("utf-8")
+                with self.metrics.span("serialize", format=format):
+                    result = self.graph.serialize(format=format)
+                self._record_throughput(format, len(result))
+                self._write_metrics()
+                return result.decode("utf-8")
+
+
+    def _record_throughput(self, format, size):
+        """Record the size and speed of the last serialization
+
+        Args:
+            format (str): format of the serialized graph
+            size (int): size of the serialized graph in bytes
+        """
+        seconds = self.metrics.last("serialize")
+        triples = len(self.graph)
+        self.metrics.count("bytes_serialized", size)
+        self.metrics.extra.setdefault("serialize", {})[format] = {"seconds": seconds, "bytes": size, "triples": triples,
+            "triples_per_second": triples / seconds if seconds > 0 else None, "bytes_per_second": size / seconds if seconds > 0 else None}
+
+
+    def _write_metrics(self):
+        """Write the counters and timers of the build to the metrics file if one is given"""
+        if self.metrics_file:
+            self.metrics.write(self.metrics_file)
 
     
-    def _add_arrest_reports_to_graph(self, arrest_reports, graph, namespace):
-        """Add arrest reports dataset to the RDF graph
+    def query(self, query):
+        """Run a SPARQL query against the RDF graph
 
         Args:
-            arrest_reports_dataset (string): a CSV contains arrest reports with well-formatted data
+            query (string): a SPARQL query
+
+        Returns:
+            Result: the result of the query
+        """
+        #Triples have already been written out while the graph was built
+        self.build()
+        if self.output:
+            raise ValueError("RDF graph has been written to \"%s\" and can not be queried, use the index instead" % self.output)
+
+        return self.graph.query(query, initNs={"": self.namespace})
+
+
+    def spatial_index(self, cell_size=0.01):
+        """Index the reports by the latitude and longitude of their location
+
+        Args:
+            cell_size (float, optional): width and height of a cell of the grid in degrees. Defaults to 0.01.
+
+        Returns:
+            SpatialIndex: index to find reports within a bounding box or nearest to a point
+        """
+        self.build()
+        if self.index is None:
+            raise ValueError("Reports have not been indexed, build the graph with index=True")
+        if not self._has_locations():
+            raise ValueError("Reports have not been linked to locations")
+
+        if self.spatial is None or self.spatial.cell_size != cell_size:
+            from src.spatial import SpatialIndex
+            self.spatial = SpatialIndex.from_index(self.namespace, self.index, cell_size)
+        return self.spatial
+
+
+    def _has_locations(self):
+        """Check that the reports are linked to locations
+
+        Returns:
+            bool: True if Location is one of the entity classes that have been chosen
+        """
+        return any(class_name == "Location" for dataset in self.mappings.values() for _, class_name, _ in dataset["entities"])
+
+
+    def _save_spatial_index(self, destination):
+        """Save the spatial index next to an exported graph
+
+        Args:
+            destination (str): location of the exported graph
+        """
+        #Graphs built without locations have nothing to index
+        if not self._has_locations():
+            return
+
+        logger.info("Saving spatial index to \"%s.spatial.npz\"...", destination)
+
+        self.spatial_index().save(destination + ".spatial.npz")
+
+
+    def _add_reports_to_graph(self, reports, mapping, graph, namespace):
+        """Convert reports to triples a chunk at a time, in parallel if build_workers is above 1, and add them to the RDF graph in order
+
+        Args:
+            reports ([[string]]): rows of a CSV contains reports, header first
+            mapping (dict): mapping of the dataset to the graph such as ARREST_REPORTS
             graph (Graph): an RDF graph
             namespace (string): base namespace for all resources
 
         Returns:
-            [Graph]: an RDF graph contains data from the arrest report dataset
+            [Graph]: an RDF graph contains data from the reports
         """
+        logger.info("Add %s dataset to graph...", mapping["class"])
+
+        #Compile the mapping and split reports into chunks
+        converter = RowConverter(mapping, str(namespace))
+        report_class = converter.report_class
+        chunks = self._split_into_chunks(reports)
+
+        #Convert chunks in this process
+        if self.build_workers <= 1:
+            for chunk in chunks:
+                with self.metrics.timer("map"):
+                    mapped = _map_chunk(chunk, converter)
+                self._add_chunk_to_graph(mapped, report_class, graph, namespace)
+            return graph
+
+        #Convert chunks in worker processes but add them to the graph in their original order.
+        #Ill-typed literals are parsed again, with a warning, as they are unpickled by the executor
+        with ProcessPoolExecutor(max_workers=self.build_workers) as executor, quiet():
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(_map_chunk, chunk, converter))
+
+                #Keep a bounded number of chunks in flight
+                if len(pending) >= 2 * self.build_workers:
+                    self._add_chunk_to_graph(self._wait_for_chunk(pending.popleft()), report_class, graph, namespace)
+
+            while pending:
+                self._add_chunk_to_graph(self._wait_for_chunk(pending.popleft()), report_class, graph, namespace)
 
-        #Print out the process
-        print("INFO: Add arrest reports dataset to graph...")
-     
-        #Looping through everyone row of arrest reports
-        for i in range(1, len(arrest_reports)): 
-
-            #Determine how many instances of Report already exist in the graph
-            number_report = len(list(graph.subject_objects(predicate=namespace["hasID"])))
-
-            #Add a new instances of ArrestReport class and fill its properties that it inherent from Report class 
-            graph.add((namespace["Report#" + str(number_report)], RDF.type, namespace["ArrestReport"]))
-            graph.add((namespace["Report#" + str(number_report)], namespace["hasID"], Literal(arrest_reports[i][0], datatype=XSD.integer)))
-            graph.add((namespace["Report#" + str(number_report)], namespace["hasDate"], Literal(arrest_reports[i][2], datatype=XSD.date)))
-            graph.add((namespace["Report#" + str(number_report)], namespace["hasTime"], Literal(arrest_reports[i][3], datatype=XSD.time)))
-            graph.add((namespace["Report#" + str(number_report)], namespace["hasReporType"], Literal(arrest_reports[i][1], datatype=XSD.string)))
-            graph.add((namespace["Report#" + str(number_report)], namespace["hasArrestType"], Literal(arrest_reports[i][12], datatype=XSD.string)))
-            graph.add((namespace["Report#" + str(number_report)], namespace["hasDispositionDescription"], Literal(arrest_reports[i][15], datatype=XSD.string)))
-
-            #Add an instance of Person class
-            #Check if an instance of Person class already exist in the graph
-            people_age = set(graph.subjects(predicate = namespace["hasAge"], object=Literal(arrest_reports[i][7], datatype=XSD.integer)))
-            people_sex = set(graph.subjects(predicate = namespace["hasSex"], object=Literal(arrest_reports[i][8], datatype=XSD.string)))
-            people_decendent = set(graph.subjects(predicate = namespace["hasDescendent"], object=Literal(arrest_reports[i][9], datatype=XSD.string)))
-            person = list(people_age & people_sex & people_decendent)
-
-            # Return the number of instances of Person class
-            number_person = len(list(graph.subject_objects(predicate=namespace["hasAge"])))
-
-            #Create a new instance of Person class            
-            if(len(person) == 0): 
-                # add to Person
-                graph.add((namespace["Person#" + str(number_person)], RDF.type, namespace["Person"]))
-                graph.add((namespace["Person#" + str(number_person)], namespace["hasAge"], Literal(arrest_reports[i][7], datatype=XSD.integer)))
-                graph.add((namespace["Person#" + str(number_person)], namespace["hasSex"], Literal(arrest_reports[i][8], datatype=XSD.string)))
-                graph.add((namespace["Person#" + str(number_person)], namespace["hasDescendent"], Literal(arrest_reports[i][9], datatype=XSD.string)))
-                person = namespace["Person#" + str(number_person)]
-            
-            #Reuse an existing instance of Person class
-            else: 
-                person = person[0]
-            
-            #Add an instance of Location class
-            #Check if an instance of Location class already exist in the graph
-            location_reporting_dist = set(graph.subjects(predicate = namespace["hasReportingDistrictNumber"], object=Literal(arrest_reports[i][6], datatype=XSD.integer)))
-            location_areaID = set(graph.subjects(predicate = namespace["hasAreaID"], object=Literal(arrest_reports[i][4], datatype=XSD.integer)))
-            location_area_name = set(graph.subjects(predicate = namespace["hasAreaName"], object=Literal(arrest_reports[i][5], datatype=XSD.string)))
-            location_address = set(graph.subjects(predicate = namespace["hasAddress"], object=Literal(arrest_reports[i][16], datatype=XSD.string)))
-            location_cross_street = set(graph.subjects(predicate = namespace["hasCrossStreet"], object=Literal(arrest_reports[i][17], datatype=XSD.string)))
-            location_lat = set(graph.subjects(predicate = namespace["hasLatitude"], object=Literal(arrest_reports[i][18], datatype=XSD.double)))
-            location_lon = set(graph.subjects(predicate = namespace["hasLongtitude"], object=Literal(arrest_reports[i][19], datatype=XSD.double)))
-            location = list(location_reporting_dist & location_areaID & location_area_name & location_address & location_cross_street & location_lat & location_lon)
-            
-            #Return the number of instances of Location class
-            number_location = len(list(graph.subject_objects(predicate=namespace["hasAreaID"])))
-
-            #Create a new instance of Location class
-            if(len(location) == 0): 
-                # no location
-                graph.add((namespace["Location#" + str(number_location)], RDF.type, namespace["Location"]))
-                graph.add((namespace["Location#" + str(number_location)], namespace["hasReportingDistrictNumber"], Literal(arrest_reports[i][6], datatype=XSD.integer)))
-                graph.add((namespace["Location#" + str(number_location)], namespace["hasAreaID"], Literal(arrest_reports[i][4], datatype=XSD.integer)))
-                graph.add((namespace["Location#" + str(number_location)], namespace["hasAreaName"], Literal(arrest_reports[i][5], datatype=XSD.string)))
-                graph.add((namespace["Location#" + str(number_location)], namespace["hasAddress"], Literal(arrest_reports[i][16], datatype=XSD.string)))
-                graph.add((namespace["Location#" + str(number_location)], namespace["hasCrossStreet"], Literal(arrest_reports[i][17], datatype=XSD.string)))
-                graph.add((namespace["Location#" + str(number_location)], namespace["hasLatitude"], Literal(arrest_reports[i][18], datatype=XSD.double)))
-                graph.add((namespace["Location#" + str(number_location)], namespace["hasLongtitude"], Literal(arrest_reports[i][19], datatype=XSD.double)))
-                location = namespace["Location#" + str(number_location)]
-            
-            #Reuse an exisiting instance of Location class
-            else: 
-                location = location[0]            
-
-            #Add an instance of Booking class
-            #Check if an instance of Booking class already exist in the graph
-            booking_date = set(graph.subjects(predicate = namespace["hasBookingDate"], object=Literal(arrest_reports[i][21], datatype=XSD.date)))
-            booking_time = set(graph.subjects(predicate = namespace["hasBookingTime"], object=Literal(arrest_reports[i][22], datatype=XSD.time)))
-            booking_location = set(graph.subjects(predicate = namespace["hasBookingLocation"], object=Literal(arrest_reports[i][23], datatype=XSD.string)))
-            booking_code = set(graph.subjects(predicate = namespace["hasBookingCode"], object=Literal(arrest_reports[i][24], datatype=XSD.integer)))
-            booking = list(booking_date & booking_time & booking_location & booking_code)
-
-            #Return the number of instances of Location class
-            number_booking = len(list(graph.subject_objects(predicate=namespace["hasBookingCode"])))
-
-            #Create a new instance of Booking class
-            if(len(booking) == 0): 
-                graph.add((namespace["Booking#" + str(number_booking)], RDF.type, namespace["Booking"]))
-                graph.add((namespace["Booking#" + str(number_booking)], namespace["hasBookingDate"], Literal(arrest_reports[i][21], datatype=XSD.date)))
-                graph.add((namespace["Booking#" + str(number_booking)], namespace["hasBookingTime"], Literal(arrest_reports[i][22], datatype=XSD.time)))
-                graph.add((namespace["Booking#" + str(number_booking)], namespace["hasBookingLocation"], Literal(arrest_reports[i][23], datatype=XSD.string)))
-                graph.add((namespace["Booking#" + str(number_booking)], namespace["hasBookingCode"], Literal(arrest_reports[i][24], datatype=XSD.integer)))
-                booking = namespace["Booking#" + str(number_booking)]
-            
-            #Reuse an existing instance of Booking class
-            else: 
-                booking = booking[0]
-            
-            #Add an instance of Charge class
-            #Check if an instance of Charge class already exist in the graph
-            charge_group_code = set(graph.subjects(predicate = namespace["hasChargeGroupCode"], object=Literal(arrest_reports[i][10], datatype=XSD.integer)))
-            charge_group_description = set(graph.subjects(predicate = namespace["hasChargeGroupDescription"], object=Literal(arrest_reports[i][11], datatype=XSD.string)))
-            charge_code = set(graph.subjects(predicate = namespace["hasChargeCode"], object=Literal(arrest_reports[i][13], datatype=XSD.string)))
-            charge_description = set(graph.subjects(predicate = namespace["hasChargeDescription"], object=Literal(arrest_reports[i][14], datatype=XSD.string)))
-            charge = list(charge_group_code & charge_group_description & charge_code & charge_description)
-
-            #Return the number of instances of Location class
-            number_charge = len(list(graph.subject_objects(predicate=namespace["hasChargeCode"])))
-            
-            #Create a new instance of Charge class
-            if(len(charge) == 0): 
-                graph.add((namespace["Charge#" + str(number_charge)], RDF.type, namespace["Charge"]))
-                graph.add((namespace["Charge#" +str(number_charge)], namespace["hasChargeGroupCode"], Literal(arrest_reports[i][10], datatype=XSD.integer)))
-                graph.add((namespace["Charge#" +str(number_charge)], namespace["hasChargeGroupDescription"], Literal(arrest_reports[i][11], datatype=XSD.string)))
-                graph.add((namespace["Charge#" +str(number_charge)], namespace["hasChargeCode"], Literal(arrest_reports[i][13], datatype=XSD.integer)))
-                graph.add((namespace["Charge#" +str(number_charge)], namespace["hasChargeDescription"], Literal(arrest_reports[i][14], datatype=XSD.string)))
-                charge = namespace["Charge#" + str(number_charge)]
-            
-            #Reuse an existing instance of Charge class
-            else: 
-                charge = charge[0]
-
-            #Add to report
-            graph.add((namespace["Report#" + str(number_report)], namespace["hasPerson"], person))
-            graph.add((namespace["Report#" + str(number_report)], namespace["hasLocation"], location))
-            graph.add((namespace["Report#" + str(number_report)], namespace["hasBooking"], booking))
-            graph.add((namespace["Report#" + str(number_report)], namespace["hasCharge"], charge))
-       
         return graph
 
 
-    def _add_crime_reports_to_graph(self, crime_reports, graph, namespace):
-        """Add crime reports dataset to the RDF graph
+    def _add_datasets_to_graph(self, datasets, graph, namespace):
+        """Convert the reports of several datasets in the same worker processes, one dataset after the other, and add them to the RDF graph
+
+        Workers start on the chunks of the next dataset while the last chunks of a dataset are added to the graph, instead of
+        a pool of processes being started and drained for every dataset. Entities are numbered as chunks are added to the
+        graph in order, so URIs are the same as when the datasets are added one after the other.
 
         Args:
-            crime_reports_dataset (string): a CSV contains crime reports with well-formatted datapoints
+            datasets ([([[string]], dict)]): reports and mapping to the graph of every dataset
             graph (Graph): an RDF graph
             namespace (string): base namespace for all resources
 
         Returns:
-            [Graph]: an RDF graph contains data from the crime report dataset
+            [Graph]: an RDF graph contains data from the reports
         """
-        #Print out the process
-        print("INFO: Add crime reports dataset to graph...")
-
-        #Define new columns 
-        colNames = ['ReportID', 'DataReported', 'DateOCC', 'TimeOCC', 'Area',
-            'AreaName', 'ReportDistrict', 'Part-1-2', 'CrimeCommited',
-            'CrimeDescription', 'Mocodes', 'Age', 'SexCode',
-            'DescendentCode', 'PremiseCode', 'PremiseDescription',
-            'WeaponCode', 'WeaponDescription', 'Status',
-            'StatusDescription', 'CrimCommited1', 'CrimCommited2',
-            'CrimCommited3', 'CrimCommited4', 'location',
-            'CrossStreet', 'lat', 'lon']
-
-        #Convert csv to panda dataframe
-        df = pd.DataFrame (crime_reports[1:], columns=colNames)
-
-        #Determine the number of instances of Report class
-        starting_report_num = len(list(graph.subject_objects(predicate=namespace["hasID"])))
-
-        #ID
-        dr_no_list = df['ReportID']
-        for index, value in dr_no_list.items():
-            graph.add((namespace["Report#" + str(index+starting_report_num)], RDF.type, namespace["CrimeReport"]))
-            graph.add((namespace["Report#" + str(index+starting_report_num)], namespace["hasID"], Literal(value, datatype=XSD.integer)))
-
-        
-        # Person
-        age_list = df['Age']
-        sex_list = df['SexCode']
-        descendent_list = df['DescendentCode']
-
-        for i in range(0,len(age_list)):
-
-            #Check if an instance of Person class already exist in the graph
-            people_age = set(graph.subjects(predicate = namespace["hasAge"], object=Literal(age_list[i], datatype=XSD.integer)))
-            people_sex = set(graph.subjects(predicate = namespace["hasSex"], object=Literal(sex_list[i], datatype=XSD.string)))
-            people_decendent = set(graph.subjects(predicate = namespace["hasDescendent"], object=Literal(descendent_list[i], datatype=XSD.string)))
-           
-            #Give all the triples with age, sex, and decendent
-            person = list(people_age & people_sex & people_decendent)
-            
-            #Return the number of instances of Person class
-            number_person = len(list(graph.subject_objects(predicate=namespace["hasAge"])))
-            
-            #Create a new instance of Person class
-            if(len(person) == 0): 
-                graph.add((namespace["Person#" + str(number_person)], RDF.type, namespace["Person"]))
-                graph.add((namespace["Person#" + str(number_person)], namespace["hasAge"], Literal(age_list[i], datatype=XSD.integer)))
-                graph.add((namespace["Person#" + str(number_person)], namespace["hasSex"], Literal(sex_list[i], datatype=XSD.string)))
-                graph.add((namespace["Person#" + str(number_person)], namespace["hasDescendent"], Literal(descendent_list[i], datatype=XSD.string)))
-                person = namespace["Person#" + str(number_person)]
-            
-            #Reuse an existing instance of Person
-            else: 
-                person = person[0];
-
-            graph.add((namespace["Report#" + str(i + starting_report_num)], namespace["hasPerson"], person));
-
-        
-        # Time Occured
-        time_list = df['TimeOCC']
-
-        for index, value in time_list.items():
-            graph.add((namespace["Report#" + str(index + starting_report_num)], namespace["hasTime"], Literal(value, datatype=XSD.time)))
-        
-        
-        # Date Occured
-        date_list = df['DateOCC']
-
-        for index, value in date_list.items():
-            graph.add((namespace["Report#" + str(index + starting_report_num)], namespace["hasDate"], Literal(value, datatype=XSD.date)))
-
-        
-        # Location
-        reportDist = df['ReportDistrict']
-        areaList = df['Area']
-        areaNameList = df['AreaName']
-        locationList = df['location']
-        crossStreetList = df['CrossStreet']
-        latList = df['lat']
-        lonList = df['lon']
-
-        for i in range(0,len(reportDist)):
-
-            #Check if an instance of Location class already exist in the graph
-            reportingDisct = set(graph.subjects(predicate = namespace["hasReportingDisctrictNumber"], object=Literal(reportDist[i], datatype=XSD.integer)))
-            areaID = set(graph.subjects(predicate = namespace["hasAreaID"], object=Literal(areaList[i], datatype=XSD.string)))
-            areName = set(graph.subjects(predicate = namespace["hasAreaName"], object=Literal(areaNameList[i], datatype=XSD.string)))
-            addy = set(graph.subjects(predicate = namespace["hasAddress"], object=Literal(locationList[i], datatype=XSD.string)))
-            crossStreet = set(graph.subjects(predicate = namespace["hasCrossStreet"], object=Literal(crossStreetList[i], datatype=XSD.string)))
-            lati = set(graph.subjects(predicate = namespace["hasLatitude"], object=Literal(latList[i], datatype=XSD.double)))
-            longi = set(graph.subjects(predicate = namespace["hasLongitude"], object=Literal(lonList[i], datatype=XSD.double)))
-
-            #Give all the triples with reporting disct, area id, area name, address, cross street, latitude, and longtitude
-            loctions = list(reportingDisct & areaID & areName & addy & crossStreet & lati & longi)
-            
-            #Return the number of instances of Location class
-            number_location = len(list(graph.subject_objects(predicate=namespace["hasAreaID"])))
-            
-            #Create a new instance of Location class
-            if(len(loctions) == 0): 
-                # add to Location
-                graph.add((namespace["Location#" + str(number_location)], RDF.type, namespace["Location"]))
-                graph.add((namespace["Location#" + str(number_location)], namespace["hasReportingDisctrictNumber"], Literal(reportDist[i], datatype=XSD.integer)))
-                graph.add((namespace["Location#" + str(number_location)], namespace["hasAreaID"], Literal(areaList[i], datatype=XSD.string)))
-                graph.add((namespace["Location#" + str(number_location)], namespace["hasAreaName"], Literal(areaNameList[i], datatype=XSD.string)))
-                graph.add((namespace["Location#" + str(number_location)], namespace["hasAddress"], Literal(locationList[i], datatype=XSD.string)))
-                graph.add((namespace["Location#" + str(number_location)], namespace["hasCrossStreet"], Literal(crossStreetList[i], datatype=XSD.string)))
-                graph.add((namespace["Location#" + str(number_location)], namespace["hasLatitude"], Literal(latList[i], datatype=XSD.double)))
-                graph.add((namespace["Location#" + str(number_location)], namespace["hasLongitude"], Literal(lonList[i], datatype=XSD.double)))
-                loctions = namespace["Location#" + str(number_location)]
-            
-            #Reuse an existing instance of Location class
-            else: 
-                loctions = loctions[0];
-            
-            graph.add((namespace["Report#" + str(i + starting_report_num)], namespace["hasLocation"], loctions));
+        logger.info("Add %s datasets to graph...", " and ".join(mapping["class"] for _, mapping in datasets))
+
+        #Chunks of every dataset in order with the compiled mapping of their dataset
+        converters = [RowConverter(mapping, str(namespace)) for _, mapping in datasets]
+        chunks = chain.from_iterable(zip(self._split_into_chunks(reports), repeat(converter)) for (reports, _), converter in zip(datasets, converters))
+
+        #Convert chunks in this process
+        if self.build_workers <= 1:
+            for chunk, converter in chunks:
+                with self.metrics.timer("map"):
+                    mapped = _map_chunk(chunk, converter)
+                self._add_chunk_to_graph(mapped, converter.report_class, graph, namespace)
+            return graph
+
+        #Convert chunks in worker processes but add them to the graph in their original order
+        with ProcessPoolExecutor(max_workers=self.build_workers) as executor, quiet():
+            pending = deque()
+            for chunk, converter in chunks:
+                pending.append((executor.submit(_map_chunk, chunk, converter), converter.report_class))
+
+                #Keep a bounded number of chunks in flight
+                if len(pending) >= 2 * self.build_workers:
+                    future, report_class = pending.popleft()
+                    self._add_chunk_to_graph(self._wait_for_chunk(future), report_class, graph, namespace)
+
+            while pending:
+                future, report_class = pending.popleft()
+                self._add_chunk_to_graph(self._wait_for_chunk(future), report_class, graph, namespace)
 
-        
-        # Date Reported
-        date_reported = df['DataReported']
+        return graph
 
-        for index, value in date_reported.items():
-            graph.add((namespace["Report#" + str(index + starting_report_num)], namespace["hasDateReported"], Literal(value, datatype=XSD.date)))
 
-        
-        # Date Reported
-        mocodesList = df['Mocodes']
+    def _wait_for_chunk(self, future):
+        """Wait for a worker process to convert a chunk. Only the time spent waiting is counted since the workers convert chunks while the graph is built
 
-        for index, value in mocodesList.items():
-            graph.add((namespace["Report#" + str(index + starting_report_num)], namespace["hasMocodes"], Literal(value, datatype=XSD.string)))
+        Args:
+            future (Future): a chunk submitted to _map_chunk
 
-       
-        # Part 1-2
-        part_1_2 = df['Part-1-2']
+        Returns:
+            (int, [URIRef], [ndarray], [(string, [tuple], ndarray)], dict): the converted chunk
+        """
+        with self.metrics.timer("map_wait"):
+            return future.result()
 
-        for index, value in part_1_2.items():
-            graph.add((namespace["Report#" + str(index + starting_report_num)], namespace["hasPart1-2"], Literal(value, datatype=XSD.integer)))
 
-        
-        # Premise
-        premiseCodeList = df['PremiseCode']
-        premiseDescriptionList = df['PremiseDescription']
+    def _split_into_chunks(self, reports):
+        """Skip the header and split reports into chunks
 
-        for i in range(0,len(premiseCodeList)):
+        Args:
+            reports ([[string]] or StagedReports): rows of a CSV contains reports, header first, or staged reports
 
-            #Check if an instance of Premise class already exist in the graph
-            premiseCode = set(graph.subjects(predicate = namespace["hasPremiseCode"], object=Literal(premiseCodeList[i], datatype=XSD.integer)))
-            premiseDesc = set(graph.subjects(predicate = namespace["hasPremiseDescription"], object=Literal(premiseDescriptionList[i], datatype=XSD.string)))
+        Yields:
+            [[string]] or DataFrame: up to chunk_size reports
+        """
+        #Staged reports are already read a chunk at a time
+        if hasattr(reports, "iter_chunks"):
+            chunks = reports.iter_chunks(self.chunk_size)
+        else:
+            reports = iter(reports)
+            next(reports, None)
+            chunks = iter(lambda: list(islice(reports, self.chunk_size)), [])
 
-            #Give all the triples with premise code and premise description
-            premises = list(premiseDesc & premiseCode)
-            
-            #Return the number of instances of Premise class
-            number_premise = len(list(graph.subject_objects(predicate=namespace["hasPremiseCode"])))
-            
-            #Create a new instance of Premise class
-            if(len(premises) == 0): 
-                # add to Location
-                graph.add((namespace["Premise#" + str(number_premise)], RDF.type, namespace["Premise"]))
-                graph.add((namespace["Premise#" + str(number_premise)], namespace["hasPremiseCode"], Literal(premiseCodeList[i], datatype=XSD.integer)))
-                graph.add((namespace["Premise#" + str(number_premise)], namespace["hasPremiseDescription"], Literal(premiseDescriptionList[i], datatype=XSD.string)))
-                premise = namespace["Premise#" + str(number_premise)]
-            
-            #Reuse an existing instance of Premise class
-            else: 
-                premise = premises[0]
+        for chunk in chunks:
+            #Empty rows such as blank lines of a CSV have no report
+            if isinstance(chunk, list) and not all(chunk):
+                rows = len(chunk)
+                chunk = [row for row in chunk if row]
+                self.metrics.count("empty_rows", rows - len(chunk))
+                if not chunk:
+                    continue
+            self.metrics.count("rows_parsed", len(chunk))
+            yield chunk
 
-            graph.add((namespace["Report#" + str(i + starting_report_num)], namespace["hasPremise"], premise))
 
-        # Weapon
-        weaponUsedList = df['WeaponCode']
-        weaponDescriptionList = df['WeaponDescription']
+    def _record_stats(self, report_class, stats):
+        """Count the literals converted for a chunk and warn about columns with ill-typed values and rows with missing fields the first time they are seen
 
-        for i in range(0,len(weaponUsedList)):
+        Args:
+            report_class (string): name of the class of the reports such as "CrimeReport"
+            stats (dict): statistics of the conversion of the literals of the chunk from LiteralCache.take_stats and number of malformed rows
+        """
+        if stats["malformed"]:
+            if not self.metrics.get("malformed_rows." + report_class):
+                logger.warning("%s dataset has rows with missing or extra fields, missing fields are read as empty", report_class)
+            self.metrics.count("malformed_rows." + report_class, stats["malformed"])
 
-            #Create a new instance of Weapon class
-            weaponCode = set(graph.subjects(predicate = namespace["hasWeaponCode"], object=Literal(weaponUsedList[i], datatype=XSD.integer)))
-            weaponDesc = set(graph.subjects(predicate = namespace["hasWeaponDescription"], object=Literal(weaponDescriptionList[i], datatype=XSD.string)))
+        self.metrics.count("literal_cache_hits", stats["hits"])
+        self.metrics.count("literal_cache_misses", stats["misses"])
+        for column, count in stats["invalid"].items():
+            name = "%s.%s" % (report_class, column)
+            if not self.metrics.get("invalid_literals." + name):
+                logger.warning("Column %s has values that are not valid for its datatype such as %s", name, ", ".join(repr(value) for value in stats["samples"][column][:3]))
+            self.metrics.count("invalid_literals." + name, count)
 
-            #Give all the triples with weapon cdoe and weapon description
-            weapons = list(weaponDesc & weaponCode)
+            samples = self.metrics.extra.setdefault("invalid_literal_samples", {}).setdefault(name, [])
+            samples.extend(value for value in stats["samples"][column] if value not in samples and len(samples) < SAMPLES)
 
-            #Create a new instance of Weapon class
-            number_weapon = len(list(graph.subject_objects(predicate=namespace["hasWeaponCode"])))
-            
-            #Create a new instance of Weapon class
-            if(len(weapons) == 0): 
-                # add to Location
-                graph.add((namespace["Weapon#" + str(number_weapon)], RDF.type, namespace["Weapon"]))
-                graph.add((namespace["Weapon#" + str(number_weapon)], namespace["hasWeaponCode"], Literal(weaponUsedList[i], datatype=XSD.integer)))
-                graph.add((namespace["Weapon#" + str(number_weapon)], namespace["hasWeaponDescription"], Literal(weaponDescriptionList[i], datatype=XSD.string)))
-                weapons = namespace["Weapon#" + str(number_weapon)]
-            
-            #Reuse an existing instance of Weapon class
-            else: 
-                weapons = weapons[0]
 
-            graph.add((namespace["Report#" + str(i + starting_report_num)], namespace["hasWeapon"], weapons))
+    def _add_chunk_to_graph(self, chunk, report_class, graph, namespace):
+        """Number the reports and entities of a converted chunk and add its triples to the RDF graph
 
+        Reports and entities are numbered here rather than in the worker processes so that URIs are the same
+        no matter how many workers are used.
 
-        # Status
-        statusList = df['Status']
-        statusDescriptionList = df['StatusDescription']
+        Args:
+            chunk ((int, [URIRef], [ndarray], [(string, [tuple], ndarray)], dict)): a chunk converted by _map_chunk
+            report_class (string): name of the class of the reports such as "CrimeReport"
+            graph (Graph): an RDF graph
+            namespace (string): base namespace for all resources
+        """
+        row_count, predicates, literal_columns, entity_columns, stats = chunk
+        self._record_stats(report_class, stats)
+
+        #Allocate a block of instances of Report class
+        starting_report_num = self.entities.next_id("Report", row_count)
+        reports = [namespace["Report#" + str(n)] for n in range(starting_report_num, starting_report_num + row_count)]
+
+        #Add an instance for every new natural key or reuse an existing one
+        objects = list(literal_columns)
+        with self.metrics.timer("dedup"):
+            for predicate, (class_name, keys, codes) in zip(predicates[len(literal_columns):], entity_columns):
+                #Spill the natural keys to disk and link the reports once every report has been read
+                if self.dedup is not None:
+                    self.dedup.add(class_name, predicate, starting_report_num, keys, codes)
+                    objects.append(None)
+                    continue
+
+                uris = np.empty(len(keys), dtype=object)
+                allocated = self.entities.counters.get(class_name, 0)
+                for code, key in enumerate(keys):
+                    uris[code] = self.entities.add(graph, class_name, key)
+                misses = self.entities.counters.get(class_name, 0) - allocated
+                objects.append(uris[codes])
+
+                #Every new instance has a type and a triple per property of its natural key
+                self.metrics.count("entity_hits." + class_name, len(keys) - misses)
+                self.metrics.count("entity_misses." + class_name, misses)
+                self.metrics.count("triples_added", misses * (1 + len(keys[0])) if keys else 0)
+
+        #Index the reports by every predicate
+        if self.index is not None:
+            with self.metrics.timer("index"):
+                self.index.add(report_class, starting_report_num, predicates, objects)
+
+        #Add all reports to the graph in one pass, or a column at a time as numbers of terms to a compact store
+        report_type = namespace[report_class]
+        store = getattr(graph, "store", None)
+        with self.metrics.timer("add"):
+            if isinstance(store, CompactStore):
+                subjects = store.encode(reports)
+                store.add_columns(subjects, store.term_id(RDF.type), store.term_id(report_type))
+                for predicate, column in zip(predicates, objects):
+                    if column is not None:
+                        store.add_columns(subjects, store.term_id(predicate), store.encode(column))
+            else:
+                added = [(predicate, column) for predicate, column in zip(predicates, objects) if column is not None]
+                for report, *values in zip(reports, *(column for _, column in added)):
+                    graph.add((report, RDF.type, report_type))
+                    for (predicate, _), value in zip(added, values):
+                        graph.add((report, predicate, value))
+        self.metrics.count("triples_added", row_count * (1 + sum(column is not None for column in objects)))
 
-        for i in range(0,len(statusList)):
 
-            #Check if an instance of Status class already exist in the graph
-            statusCode = set(graph.subjects(predicate = namespace["hasStatusCode"], object=Literal(statusList[i], datatype=XSD.string)))
-            statusDesc = set(graph.subjects(predicate = namespace["hasStatusDescription"], object=Literal(statusDescriptionList[i], datatype=XSD.string)))
+    def _resolve_entities(self, graph, namespace):
+        """Number the entities deduplicated on disk, add them to the RDF graph and link the reports to them
 
-            #Give all the triples with status code and status description
-            status = list(statusDesc & statusCode)
-            
-            #Return the number of instances of Status class
-            number_status = len(list(graph.subject_objects(predicate=namespace["hasStatusCode"])))
-            
-            #Create a new instance of Status class
-            if(len(status) == 0): 
-                # add to Location
-                graph.add((namespace["Status#" + str(number_status)], RDF.type, namespace["Status"]))
-                graph.add((namespace["Status#" + str(number_status)], namespace["hasStatusCode"], Literal(statusList[i], datatype=XSD.string)))
-                graph.add((namespace["Status#" + str(number_status)], namespace["hasStatusDescription"], Literal(statusDescriptionList[i], datatype=XSD.string)))
-                status = namespace["Status#" + str(number_status)]
-           
-            #Reuse an existing instance of Status class
-            else: 
-                status = status[0]
-
-            graph.add((namespace["Report#" + str(i + starting_report_num)], namespace["hasStatus"], status))
-
-
-        # Crimes
-        CrimCommitedList = df['CrimeCommited']
-        CrimeDescriptionList = df['CrimeDescription']
-        CrimCommited1List = df['CrimCommited1']
-        CrimCommited2List = df['CrimCommited2']
-        CrimCommited3List = df['CrimCommited3']
-        CrimCommited4List = df['CrimCommited4']
-
-        for i in range(0,len(reportDist)):
-
-            #Check if an instance of Crime class already exist in the graph
-            crimeCommitted = set(graph.subjects(predicate = namespace["hasCrimeCommitted"], object=Literal(CrimCommitedList[i], datatype=XSD.integer)))
-            crimeCrimmitedDescription = set(graph.subjects(predicate = namespace["hasCrimeCrimmitedDescription"], object=Literal(CrimeDescriptionList[i], datatype=XSD.string)))
-            crimeCommited1 = set(graph.subjects(predicate = namespace["hasCrimeCommited1"], object=Literal(CrimCommited1List[i], datatype=XSD.integer)))
-            crimeCommited2 = set(graph.subjects(predicate = namespace["hasCrimeCommited2"], object=Literal(CrimCommited2List[i], datatype=XSD.integer)))
-            crimeCommited3 = set(graph.subjects(predicate = namespace["hasCrimeCommited3"], object=Literal(CrimCommited3List[i], datatype=XSD.integer)))
-            crimeCommited4 = set(graph.subjects(predicate = namespace["hasCrimeCommited4"], object=Literal(CrimCommited4List[i], datatype=XSD.integer)))
-
-            #Give all the triples with mutiple crime committed
-            crimes = list(crimeCommitted & crimeCrimmitedDescription & crimeCommited1 & crimeCommited2 & crimeCommited3 & crimeCommited4)
-            
-            #Return the number of instances of Crime class
-            number_crime_commited = len(list(graph.subject_objects(predicate=namespace["hasCrimeCommitted"])))
-
-            #Return the number of instances of Crime class
-            if(len(crimes) == 0): 
-                # add to Location
-                graph.add((namespace["Crime#" + str(number_crime_commited)], RDF.type, namespace["Crime"]))
-                graph.add((namespace["Crime#" + str(number_crime_commited)], namespace["hasCrimeCommitted"], Literal(CrimCommitedList[i], datatype=XSD.integer)))
-                graph.add((namespace["Crime#" + str(number_crime_commited)], namespace["hasCrimeCrimmitedDescription"], Literal(CrimeDescriptionList[i], datatype=XSD.string)))
-                graph.add((namespace["Crime#" + str(number_crime_commited)], namespace["hasCrimeCommited1"], Literal(CrimCommited1List[i], datatype=XSD.integer)))
-                graph.add((namespace["Crime#" + str(number_crime_commited)], namespace["hasCrimeCommited2"], Literal(CrimCommited2List[i], datatype=XSD.integer)))
-                graph.add((namespace["Crime#" + str(number_crime_commited)], namespace["hasCrimeCommited3"], Literal(CrimCommited3List[i], datatype=XSD.integer)))
-                graph.add((namespace["Crime#" + str(number_crime_commited)], namespace["hasCrimeCommited4"], Literal(CrimCommited4List[i], datatype=XSD.integer)))
-                crimes = namespace["Crime#" + str(number_crime_commited)]
-            
-            #Reuse an existing instance of Crime class
-            else: 
-                crimes = crimes[0];
+        Entities are numbered in the order they are first linked, so URIs are the same as when they are deduplicated in memory.
+
+        Args:
+            graph (Graph): an RDF graph
+            namespace (string): base namespace for all resources
+        """
+        logger.info("Number entities deduplicated on disk...")
+        store = getattr(graph, "store", None)
+        misses = {}
+        with self.metrics.span("resolve"):
+            for kind, class_name, *values in self.dedup.resolve():
+                #Add every entity once, without keeping its natural key in memory
+                if kind == "entity":
+                    id, key = values
+                    self.entities.insert(graph, class_name, key, id, remember=False)
+                    misses[class_name] = misses.get(class_name, 0) + 1
+                    self.metrics.count("triples_added", 1 + len(key))
+                    continue
+
+                #Link a block of reports to their entities
+                predicate, report_numbers, ids = values
+                reports = [namespace["Report#" + str(n)] for n in report_numbers.tolist()]
+                uris = np.empty(len(ids), dtype=object)
+                uris[:] = [self.entities.uri(class_name, id) for id in ids.tolist()]
+                if isinstance(store, CompactStore):
+                    store.add_columns(store.encode(reports), store.term_id(predicate), store.encode(uris))
+                else:
+                    for report, uri in zip(reports, uris):
+                        graph.add((report, predicate, uri))
+                self.metrics.count("triples_added", len(reports))
+
+        #Keys found again in a later chunk are hits, as when entities are deduplicated in memory
+        for class_name, keys in self.dedup.counts().items():
+            self.metrics.count("entity_hits." + class_name, keys - misses.get(class_name, 0))
+            self.metrics.count("entity_misses." + class_name, misses.get(class_name, 0))
+
+
+def _keep(rows, kept):
+    """Keep rows in a list as they are read
+
+    Args:
+        rows (iterator): rows of a CSV
+        kept (list): list to add the rows to
+
+    Yields:
+        [string]: the rows
+    """
+    for row in rows:
+        kept.append(row)
+        yield row
+
+
+def _map_chunk(rows, converter):
+    """Convert a chunk of reports to literals and natural keys of entities without numbering them
+
+    This runs in worker processes so it must not depend on the state of RDF_Graph.
+
+    Args:
+        rows ([[string]] or DataFrame): rows of reports without header
+        converter (RowConverter): compiled mapping of the dataset
+
+    Returns:
+        (int, [URIRef], [ndarray], [(string, [tuple], ndarray)], dict): number of reports, predicates of the reports,
+            a column of literals for every property, the distinct natural keys and a column of codes into them for every entity,
+            and the statistics of the conversion of the literals with the number of rows with missing or extra fields
+    """
+    #Split the rows into the columns that are read unless the reports have been read from a staged dataset
+    columns = converter.columns(rows)
+
+    #Convert each property column to literals
+    literal_columns = [_literal_column(columns[column], datatype, column) for column, datatype in converter.literals]
+
+    #Convert each group of entity columns to natural keys
+    entity_columns = []
+    for class_name, properties, key in converter.entities:
+        keys, codes = _entity_column(columns, properties, key)
+        entity_columns.append((class_name, keys, codes))
+
+    #Count rows of the wrong length along with the literals
+    stats = _literals.take_stats()
+    stats["malformed"] = converter.malformed(rows)
+
+    return len(rows), converter.predicates, literal_columns, entity_columns, stats
+
+
+def _literal_column(series, datatype, column=None):
+    """Convert a column to literals, reusing the literals of values seen in previous chunks
+
+    Args:
+        series (Series): a column of the dataset
+        datatype (URIRef): datatype of the literals
+        column (string, optional): name of the column to count ill-typed values under. Defaults to None.
+
+    Returns:
+        ndarray: a literal for every row of the column
+    """
+    return _literals.convert(series, datatype, column)
+
+
+def _entity_column(columns, properties, key):
+    """Find the distinct natural keys of an entity class in a group of columns
+
+    Args:
+        columns (dict): Series of every column of a chunk of the dataset
+        properties ([(string, URIRef)]): columns of the natural key of the entity class as (column, datatype)
+        key (function): builds a natural key from a literal of every column
+
+    Returns:
+        ([tuple], ndarray): natural keys as tuples of (predicate, Literal) pairs in order of first appearance and the code of the natural key of every row
+    """
+    names = [column for column, _ in properties]
+
+    #Number distinct natural keys in order of first appearance
+    codes = pd.DataFrame({column: columns[column] for column in names}).groupby(names, sort=False, observed=True).ngroup().to_numpy()
+    _, first_rows = np.unique(codes, return_index=True)
 
-            graph.add((namespace["Report#" + str(i + starting_report_num)], namespace["hasCrime"], crimes));
+    #Convert every distinct natural key to literals
+    literals = [_literal_column(columns[column], datatype, column)[first_rows].tolist() for column, datatype in properties]
+    keys = list(map(key, *literals))
 
-        return graph
+    return keys, codes
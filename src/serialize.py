@@ -0,0 +1,207 @@
+import gzip
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from rdflib import BNode, Literal
+from rdflib.namespace import RDF
+
+from src.compact import CompactStore
+from src.ntriples import to_ntriples
+
+
+#Formats that can be serialized a chunk of subjects at a time
+FORMATS = ("nt", "turtle", "jsonld-lines")
+
+#Terms of the graph being serialized, set once in every worker process
+_terms = None
+
+
+def _initialize(terms):
+    global _terms
+    _terms = terms
+
+
+def _json_term(term):
+    """Convert an object to JSON-LD
+
+    Args:
+        term (Identifier): a URI, blank node or literal
+
+    Returns:
+        dict: the object in expanded JSON-LD
+    """
+    if not isinstance(term, Literal):
+        return {"@id": ("_:" + str(term)) if isinstance(term, BNode) else str(term)}
+    value = {"@value": str(term)}
+    if term.language:
+        value["@language"] = term.language
+    elif term.datatype:
+        value["@type"] = str(term.datatype)
+    return value
+
+
+def _serialize_chunk(subjects, predicates, objects, format, terms=None):
+    """Serialize triples grouped by subject
+
+    This runs in worker processes so it only gets numbers of terms, looked up in the terms given to _initialize.
+
+    Args:
+        subjects (ndarray): numbers of the subjects, every subject in a single run of rows
+        predicates (ndarray): numbers of the predicates
+        objects (ndarray): numbers of the objects
+        format (string): "nt", "turtle" or "jsonld-lines"
+        terms ([Identifier], optional): term of every number. Defaults to None to use the terms given to _initialize.
+
+    Returns:
+        bytes: the serialized triples in UTF-8
+    """
+    terms = _terms if terms is None else terms
+
+    if format == "jsonld-lines":
+        lines = []
+        for start, stop in _runs(subjects.tolist()):
+            subject = terms[subjects[start]]
+            node = {"@id": _json_term(subject)["@id"]}
+            for predicate, value in zip(predicates[start:stop].tolist(), objects[start:stop].tolist()):
+                predicate, value = terms[predicate], terms[value]
+                if predicate == RDF.type and not isinstance(value, Literal):
+                    node.setdefault("@type", []).append(str(value))
+                else:
+                    node.setdefault(str(predicate), []).append(_json_term(value))
+            lines.append(json.dumps(node, ensure_ascii=False) + "\n")
+        return "".join(lines).encode("utf-8")
+
+    #Convert each distinct term of the chunk only once
+    ids, codes = np.unique(np.concatenate((subjects, predicates, objects)), return_inverse=True)
+    rendered = np.array([to_ntriples(terms[id]) for id in ids.tolist()], dtype=object)[codes]
+    count = len(subjects)
+    subjects, predicates, objects = rendered[:count].tolist(), rendered[count:2 * count].tolist(), rendered[2 * count:].tolist()
+
+    if format == "nt":
+        return "".join(["%s %s %s .\n" % triple for triple in zip(subjects, predicates, objects)]).encode("utf-8")
+
+    #Turtle with a block per subject and full IRIs so that every chunk stands on its own
+    blocks = []
+    rdf_type = RDF.type.n3()
+    for start, stop in _runs(subjects):
+        lines = ["%s %s" % ("a" if predicate == rdf_type else predicate, value) for predicate, value in zip(predicates[start:stop], objects[start:stop])]
+        blocks.append("%s %s .\n" % (subjects[start], " ;\n    ".join(lines)))
+    return "".join(blocks).encode("utf-8")
+
+
+def _runs(keys):
+    """Find the runs of rows that share a value
+
+    Args:
+        keys ([object]): value of every row
+
+    Yields:
+        (int, int): first row and row after the last row of each run
+    """
+    start = 0
+    for row in range(1, len(keys) + 1):
+        if row == len(keys) or keys[row] != keys[start]:
+            yield start, row
+            start = row
+
+
+def _chunks(subjects, chunk_size):
+    """Split triples sorted by subject into ranges of about chunk_size triples without splitting a subject
+
+    Args:
+        subjects (ndarray): sorted numbers of the subjects
+        chunk_size (int): number of triples per chunk
+
+    Yields:
+        (int, int): first triple and triple after the last triple of each chunk
+    """
+    start = 0
+    while start < len(subjects):
+        stop = min(start + chunk_size, len(subjects))
+        if stop < len(subjects):
+            stop = int(np.searchsorted(subjects, subjects[stop - 1], side="right"))
+        yield start, stop
+        start = stop
+
+
+def _open(path):
+    return gzip.open(path, "wb") if path.endswith(".gz") else open(path, "wb")
+
+
+def shard_path(destination, index):
+    """Find the location of a shard of a destination
+
+    Args:
+        destination (str): location of the output such as "output.nt" or "output.nt.gz"
+        index (int): number of the shard
+
+    Returns:
+        str: location of the shard such as "output-00000.nt"
+    """
+    root, compression = (destination[:-3], ".gz") if destination.endswith(".gz") else (destination, "")
+    root, extension = os.path.splitext(root)
+    return "%s-%05d%s%s" % (root, index, extension, compression)
+
+
+def serialize(graph, destination, format="nt", workers=1, chunk_size=100000, shards=False):
+    """Serialize a graph a chunk of subjects at a time in worker processes
+
+    Triples are grouped by subject in the order of the compact store and split into chunks that never split a subject.
+    Chunks are written in that order so that the output is the same no matter how many workers are used.
+
+    Args:
+        graph (Graph): an RDF graph
+        destination (str): location of the output, compressed with gzip if it ends with ".gz"
+        format (str, optional): "nt", "turtle" or "jsonld-lines" for a JSON-LD object per subject per line. Defaults to "nt".
+        workers (int, optional): number of processes to serialize chunks with. Defaults to 1.
+        chunk_size (int, optional): number of triples per chunk. Defaults to 100000.
+        shards (bool, optional): write every chunk to its own file named by shard_path instead of a single file. Defaults to False.
+
+    Returns:
+        int: number of files written
+    """
+    if format not in FORMATS:
+        raise ValueError("Format \"%s\" can not be serialized in chunks, use one of %s" % (format, ", ".join(FORMATS)))
+
+    store = CompactStore.of_graph(graph)
+    columns = store.sorted_columns()
+    chunks = ((columns[0][start:stop], columns[1][start:stop], columns[2][start:stop]) for start, stop in _chunks(columns[0], chunk_size))
+
+    fp = None if shards else _open(destination)
+    count = 0
+    try:
+        def write(content):
+            nonlocal count
+            if shards:
+                with _open(shard_path(destination, count)) as shard:
+                    shard.write(content)
+            else:
+                fp.write(content)
+            count += 1
+
+        #Serialize chunks in this process
+        if workers <= 1:
+            for chunk in chunks:
+                write(_serialize_chunk(*chunk, format, store.terms))
+
+        #Serialize chunks in worker processes but write them in their original order
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_initialize, initargs=(store.terms,)) as executor:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(executor.submit(_serialize_chunk, *chunk, format))
+
+                    #Keep a bounded number of chunks in flight
+                    if len(pending) >= 2 * workers:
+                        write(pending.popleft().result())
+
+                while pending:
+                    write(pending.popleft().result())
+    finally:
+        if fp is not None:
+            fp.close()
+
+    return 1 if not shards else count
@@ -0,0 +1,405 @@
+import json
+from bisect import bisect_left
+from functools import lru_cache
+from os.path import commonprefix
+
+import numpy as np
+from rdflib import URIRef
+from rdflib.store import Store
+
+from src.compact import CompactStore
+from src.literals import quiet
+from src.ntriples import from_ntriples, to_ntriples
+
+
+#Start of every snapshot file
+MAGIC = b"RDFSNAP1"
+
+#Number of terms per front-coded block of the dictionary. Only the first term of a block is stored in full
+BLOCK_SIZE = 16
+
+#Number of triples looked up at a time when a pattern matches many of them
+BATCH_SIZE = 100000
+
+
+def _varint(value):
+    """Encode a non-negative integer in 7 bits per byte, lowest first
+
+    Args:
+        value (int): the integer
+
+    Returns:
+        bytes: the encoded integer
+    """
+    encoded = bytearray()
+    while value >= 0x80:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _read_varint(data, position):
+    """Decode an integer encoded by _varint
+
+    Args:
+        data (bytes): encoded data
+        position (int): position of the integer in the data
+
+    Returns:
+        (int, int): the integer and the position after it
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def _front_code(texts):
+    """Encode sorted strings in blocks that store every string but the first as the length of the prefix it shares with the previous one and the rest of it
+
+    Args:
+        texts ([bytes]): sorted strings
+
+    Returns:
+        (ndarray, bytes): offset of every block and of the end of the last one, and the encoded blocks
+    """
+    offsets = []
+    entries = []
+    size = 0
+    previous = b""
+    for index, text in enumerate(texts):
+        if index % BLOCK_SIZE == 0:
+            offsets.append(size)
+            entry = _varint(len(text)) + text
+        else:
+            shared = len(commonprefix((previous, text)))
+            entry = _varint(shared) + _varint(len(text) - shared) + text[shared:]
+        entries.append(entry)
+        size += len(entry)
+        previous = text
+    offsets.append(size)
+    return np.array(offsets, dtype=np.uint64), b"".join(entries)
+
+
+def _csr(keys):
+    """Find the distinct keys of a sorted column and where the rows of each one start
+
+    Args:
+        keys (ndarray): sorted keys
+
+    Returns:
+        (ndarray, ndarray): distinct keys and the first row of each one followed by the number of rows
+    """
+    distinct, starts = np.unique(keys, return_index=True)
+    return distinct, np.append(starts, len(keys))
+
+
+def write_snapshot(graph, destination):
+    """Write a graph to a compact binary snapshot that SnapshotStore opens without parsing it
+
+    Terms are numbered in the order of their N-Triples form and kept in a front-coded dictionary. Triples are sorted by
+    (s,p,o) and kept as arrays of term numbers, with the triples of every subject in a single run and permutations by
+    predicate and by object, so that any triple pattern is found by binary search.
+
+    Args:
+        graph (Graph): an RDF graph
+        destination (str): location of the snapshot
+
+    Returns:
+        int: size of the snapshot in bytes
+    """
+    store = CompactStore.of_graph(graph)
+    subjects, predicates, objects = store.sorted_columns()
+
+    #Number the terms used by the triples in the order of their N-Triples form
+    used = np.unique(np.concatenate((subjects, predicates, objects)))
+    texts = [to_ntriples(store.terms[id]).encode("utf-8") for id in used.tolist()]
+    order = sorted(range(len(texts)), key=texts.__getitem__)
+    ranks = np.zeros(len(store.terms), dtype=np.int64)
+    ranks[used[order]] = np.arange(len(order))
+    blocks, dictionary = _front_code([texts[position] for position in order])
+
+    #Sort the triples by their new numbers
+    id_type = np.uint32 if len(order) < 1 << 32 else np.uint64
+    position_type = np.uint32 if len(subjects) < 1 << 32 else np.uint64
+    subjects, predicates, objects = ranks[subjects], ranks[predicates], ranks[objects]
+    triples = np.lexsort((objects, predicates, subjects))
+    subjects, predicates, objects = subjects[triples], predicates[triples], objects[triples]
+
+    #Triples of every subject, then permutations of the triples by (p,o,s) and (o,s,p)
+    subject_ids, subject_offsets = _csr(subjects)
+    by_predicate = np.lexsort((subjects, objects, predicates))
+    predicate_ids, predicate_offsets = _csr(predicates[by_predicate])
+    by_object = np.lexsort((predicates, subjects, objects))
+    object_ids, object_offsets = _csr(objects[by_object])
+
+    sections = {
+        "blocks": blocks,
+        "dictionary": np.frombuffer(dictionary, dtype=np.uint8),
+        "subject_ids": subject_ids.astype(id_type),
+        "subject_offsets": subject_offsets.astype(position_type),
+        "predicates": predicates.astype(id_type),
+        "objects": objects.astype(id_type),
+        "predicate_ids": predicate_ids.astype(id_type),
+        "predicate_offsets": predicate_offsets.astype(position_type),
+        "by_predicate": by_predicate.astype(position_type),
+        "object_ids": object_ids.astype(id_type),
+        "object_offsets": object_offsets.astype(position_type),
+        "by_object": by_object.astype(position_type)}
+
+    #Header as JSON followed by every section aligned to 8 bytes
+    layout = {}
+    offset = 0
+    for name, array in sections.items():
+        layout[name] = [offset, array.dtype.str, len(array)]
+        offset += -(-array.nbytes // 8) * 8
+    header = json.dumps({"terms": len(order), "triples": len(subjects), "block_size": BLOCK_SIZE,
+        "namespaces": {prefix: str(namespace) for prefix, namespace in store.namespaces()}, "sections": layout}).encode("utf-8")
+    header += b" " * (-len(header) % 8)
+
+    with open(destination, "wb") as fp:
+        fp.write(MAGIC)
+        fp.write(np.uint64(len(header)).tobytes())
+        fp.write(header)
+        for array in sections.values():
+            fp.write(array.tobytes())
+            fp.write(b"\0" * (-array.nbytes % 8))
+        return fp.tell()
+
+
+class SnapshotStore(Store):
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+
+    def __init__(self, configuration=None, identifier=None):
+        """Open a snapshot written by write_snapshot as a read-only store, mapping the file into memory instead of reading it
+
+        Only the header is read when the store is opened. Terms are decoded a block of the dictionary at a time
+        and triples are looked up in the arrays of the file when they are queried. Use as Graph(store=SnapshotStore(path)).
+
+        Args:
+            configuration (str): location of the snapshot
+            identifier (URIRef, optional): identifier of the store. Defaults to None.
+        """
+        super().__init__(None, identifier)
+        self.identifier = identifier
+        self.path = configuration
+
+        with open(configuration, "rb") as fp:
+            if fp.read(len(MAGIC)) != MAGIC:
+                raise ValueError("\"%s\" is not a graph snapshot" % configuration)
+            size = int(np.frombuffer(fp.read(8), dtype=np.uint64)[0])
+            header = json.loads(fp.read(size))
+        start = len(MAGIC) + 8 + size
+
+        #Map every section of the file
+        memory = np.memmap(configuration, dtype=np.uint8, mode="r")
+        self.sections = {name: memory[start + offset:start + offset + length * np.dtype(dtype).itemsize].view(dtype)
+            for name, (offset, dtype, length) in header["sections"].items()}
+        self.count = header["triples"]
+        self.block_size = header["block_size"]
+
+        self.prefixes = {prefix: URIRef(namespace) for prefix, namespace in header["namespaces"].items()}
+        self.uris = {namespace: prefix for prefix, namespace in self.prefixes.items()}
+
+        #Recently decoded blocks of the dictionary and terms
+        self._block = lru_cache(maxsize=1024)(self._decode_block)
+        self._term = lru_cache(maxsize=1 << 16)(self._decode_term)
+
+
+    def _decode_block(self, index):
+        """Decode a block of the dictionary
+
+        Args:
+            index (int): number of the block
+
+        Returns:
+            [bytes]: N-Triples form of the terms of the block
+        """
+        blocks = self.sections["blocks"]
+        data = self.sections["dictionary"][int(blocks[index]):int(blocks[index + 1])].tobytes()
+        texts = []
+        position = 0
+        while position < len(data):
+            if texts:
+                shared, position = _read_varint(data, position)
+                length, position = _read_varint(data, position)
+                text = texts[-1][:shared] + data[position:position + length]
+            else:
+                length, position = _read_varint(data, position)
+                text = data[position:position + length]
+            position += length
+            texts.append(text)
+        return texts
+
+
+    def _decode_term(self, id):
+        with quiet():
+            return from_ntriples(self._block(id // self.block_size)[id % self.block_size].decode("utf-8"))
+
+
+    def term(self, id):
+        """Find the term of a number
+
+        Args:
+            id (int): number of the term
+
+        Returns:
+            Identifier: the URI, blank node or literal
+        """
+        return self._term(id)
+
+
+    def term_id(self, term):
+        """Find the number of a term by binary search over the first term of every block of the dictionary
+
+        Args:
+            term (Identifier): a URI, blank node or literal
+
+        Returns:
+            int: number of the term or None if the snapshot does not have it
+        """
+        text = to_ntriples(term).encode("utf-8")
+        low, high = 0, len(self.sections["blocks"]) - 2
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self._block(middle)[0] <= text:
+                low = middle
+            else:
+                high = middle - 1
+
+        texts = self._block(low) if high >= 0 else []
+        position = bisect_left(texts, text)
+        if position < len(texts) and texts[position] == text:
+            return low * self.block_size + position
+        return None
+
+
+    def _range(self, name, id):
+        """Find the triples of a term in one of the permutations
+
+        Args:
+            name (string): "predicate" or "object"
+            id (int): number of the term
+
+        Returns:
+            ndarray: positions of the triples
+        """
+        ids, offsets = self.sections[name + "_ids"], self.sections[name + "_offsets"]
+        index = int(np.searchsorted(ids, id))
+        if index == len(ids) or ids[index] != id:
+            return np.empty(0, dtype=np.int64)
+        return self.sections["by_" + name][int(offsets[index]):int(offsets[index + 1])].astype(np.int64)
+
+
+    def _match(self, triple_pattern):
+        """Find the positions of the triples that match a triple pattern
+
+        Args:
+            triple_pattern ((Identifier, Identifier, Identifier)): subject, predicate and object or None for any term
+
+        Returns:
+            ndarray: positions of the matching triples in (s,p,o) order
+        """
+        ids = []
+        for term in triple_pattern:
+            id = None if term is None else self.term_id(term)
+            if term is not None and id is None:
+                return np.empty(0, dtype=np.int64)
+            ids.append(id)
+        subject, predicate, object = ids
+
+        #Start from the triples of the subject, else of the object, else of the predicate, and filter by the other terms
+        if subject is not None:
+            subject_ids, offsets = self.sections["subject_ids"], self.sections["subject_offsets"]
+            index = int(np.searchsorted(subject_ids, subject))
+            if index == len(subject_ids) or subject_ids[index] != subject:
+                return np.empty(0, dtype=np.int64)
+            positions = np.arange(int(offsets[index]), int(offsets[index + 1]))
+            if object is not None:
+                positions = positions[self.sections["objects"][positions] == object]
+        elif object is not None:
+            positions = self._range("object", object)
+        elif predicate is not None:
+            return self._range("predicate", predicate)
+        else:
+            return np.arange(self.count)
+
+        if predicate is not None:
+            positions = positions[self.sections["predicates"][positions] == predicate]
+        return positions
+
+
+    def triples(self, triple_pattern, context=None):
+        """Find the triples that match a triple pattern
+
+        Args:
+            triple_pattern ((Identifier, Identifier, Identifier)): subject, predicate and object or None for any term
+            context (Graph, optional): unused since the store holds a single graph. Defaults to None.
+
+        Yields:
+            ((Identifier, Identifier, Identifier), iterator): a matching triple and its contexts
+        """
+        positions = self._match(triple_pattern)
+        offsets = self.sections["subject_offsets"]
+        for start in range(0, len(positions), BATCH_SIZE):
+            batch = positions[start:start + BATCH_SIZE]
+            subjects = self.sections["subject_ids"][np.searchsorted(offsets, batch, side="right") - 1]
+            columns = (subjects, self.sections["predicates"][batch], self.sections["objects"][batch])
+
+            #Decode each distinct term of the batch only once
+            ids = np.unique(np.concatenate(columns))
+            terms = dict(zip(ids.tolist(), map(self.term, ids.tolist())))
+            for subject, predicate, object in zip(*(column.tolist() for column in columns)):
+                yield (terms[subject], terms[predicate], terms[object]), iter(())
+
+
+    def __len__(self, context=None):
+        return self.count
+
+
+    def contexts(self, triple=None):
+        return iter(())
+
+
+    def add(self, triple, context, quoted=False):
+        raise TypeError("Graph snapshot \"%s\" is read-only" % self.path)
+
+
+    def remove(self, triple_pattern, context=None):
+        raise TypeError("Graph snapshot \"%s\" is read-only" % self.path)
+
+
+    def bind(self, prefix, namespace, override=True):
+        """Bind a namespace to a prefix while the snapshot is open
+
+        Args:
+            prefix (string): the prefix
+            namespace (URIRef): the namespace
+            override (bool, optional): replace an existing binding of the prefix or namespace. Defaults to True.
+        """
+        if not override and (prefix in self.prefixes or namespace in self.uris):
+            return
+        self.uris.pop(self.prefixes.pop(prefix, None), None)
+        self.prefixes.pop(self.uris.pop(namespace, None), None)
+        self.prefixes[prefix] = namespace
+        self.uris[namespace] = prefix
+
+
+    def namespace(self, prefix):
+        return self.prefixes.get(prefix)
+
+
+    def prefix(self, namespace):
+        return self.uris.get(namespace)
+
+
+    def namespaces(self):
+        yield from list(self.prefixes.items())
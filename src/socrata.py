@@ -0,0 +1,425 @@
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.cache import ResponseCache
+from src.metrics import Metrics
+
+
+logger = logging.getLogger(__name__)
+
+#System fields requested before the fields of every row, to order rows by when they were published and find the last one downloaded
+SYSTEM_FIELDS = [":created_at", ":id"]
+
+
+class SocrataDownloader:
+    def __init__(self, page_size=50000, workers=4, retries=5, backoff=1.0, timeout=60.0, checkpoint_dir=None, cache_dir=None, cache_size=1 << 30, offline=False, metrics=None):
+        """Download Socrata datasets as CSV pages in parallel
+
+        Args:
+            page_size (int, optional): number of rows to request per page. Defaults to 50000.
+            workers (int, optional): number of requests to make at the same time, shared by every dataset being downloaded. Defaults to 4.
+            retries (int, optional): number of times to retry a failed page. Defaults to 5.
+            backoff (float, optional): delay in seconds before the first retry, doubled after every retry. Defaults to 1.0.
+            timeout (float, optional): seconds to wait for the server to accept a connection or to send more of a response before the request is retried. Defaults to 60.0.
+            checkpoint_dir (str, optional): directory to save completed pages to so that an interrupted download can be resumed. Defaults to None.
+            cache_dir (str, optional): directory to cache responses in so that repeated downloads of an unchanged dataset are served from disk. Defaults to None.
+            cache_size (int, optional): maximum size of the cache in bytes. Defaults to 1 GiB.
+            offline (bool, optional): serve every response from the cache without contacting the server. Defaults to False.
+            metrics (Metrics, optional): metrics to count downloaded bytes and rows in. Defaults to None.
+        """
+        self.page_size = page_size
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.checkpoint_dir = checkpoint_dir
+        self.cache = ResponseCache(cache_dir, cache_size) if cache_dir else None
+        self.offline = offline
+        self.metrics = metrics if metrics is not None else Metrics()
+
+        #Modification time of each dataset reported by the server
+        self.versions = {}
+
+        #Publication time and identifier of the last row downloaded from each dataset
+        self.watermarks = {}
+
+        #Share a pool of connections and a bounded number of requests in flight between all pages of all datasets
+        self.slots = threading.BoundedSemaphore(workers)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+
+    def _request(self, url, params, headers=None):
+        """Make a GET request and retry it with exponential backoff if it fails
+
+        Args:
+            url (string): URL to request
+            params (dict): query parameters of the request
+            headers (dict, optional): headers of the request. Defaults to None.
+
+        Returns:
+            Response: a successful response
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                with self.slots:
+                    response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+
+                #Retry on throttling and server errors, fail on anything else
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise requests.HTTPError("URL returns %s" % response.status_code, response=response)
+                response.raise_for_status()
+                return response
+
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as error:
+                retryable = error.response is None or error.response.status_code == 429 or error.response.status_code >= 500
+                if not retryable or attempt == self.retries:
+                    raise
+
+                logger.warning("Request to \"%s\" failed (%s), retrying...", url, error)
+                self.metrics.count("request_retries")
+                time.sleep(self.backoff * 2 ** attempt)
+
+
+    def _fetch(self, url, params, version=None):
+        """Get the content of a response from the cache or the server and count its bytes
+
+        Args:
+            url (string): URL to request
+            params (dict): query parameters of the request
+            version (string, optional): modification time of the dataset. Defaults to None.
+
+        Returns:
+            (bytes, dict): content and headers of the response
+        """
+        with self.metrics.timer("fetch"):
+            content, headers, cached = self._fetch_response(url, params, version)
+        self.metrics.count("bytes_from_cache" if cached else "bytes_downloaded", len(content))
+        return content, headers
+
+
+    def _fetch_response(self, url, params, version=None):
+        """Get the content of a response from the cache or the server
+
+        A response cached for the same version of the dataset is used as is. Any other cached response is revalidated
+        with the server using its ETag and Last-Modified headers.
+
+        Args:
+            url (string): URL to request
+            params (dict): query parameters of the request
+            version (string, optional): modification time of the dataset. Defaults to None.
+
+        Returns:
+            (bytes, dict, boolean): content and headers of the response and True if it has been served from the cache
+        """
+        if self.cache is None:
+            response = self._request(url, params)
+            return response.content, response.headers, False
+
+        key = ResponseCache.key(url, params, version)
+        cached = self.cache.get(key)
+        if cached is not None and (version is not None or self.offline):
+            return cached + (True,)
+        if self.offline:
+            raise requests.ConnectionError("Response from \"%s\" is not cached and downloads are disabled" % url)
+
+        #Ask the server whether the cached response is still valid
+        headers = {}
+        if cached is not None:
+            if "ETag" in cached[1]:
+                headers["If-None-Match"] = cached[1]["ETag"]
+            if "Last-Modified" in cached[1]:
+                headers["If-Modified-Since"] = cached[1]["Last-Modified"]
+
+        response = self._request(url, params, headers)
+        if response.status_code == 304 and cached is not None:
+            return cached + (True,)
+
+        #Keep the headers needed to revalidate the response and to version the dataset
+        kept = {name: response.headers[name] for name in ("ETag", "Last-Modified", "X-SODA2-Truth-Last-Modified") if name in response.headers}
+        self.cache.put(key, response.content, kept)
+        return response.content, kept, False
+
+
+    def count(self, url, where=None):
+        """Determine how many data are available in a dataset
+
+        Args:
+            url (string): URL of the dataset
+            where (string, optional): SoQL condition that the data must match. Defaults to None.
+
+        Returns:
+            int: number of data in the dataset
+        """
+        query = "SELECT COUNT(*)" if where is None else "SELECT COUNT(*) WHERE %s" % where
+        content, headers = self._fetch(url + ".json", {"$query": query})
+
+        #Remember when the dataset was last modified so that its cached pages can be used without revalidation
+        self.versions[url] = headers.get("X-SODA2-Truth-Last-Modified") or headers.get("Last-Modified")
+
+        return int(json.loads(content)[0]["COUNT"])
+
+
+    def _checkpoint_path(self, url, nums_data_to_download, where, select=None):
+        """Determine the directory to save completed pages of a download to
+
+        Args:
+            url (string): URL of the dataset
+            nums_data_to_download (int): number of data to download
+            where (string): SoQL condition that the data must match or None
+            select (string, optional): fields to download separated by commas. Defaults to None for every field.
+
+        Returns:
+            string: path of the directory or None if checkpointing is disabled
+        """
+        if self.checkpoint_dir is None:
+            return None
+
+        #Pages of a different download must never be mixed together
+        key = "%s|%s|%s" % (url, nums_data_to_download, self.page_size)
+        if where is not None:
+            key += "|" + where
+        if select is not None:
+            key += "|$select=" + select
+        path = os.path.join(self.checkpoint_dir, hashlib.sha1(key.encode("utf-8")).hexdigest())
+        os.makedirs(path, exist_ok=True)
+        return path
+
+
+    def _get_page(self, url, offset, limit, where, checkpoint_path, select=None):
+        """Download a single page of a dataset unless it has already been saved by a previous run
+
+        Args:
+            url (string): URL of the dataset
+            offset (int): index of the first data of the page
+            limit (int): number of data in the page
+            where (string): SoQL condition that the data must match or None
+            checkpoint_path (string): directory to save the page to or None
+            select (string, optional): fields to download separated by commas, system fields first. Defaults to None for every field.
+
+        Returns:
+            string: content of the page as CSV
+        """
+        page_path = os.path.join(checkpoint_path, "%012d.csv" % offset) if checkpoint_path else None
+
+        #Reuse a page from a previous run
+        if page_path and os.path.exists(page_path):
+            with open(page_path, "rt", encoding="utf-8", newline="") as fp:
+                return fp.read()
+
+        #Order by publication time, then by row identifier so that pages never overlap
+        params = {"$limit": limit, "$offset": offset, "$order": ",".join(SYSTEM_FIELDS)}
+        if where is not None:
+            params["$where"] = where
+        if select is not None:
+            params["$select"] = select
+        page = self._fetch(url + ".csv", params, self.versions.get(url))[0].decode("utf-8")
+
+        #Save the page atomically so that a killed run never leaves a partial page behind
+        if page_path:
+            with open(page_path + ".tmp", "wt", encoding="utf-8", newline="") as fp:
+                fp.write(page)
+            os.replace(page_path + ".tmp", page_path)
+
+        return page
+
+
+    def iter_rows(self, url, max_data_count, where=None, select=None):
+        """Download a dataset page by page and yield its rows as soon as each page is decoded
+
+        Only a bounded number of pages are held in memory at any time.
+
+        Args:
+            url (string): URL of the dataset
+            max_data_count (int): maximum number of data to download
+            where (string, optional): SoQL condition that the data must match. Defaults to None.
+            select (string, optional): fields to download separated by commas. Defaults to None for every field.
+
+        Yields:
+            [string]: header followed by the data of the dataset
+        """
+        for page in self._iter_pages(url, max_data_count, where, select):
+            yield from page
+
+
+    def prefetch(self, url, max_data_count, where=None, pages=None, select=None):
+        """Start downloading a dataset in a background thread and return its rows, so that another dataset can be
+        downloaded or processed in the meantime
+
+        Args:
+            url (string): URL of the dataset
+            max_data_count (int): maximum number of data to download
+            where (string, optional): SoQL condition that the data must match. Defaults to None.
+            pages (int, optional): maximum number of decoded pages to buffer. Defaults to None for one page per worker.
+            select (string, optional): fields to download separated by commas. Defaults to None for every field.
+
+        Returns:
+            PrefetchedRows: header followed by the data of the dataset. Errors of the download are raised when the rows are read.
+        """
+        return PrefetchedRows(self._iter_pages(url, max_data_count, where, select), self.workers if pages is None else pages)
+
+
+    def _iter_pages(self, url, max_data_count, where=None, select=None):
+        """Download a dataset page by page, oldest rows first, and decode each page
+
+        The publication time and identifier of the last row are kept in watermarks so that the next download can start after it.
+
+        Args:
+            url (string): URL of the dataset
+            max_data_count (int): maximum number of data to download
+            where (string, optional): SoQL condition that the data must match. Defaults to None.
+            select (string, optional): fields to download separated by commas. Defaults to None for every field.
+
+        Yields:
+            [[string]]: rows of each page, header first in the first page
+        """
+        #Determine how many data should be download based on available data and max_data_count
+        available_data_count = self.count(url, where)
+        nums_data_to_download = min(max_data_count, available_data_count)
+
+        logger.info("Downloading %s data from \"%s\"...", nums_data_to_download, url)
+        self.metrics.count("rows_expected", nums_data_to_download)
+
+        #Request the system fields before the fields of the dataset
+        select = ",".join(SYSTEM_FIELDS + [select or "*"])
+
+        #Split the dataset into pages
+        checkpoint_path = self._checkpoint_path(url, nums_data_to_download, where, select)
+        pages = [(offset, min(self.page_size, nums_data_to_download - offset)) for offset in range(0, nums_data_to_download, self.page_size)]
+
+        #An empty dataset still has a header
+        if not pages:
+            page = self._fetch(url + ".csv", {"$limit": 0, "$select": select}, self.versions.get(url))[0].decode("utf-8")
+            yield [row[len(SYSTEM_FIELDS):] for row in csv.reader(io.StringIO(page, newline=""), delimiter=",")]
+            return
+
+        #Download pages in parallel but keep no more than one pending page per worker
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for index in range(len(pages)):
+                while len(pending) < self.workers and index + len(pending) < len(pages):
+                    offset, limit = pages[index + len(pending)]
+                    pending.append(executor.submit(self._get_page, url, offset, limit, where, checkpoint_path, select))
+
+                #Decode pages in order and keep the header of the first page only
+                page = pending.popleft().result()
+                with self.metrics.timer("decode"):
+                    rows = list(csv.reader(io.StringIO(page, newline=""), delimiter=","))
+
+                    #Remember the last row and drop the system fields
+                    if len(rows) > 1 and len(rows[-1]) >= len(SYSTEM_FIELDS):
+                        self.watermarks[url] = tuple(rows[-1][:len(SYSTEM_FIELDS)])
+                    rows = [row[len(SYSTEM_FIELDS):] for row in (rows if index == 0 else rows[1:])]
+                yield rows
+
+
+    def download(self, url, max_data_count, where=None, select=None):
+        """Download a dataset page by page and decode it as CSV
+
+        Args:
+            url (string): URL of the dataset
+            max_data_count (int): maximum number of data to download
+            where (string, optional): SoQL condition that the data must match. Defaults to None.
+            select (string, optional): fields to download separated by commas. Defaults to None for every field.
+
+        Returns:
+            [[string]]: header followed by the data of the dataset
+        """
+        return list(self.iter_rows(url, max_data_count, where, select))
+
+
+class PrefetchedRows:
+    def __init__(self, pages, size):
+        """Read the rows of a dataset that a background thread downloads a page at a time
+
+        The thread stops once every row has been read or close is called, which must happen on every other exit path,
+        such as by using the rows as a context manager.
+
+        Args:
+            pages (iterator): decoded pages of the dataset
+            size (int): maximum number of decoded pages to buffer, at least 1
+        """
+        if size < 1:
+            raise ValueError("At least one page must be buffered, not %s" % size)
+        self.buffer = queue.Queue(size)
+        self.stopped = threading.Event()
+        self.rows = iter(())
+        self.thread = threading.Thread(target=self._download, args=(pages,), name="prefetch", daemon=True)
+        self.thread.start()
+
+
+    def _download(self, pages):
+        try:
+            for page in pages:
+                if not self._put((page, None)):
+                    return
+            self._put((None, None))
+        except Exception as error:
+            self._put((None, error))
+        finally:
+            pages.close()
+
+
+    def _put(self, item):
+        """Buffer a page, or the end of the download, unless the rows are no longer read
+
+        Args:
+            item ((list, Exception)): rows of the page or None at the end, and the error of the download or None
+
+        Returns:
+            bool: False if the download was stopped
+        """
+        while not self.stopped.is_set():
+            try:
+                self.buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+    def __iter__(self):
+        return self
+
+
+    def __next__(self):
+        while True:
+            for row in self.rows:
+                return row
+            if self.stopped.is_set():
+                raise StopIteration
+
+            page, error = self.buffer.get()
+            if page is None:
+                self.close()
+                if error is not None:
+                    raise error
+                raise StopIteration
+            self.rows = iter(page)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+    def close(self):
+        """Stop the download once the page being downloaded is done, without waiting for it"""
+        self.stopped.set()
@@ -0,0 +1,200 @@
+import numpy as np
+import pandas as pd
+
+
+#Mean radius of the Earth in meters
+EARTH_RADIUS = 6371008.8
+
+
+def _to_float(column):
+    """Convert a categorical column of numbers as text to floats, converting each distinct value only once
+
+    Args:
+        column (Series): a categorical column
+
+    Returns:
+        ndarray: the numbers with NaN for missing or ill-formed values
+    """
+    values = pd.to_numeric(pd.Series(column.cat.categories, dtype=object), errors="coerce").to_numpy(dtype=float)
+    return np.append(values, np.nan)[column.cat.codes.to_numpy()]
+
+
+def _distance(latitude, longitude, latitudes, longitudes):
+    """Compute the great-circle distance from a point to other points
+
+    Args:
+        latitude (float): latitude of the point in degrees
+        longitude (float): longitude of the point in degrees
+        latitudes (ndarray): latitudes of the other points in degrees
+        longitudes (ndarray): longitudes of the other points in degrees
+
+    Returns:
+        ndarray: distances in meters
+    """
+    latitude, longitude, latitudes, longitudes = map(np.radians, (latitude, longitude, latitudes, longitudes))
+    a = np.sin((latitudes - latitude) / 2) ** 2 + np.cos(latitude) * np.cos(latitudes) * np.sin((longitudes - longitude) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+class SpatialIndex:
+    def __init__(self, namespace, reports, classes, latitudes, longitudes, cell_size=0.01):
+        """Index reports by the latitude and longitude of their location in a grid of cells
+
+        Points are sorted by cell so that a bounding box only needs one binary search per row of cells.
+        Reports without a location or at 0,0, which LAPD uses for unknown locations, are left out.
+
+        Args:
+            namespace (Namespace): base namespace for all resources
+            reports (ndarray): numbers of the reports
+            classes (ndarray): name of the class of every report such as "CrimeReport"
+            latitudes (ndarray): latitude of every report in degrees
+            longitudes (ndarray): longitude of every report in degrees
+            cell_size (float, optional): width and height of a cell in degrees. Defaults to 0.01, about a kilometer.
+        """
+        self.namespace = namespace
+        self.cell_size = cell_size
+        self.columns = int(np.ceil(360 / cell_size)) + 1
+
+        known = np.isfinite(latitudes) & np.isfinite(longitudes) & ((latitudes != 0) | (longitudes != 0))
+        keys = self._key(self._row(latitudes[known]), self._column(longitudes[known]))
+        order = np.argsort(keys, kind="stable")
+
+        self.keys = keys[order]
+        self.reports = np.asarray(reports)[known][order]
+        self.classes = np.asarray(classes, dtype=object)[known][order]
+        self.latitudes = latitudes[known][order]
+        self.longitudes = longitudes[known][order]
+
+
+    @classmethod
+    def from_index(cls, namespace, index, cell_size=0.01):
+        """Build a spatial index from the locations of the reports of a report index
+
+        Args:
+            namespace (Namespace): base namespace for all resources
+            index (ReportIndex): index of the reports
+            cell_size (float, optional): width and height of a cell in degrees. Defaults to 0.01.
+
+        Returns:
+            SpatialIndex: the spatial index
+        """
+        latitudes = _to_float(index.column("hasLocation/hasLatitude"))
+
+        #Arrest reports spell the longitude of their location differently
+        longitudes = _to_float(index.column("hasLocation/hasLongitude"))
+        longitudes = np.where(np.isnan(longitudes), _to_float(index.column("hasLocation/hasLongtitude")), longitudes)
+
+        return cls(namespace, index.report_numbers(), index.column("class").to_numpy(dtype=object), latitudes, longitudes, cell_size)
+
+
+    def _row(self, latitudes):
+        return np.floor((np.asarray(latitudes) + 90) / self.cell_size).astype(np.int64)
+
+
+    def _column(self, longitudes):
+        return np.floor((np.asarray(longitudes) + 180) / self.cell_size).astype(np.int64)
+
+
+    def _key(self, rows, columns):
+        return rows * self.columns + columns
+
+
+    def _candidates(self, south, west, north, east):
+        """Find the positions of the points in the cells that overlap a bounding box
+
+        Args:
+            south (float): lowest latitude in degrees
+            west (float): lowest longitude in degrees
+            north (float): highest latitude in degrees
+            east (float): highest longitude in degrees
+
+        Returns:
+            ndarray: positions of the points
+        """
+        south, north = max(south, -90), min(north, 90)
+        first_column, last_column = self._column(west), self._column(east)
+        ranges = []
+        for row in range(self._row(south), self._row(north) + 1):
+            start = np.searchsorted(self.keys, self._key(row, first_column), side="left")
+            stop = np.searchsorted(self.keys, self._key(row, last_column), side="right")
+            if start < stop:
+                ranges.append(np.arange(start, stop))
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=np.int64)
+
+
+    def _uris(self, positions):
+        return [self.namespace["Report#" + str(number)] for number in self.reports[positions]]
+
+
+    def within(self, south, west, north, east, report_class=None):
+        """Find the reports located within a bounding box
+
+        Args:
+            south (float): lowest latitude in degrees
+            west (float): lowest longitude in degrees
+            north (float): highest latitude in degrees
+            east (float): highest longitude in degrees
+            report_class (string, optional): name of the class of the reports such as "CrimeReport". Defaults to None.
+
+        Returns:
+            [URIRef]: URIs of the reports
+        """
+        positions = self._candidates(south, west, north, east)
+        latitudes, longitudes = self.latitudes[positions], self.longitudes[positions]
+        inside = (latitudes >= south) & (latitudes <= north) & (longitudes >= west) & (longitudes <= east)
+        if report_class is not None:
+            inside &= self.classes[positions] == report_class
+        return self._uris(positions[inside])
+
+
+    def nearest(self, latitude, longitude, k=10, report_class=None):
+        """Find the reports located nearest to a point
+
+        Args:
+            latitude (float): latitude of the point in degrees
+            longitude (float): longitude of the point in degrees
+            k (int, optional): number of reports to find. Defaults to 10.
+            report_class (string, optional): name of the class of the reports such as "CrimeReport". Defaults to None.
+
+        Returns:
+            [(URIRef, float)]: URIs of the reports and their distance to the point in meters, nearest first
+        """
+        #Search a square around the point that grows until it holds k reports closer than anything outside of it
+        radius = self.cell_size
+        while True:
+            positions = self._candidates(latitude - radius, longitude - radius, latitude + radius, longitude + radius)
+            if report_class is not None:
+                positions = positions[self.classes[positions] == report_class]
+            distances = _distance(latitude, longitude, self.latitudes[positions], self.longitudes[positions])
+            order = np.argsort(distances, kind="stable")[:k]
+
+            #Anything outside the square is at least this far away
+            bound = np.radians(radius) * EARTH_RADIUS * np.cos(np.radians(min(abs(latitude) + radius, 90)))
+            if (len(order) == k and distances[order[-1]] <= bound) or radius >= 360:
+                return list(zip(self._uris(positions[order]), distances[order].tolist()))
+            radius *= 2
+
+
+    def save(self, path):
+        """Save the spatial index to a file
+
+        Args:
+            path (str): location of the file, ending with ".npz"
+        """
+        np.savez(path, cell_size=self.cell_size, keys=self.keys, reports=self.reports, classes=self.classes.astype(str),
+            latitudes=self.latitudes, longitudes=self.longitudes)
+
+
+    @classmethod
+    def load(cls, namespace, path):
+        """Load a spatial index saved by save
+
+        Args:
+            namespace (Namespace): base namespace for all resources
+            path (str): location of the file
+
+        Returns:
+            SpatialIndex: the spatial index
+        """
+        with np.load(path) as data:
+            return cls(namespace, data["reports"], data["classes"].astype(object), data["latitudes"], data["longitudes"], float(data["cell_size"]))
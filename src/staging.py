@@ -0,0 +1,210 @@
+import json
+import os
+from itertools import islice
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from rdflib.namespace import XSD
+
+
+#Time of day of every date in Socrata CSV
+MIDNIGHT = "T00:00:00.000"
+
+
+def schema(columns, datatypes):
+    """Create the Parquet schema of a dataset
+
+    Dates are stored as date32, doubles as float64, the report ID as a string and every other column
+    as a dictionary-encoded string since codes and descriptions repeat across reports.
+
+    Args:
+        columns ([string]): names of the columns of the CSV, report ID first
+        datatypes (dict): datatype of the literals of each column
+
+    Returns:
+        Schema: the schema
+    """
+    fields = []
+    for index, column in enumerate(columns):
+        datatype = datatypes.get(column)
+        if datatype == XSD.date:
+            fields.append(pa.field(column, pa.date32()))
+        elif datatype == XSD.double:
+            fields.append(pa.field(column, pa.float64()))
+        elif index == 0:
+            fields.append(pa.field(column, pa.string()))
+        else:
+            fields.append(pa.field(column, pa.dictionary(pa.int32(), pa.string())))
+    return pa.schema(fields)
+
+
+def _nulls(array):
+    """Replace empty strings with nulls
+
+    Args:
+        array (Array): a string column
+
+    Returns:
+        Array: the column with nulls instead of empty strings
+    """
+    return pc.if_else(pc.equal(array, ""), pa.scalar(None, pa.string()), array)
+
+
+def _to_batch(rows, schema):
+    """Convert rows of a CSV to a typed record batch
+
+    Args:
+        rows ([[string]]): rows of a CSV without header
+        schema (Schema): schema of the dataset
+
+    Returns:
+        RecordBatch: the typed rows
+    """
+    #Missing fields of short rows are empty as they are when the rows are converted
+    arrays = []
+    for index, field in enumerate(schema):
+        array = pa.array([row[index] if index < len(row) else "" for row in rows], type=pa.string())
+
+        if field.type == pa.date32():
+            #Dates that are not at midnight can not be restored from a date32
+            if not pc.all(pc.or_(pc.equal(array, ""), pc.ends_with(array, pattern=MIDNIGHT))).as_py():
+                raise ValueError("Column \"%s\" has dates with a time of day that can not be staged" % field.name)
+            array = pc.cast(pc.strptime(_nulls(pc.utf8_slice_codeunits(array, start=0, stop=10)), format="%Y-%m-%d", unit="s"), pa.date32())
+
+        #rdflib normalizes the lexical form of doubles so their literals do not depend on how the numbers were written
+        elif field.type == pa.float64():
+            array = pc.cast(_nulls(array), pa.float64())
+
+        elif pa.types.is_dictionary(field.type):
+            array = pc.dictionary_encode(array).cast(field.type)
+
+        arrays.append(array)
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def stage_rows(rows, path, columns, datatypes, batch_size=65536, max_data_count=None):
+    """Write rows of a CSV to a Parquet file while passing them on
+
+    The file only appears once every row has been written so that a partial dataset is never mistaken for a staged one.
+
+    Args:
+        rows ([[string]]): rows of a CSV, header first
+        path (str): location of the Parquet file
+        columns ([string]): names of the columns of the CSV, report ID first
+        datatypes (dict): datatype of the literals of each column
+        batch_size (int, optional): number of rows per row group. Defaults to 65536.
+        max_data_count (int, optional): maximum number of reports the rows were downloaded with. Defaults to None for every report.
+
+    Yields:
+        [string]: the same rows
+    """
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+    yield header
+
+    #Keep the original header, and the limit the rows were downloaded with to tell if there are enough of them
+    dataset_schema = schema(columns, datatypes).with_metadata({"header": json.dumps(header), "max_data_count": json.dumps(max_data_count)})
+    with pq.ParquetWriter(path + ".tmp", dataset_schema) as writer:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            #Empty rows such as blank lines of a CSV have no report
+            writer.write_table(pa.Table.from_batches([_to_batch([row for row in batch if row], dataset_schema)]))
+            yield from batch
+    os.replace(path + ".tmp", path)
+
+
+def write_rows(rows, path, columns, datatypes, batch_size=65536):
+    """Write rows of a CSV to a Parquet file
+
+    Args:
+        rows ([[string]]): rows of a CSV, header first
+        path (str): location of the Parquet file
+        columns ([string]): names of the columns of the CSV, report ID first
+        datatypes (dict): datatype of the literals of each column
+        batch_size (int, optional): number of rows per row group. Defaults to 65536.
+    """
+    for _ in stage_rows(rows, path, columns, datatypes, batch_size):
+        pass
+
+
+def staged_columns(path):
+    """Find the columns of a staged dataset without reading it
+
+    Args:
+        path (str): location of the Parquet file
+
+    Returns:
+        [string]: names of the columns
+    """
+    return pq.read_schema(path).names
+
+
+def staged_rows(path):
+    """Count the reports of a staged dataset without reading it
+
+    Args:
+        path (str): location of the Parquet file
+
+    Returns:
+        (int, int): number of reports and maximum number of reports they were downloaded with, or None if every report was downloaded
+    """
+    metadata = pq.read_metadata(path)
+
+    #Datasets staged before the limit was recorded are taken to have been limited to the reports they hold
+    rows = metadata.num_rows
+    limit = json.loads((metadata.metadata or {}).get(b"max_data_count", b"%d" % rows))
+    return rows, limit
+
+
+class StagedReports:
+    def __init__(self, path, max_data_count=None):
+        """Read reports from a Parquet file written by stage_rows
+
+        Args:
+            path (str): location of the Parquet file
+            max_data_count (int, optional): maximum number of reports to read. Defaults to None to read every report.
+        """
+        self.path = path
+        self.max_data_count = max_data_count
+
+        #Map the file instead of reading it
+        self.file = pq.ParquetFile(path, memory_map=True)
+        self.header = json.loads(self.file.schema_arrow.metadata[b"header"])
+
+
+    def __len__(self):
+        rows = self.file.metadata.num_rows
+        return rows if self.max_data_count is None else min(rows, self.max_data_count)
+
+
+    def iter_chunks(self, chunk_size):
+        """Read reports a chunk at a time with dates and numbers turned back into text for the graph builder
+
+        Args:
+            chunk_size (int): number of reports per chunk
+
+        Yields:
+            DataFrame: a chunk of reports with dictionary-encoded columns as categoricals
+        """
+        remaining = self.max_data_count
+        for batch in self.file.iter_batches(batch_size=chunk_size):
+            if remaining is not None:
+                if remaining <= 0:
+                    return
+                batch = batch.slice(0, remaining)
+                remaining -= batch.num_rows
+
+            arrays = []
+            for array, field in zip(batch.columns, batch.schema):
+                if field.type == pa.date32():
+                    array = pc.binary_join_element_wise(pc.cast(array, pa.string()), MIDNIGHT, "")
+                if field.type in (pa.date32(), pa.float64()):
+                    array = pc.fill_null(pc.cast(array, pa.string()), "")
+                arrays.append(array)
+
+            yield pa.RecordBatch.from_arrays(arrays, names=batch.schema.names).to_pandas()
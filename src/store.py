@@ -0,0 +1,294 @@
+import os
+import sqlite3
+
+from rdflib import BNode, Literal, URIRef
+from rdflib.store import Store, VALID_STORE, NO_STORE
+
+
+#Tables of the store. Terms are numbered once and triples only hold their numbers
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    datatype TEXT NOT NULL,
+    language TEXT NOT NULL,
+    UNIQUE (kind, value, datatype, language));
+CREATE TABLE IF NOT EXISTS triples (
+    s INTEGER NOT NULL,
+    p INTEGER NOT NULL,
+    o INTEGER NOT NULL,
+    PRIMARY KEY (s, p, o)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS triples_pos ON triples (p, o, s);
+CREATE INDEX IF NOT EXISTS triples_osp ON triples (o, s, p);
+CREATE TABLE IF NOT EXISTS namespaces (
+    prefix TEXT PRIMARY KEY,
+    uri TEXT NOT NULL UNIQUE);
+"""
+
+
+def _encode(term):
+    """Split an RDF term into the columns of the terms table
+
+    Args:
+        term (Identifier): a URI, blank node or literal
+
+    Returns:
+        (string, string, string, string): kind, value, datatype and language of the term
+    """
+    if isinstance(term, Literal):
+        return ("L", str(term), str(term.datatype or ""), term.language or "")
+    if isinstance(term, BNode):
+        return ("B", str(term), "", "")
+    return ("U", str(term), "", "")
+
+
+def _decode(kind, value, datatype, language):
+    """Rebuild an RDF term from the columns of the terms table
+
+    Args:
+        kind (string): "U" for a URI, "B" for a blank node or "L" for a literal
+        value (string): the URI, the identifier of the blank node or the lexical form of the literal
+        datatype (string): datatype of the literal or an empty string
+        language (string): language of the literal or an empty string
+
+    Returns:
+        Identifier: the RDF term
+    """
+    if kind == "L":
+        return Literal(value, datatype=datatype or None, lang=language or None)
+    if kind == "B":
+        return BNode(value)
+    return URIRef(value)
+
+
+class SQLiteStore(Store):
+    context_aware = False
+    formula_aware = False
+    transaction_aware = True
+
+    def __init__(self, configuration=None, identifier=None, batch_size=100000):
+        """Keep the triples of an RDF graph in a SQLite file indexed by (s,p,o), (p,o,s) and (o,s,p)
+
+        Use as Graph(store=SQLiteStore(path)). Added triples are buffered and written in a single transaction
+        every batch_size triples, before any query and on commit.
+
+        Args:
+            configuration (str, optional): location of the SQLite file to open or create. Defaults to None.
+            identifier (URIRef, optional): identifier of the store. Defaults to None.
+            batch_size (int, optional): number of triples to buffer before writing them. Defaults to 100000.
+        """
+        self.batch_size = batch_size
+        self.connection = None
+        self.identifier = identifier
+        super().__init__(configuration, identifier)
+
+
+    def open(self, configuration, create=True):
+        """Open the SQLite file
+
+        Args:
+            configuration (str): location of the SQLite file
+            create (bool, optional): create the file if it does not exist. Defaults to True.
+
+        Returns:
+            int: VALID_STORE or NO_STORE if the file does not exist and create is False
+        """
+        if not create and not os.path.exists(configuration):
+            return NO_STORE
+
+        self.connection = sqlite3.connect(configuration)
+        self.connection.executescript(SCHEMA)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+
+        #Numbers of the terms that have been looked up or added
+        self.ids = {}
+        self.pending = []
+        return VALID_STORE
+
+
+    def close(self, commit_pending_transaction=True):
+        """Close the SQLite file
+
+        Args:
+            commit_pending_transaction (bool, optional): write buffered triples before closing. Defaults to True.
+        """
+        if self.connection is None:
+            return
+        if commit_pending_transaction:
+            self.commit()
+        else:
+            self.rollback()
+        self.connection.close()
+        self.connection = None
+
+
+    def commit(self):
+        """Write buffered triples and commit them"""
+        self._flush()
+        self.connection.commit()
+
+
+    def rollback(self):
+        """Discard buffered and uncommitted triples"""
+        self.pending = []
+        self.connection.rollback()
+
+        #Numbers of uncommitted terms are no longer valid
+        self.ids = {}
+
+
+    def _flush(self):
+        """Write buffered triples to the triples table"""
+        if self.pending:
+            self.connection.executemany("INSERT OR IGNORE INTO triples VALUES (?, ?, ?)", self.pending)
+            self.pending = []
+
+
+    def _id(self, term, create):
+        """Find the number of a term
+
+        Args:
+            term (Identifier): a URI, blank node or literal
+            create (bool): add the term if it does not exist
+
+        Returns:
+            int: number of the term or None if it does not exist and create is False
+        """
+        key = _encode(term)
+        id = self.ids.get(key)
+        if id is not None:
+            return id
+
+        row = self.connection.execute("SELECT id FROM terms WHERE kind = ? AND value = ? AND datatype = ? AND language = ?", key).fetchone()
+        if row is not None:
+            id = row[0]
+        elif create:
+            id = self.connection.execute("INSERT INTO terms (kind, value, datatype, language) VALUES (?, ?, ?, ?)", key).lastrowid
+        else:
+            return None
+
+        self.ids[key] = id
+        return id
+
+
+    def add(self, triple, context, quoted=False):
+        """Buffer a triple and write the buffer once it is full
+
+        Args:
+            triple ((Identifier, Identifier, Identifier)): subject, predicate and object of the triple
+            context (Graph): graph the triple is added to
+            quoted (bool, optional): unsupported. Defaults to False.
+        """
+        Store.add(self, triple, context, quoted)
+        self.pending.append(tuple(self._id(term, True) for term in triple))
+        if len(self.pending) >= self.batch_size:
+            self._flush()
+
+
+    def addN(self, quads):
+        """Add triples from (subject, predicate, object, context) quads
+
+        Args:
+            quads (iterable): quads to add
+        """
+        for subject, predicate, object, context in quads:
+            self.add((subject, predicate, object), context)
+
+
+    def _where(self, triple_pattern):
+        """Create the condition matching a triple pattern
+
+        Args:
+            triple_pattern ((Identifier, Identifier, Identifier)): subject, predicate and object or None for any term
+
+        Returns:
+            (string, [int]): SQL condition and its parameters or None if a term of the pattern is not in the store
+        """
+        conditions = []
+        params = []
+        for column, term in zip("spo", triple_pattern):
+            if term is None:
+                continue
+            id = self._id(term, False)
+            if id is None:
+                return None
+            conditions.append("t.%s = ?" % column)
+            params.append(id)
+        return " AND ".join(conditions) or "1", params
+
+
+    def triples(self, triple_pattern, context=None):
+        """Find the triples that match a triple pattern
+
+        Args:
+            triple_pattern ((Identifier, Identifier, Identifier)): subject, predicate and object or None for any term
+            context (Graph, optional): unused since the store holds a single graph. Defaults to None.
+
+        Yields:
+            ((Identifier, Identifier, Identifier), iterator): a matching triple and its contexts
+        """
+        self._flush()
+        where = self._where(triple_pattern)
+        if where is None:
+            return
+
+        condition, params = where
+        cursor = self.connection.execute(
+            "SELECT s.kind, s.value, s.datatype, s.language, p.kind, p.value, p.datatype, p.language, o.kind, o.value, o.datatype, o.language "
+            "FROM triples t JOIN terms s ON s.id = t.s JOIN terms p ON p.id = t.p JOIN terms o ON o.id = t.o WHERE " + condition, params)
+        for row in cursor:
+            yield (_decode(*row[0:4]), _decode(*row[4:8]), _decode(*row[8:12])), iter(())
+
+
+    def remove(self, triple_pattern, context=None):
+        """Remove the triples that match a triple pattern
+
+        Args:
+            triple_pattern ((Identifier, Identifier, Identifier)): subject, predicate and object or None for any term
+            context (Graph, optional): unused since the store holds a single graph. Defaults to None.
+        """
+        self._flush()
+        where = self._where(triple_pattern)
+        if where is not None:
+            condition, params = where
+            self.connection.execute("DELETE FROM triples AS t WHERE " + condition, params)
+
+
+    def __len__(self, context=None):
+        self._flush()
+        return self.connection.execute("SELECT COUNT(*) FROM triples").fetchone()[0]
+
+
+    def contexts(self, triple=None):
+        return iter(())
+
+
+    def bind(self, prefix, namespace, override=True):
+        """Bind a namespace to a prefix
+
+        Args:
+            prefix (string): the prefix
+            namespace (URIRef): the namespace
+            override (bool, optional): replace an existing binding of the prefix or namespace. Defaults to True.
+        """
+        if not override and (self.namespace(prefix) is not None or self.prefix(namespace) is not None):
+            return
+        self.connection.execute("DELETE FROM namespaces WHERE prefix = ? OR uri = ?", (prefix, str(namespace)))
+        self.connection.execute("INSERT INTO namespaces VALUES (?, ?)", (prefix, str(namespace)))
+
+
+    def namespace(self, prefix):
+        row = self.connection.execute("SELECT uri FROM namespaces WHERE prefix = ?", (prefix,)).fetchone()
+        return URIRef(row[0]) if row else None
+
+
+    def prefix(self, namespace):
+        row = self.connection.execute("SELECT prefix FROM namespaces WHERE uri = ?", (str(namespace),)).fetchone()
+        return row[0] if row else None
+
+
+    def namespaces(self):
+        for prefix, uri in self.connection.execute("SELECT prefix, uri FROM namespaces").fetchall():
+            yield prefix, URIRef(uri)
@@ -0,0 +1,228 @@
+import numpy as np
+
+
+#Header of the arrest reports dataset as served by Socrata
+ARREST_REPORTS_HEADER = ['rpt_id', 'report_type', 'arst_date', 'time', 'area',
+    'area_desc', 'rd', 'age', 'sex_cd',
+    'descent_cd', 'chrg_grp_cd', 'grp_description', 'arst_typ_cd',
+    'charge', 'chrg_desc', 'disp_desc', 'address',
+    'cross_street', 'lat', 'lon', 'location',
+    'bkg_date', 'bkg_time', 'bkg_location', 'bkg_loc_cd']
+
+#Header of the crime reports dataset as served by Socrata
+CRIME_REPORTS_HEADER = ['dr_no', 'date_rptd', 'date_occ', 'time_occ', 'area',
+    'area_name', 'rpt_dist_no', 'part_1_2', 'crm_cd',
+    'crm_cd_desc', 'mocodes', 'vict_age', 'vict_sex',
+    'vict_descent', 'premis_cd', 'premis_desc',
+    'weapon_used_cd', 'weapon_desc', 'status',
+    'status_desc', 'crm_cd_1', 'crm_cd_2',
+    'crm_cd_3', 'crm_cd_4', 'location',
+    'cross_street', 'lat', 'lon']
+
+#The 21 geographic areas of LAPD
+AREAS = ["Central", "Rampart", "Southwest", "Hollenbeck", "Harbor", "Hollywood", "Wilshire",
+    "West LA", "Van Nuys", "West Valley", "Northeast", "77th Street", "Newton", "Pacific",
+    "N Hollywood", "Foothill", "Devonshire", "Southeast", "Mission", "Olympic", "Topanga"]
+
+SEXES = ["M", "F", "X"]
+DESCENTS = ["H", "B", "W", "O", "X", "A", "K", "F", "C", "J", "P", "V", "Z", "I", "G", "S", "U", "D", "L"]
+ARREST_TYPES = ["M", "F", "I", "O", "D"]
+DISPOSITIONS = ["MISDEMEANOR COMPLAINT FILED", "FELONY COMPLAINT FILED", "RELEASED/INSUFFICIENT EVIDENCE", "CITY ATTORNEY", "OTHER"]
+STATUSES = [("IC", "Invest Cont"), ("AO", "Adult Other"), ("AA", "Adult Arrest"), ("JA", "Juv Arrest"), ("JO", "Juv Other"), ("CC", "UNK")]
+BOOKING_LOCATIONS = 40
+
+#Earliest and latest dates of the datasets as days since 1970-01-01
+FIRST_DAY = np.datetime64("2010-01-01", "D").astype(np.int64)
+LAST_DAY = np.datetime64("2021-03-31", "D").astype(np.int64)
+
+#Bounding box of the City of Los Angeles
+SOUTH, NORTH, WEST, EAST = 33.70, 34.34, -118.67, -118.15
+
+
+def _zipf(rng, cardinality, size):
+    """Draw codes where a few values are very common and most are rare, as for charges, weapons and premises
+
+    Args:
+        rng (Generator): random number generator
+        cardinality (int): number of distinct codes
+        size (int): number of codes to draw
+
+    Returns:
+        ndarray: codes between 0 and cardinality - 1
+    """
+    weights = 1.0 / np.arange(1, cardinality + 1)
+    return rng.choice(cardinality, size=size, p=weights / weights.sum())
+
+
+def _dates(days):
+    """Format days since 1970-01-01 as Socrata floating timestamps
+
+    Args:
+        days (ndarray): days since 1970-01-01
+
+    Returns:
+        ndarray: dates such as "2019-01-01T00:00:00.000"
+    """
+    return np.char.add(np.datetime_as_string(days.astype("datetime64[D]")), "T00:00:00.000")
+
+
+def _times(rng, size):
+    """Draw times of day as LAPD writes them, such as "2130"
+
+    Args:
+        rng (Generator): random number generator
+        size (int): number of times to draw
+
+    Returns:
+        ndarray: times of day
+    """
+    return np.char.zfill((rng.integers(0, 24, size) * 100 + rng.choice([0, 5, 10, 15, 20, 30, 40, 45, 50], size)).astype(str), 4)
+
+
+def _strings(values):
+    return np.asarray(values).astype(str)
+
+
+class _Places:
+    def __init__(self, rng, count):
+        """Draw a pool of addresses, each with a fixed area, reporting district and position
+
+        Args:
+            rng (Generator): random number generator
+            count (int): number of addresses
+        """
+        self.areas = rng.integers(0, len(AREAS), count)
+        self.districts = (self.areas + 1) * 100 + rng.integers(0, 55, count)
+        self.addresses = np.char.add(np.char.add(rng.integers(100, 20000, count).astype(str), " "),
+            np.char.add("STREET ", rng.integers(1, 5000, count).astype(str)))
+        self.cross_streets = np.where(rng.random(count) < 0.2, np.char.add("AVENUE ", rng.integers(1, 500, count).astype(str)), "")
+        self.latitudes = np.round(rng.uniform(SOUTH, NORTH, count), 4)
+        self.longitudes = np.round(rng.uniform(WEST, EAST, count), 4)
+
+        #Unknown positions are written as 0
+        unknown = rng.random(count) < 0.005
+        self.latitudes[unknown] = 0
+        self.longitudes[unknown] = 0
+
+
+def _rows(columns):
+    """Combine columns into rows of a CSV
+
+    Args:
+        columns ([ndarray]): a column of strings for every field of the header
+
+    Yields:
+        [string]: the rows
+    """
+    for row in zip(*(column.tolist() for column in columns)):
+        yield list(row)
+
+
+def generate_arrest_reports(count, seed=0, block_size=100000):
+    """Generate arrest reports shaped like the LAPD arrest reports dataset
+
+    Args:
+        count (int): number of reports
+        seed (int, optional): seed of the random number generator. Defaults to 0.
+        block_size (int, optional): number of reports to generate at a time. Defaults to 100000.
+
+    Yields:
+        [string]: header followed by the reports
+    """
+    rng = np.random.default_rng(seed)
+    places = _Places(rng, max(100, count // 5))
+    charges = max(50, min(count // 50, 1500))
+    yield list(ARREST_REPORTS_HEADER)
+
+    for first in range(0, count, block_size):
+        size = min(block_size, count - first)
+        place = rng.integers(0, len(places.areas), size)
+        charge = _zipf(rng, charges, size)
+        group = charge % 30
+        days = rng.integers(FIRST_DAY, LAST_DAY, size)
+        booked = rng.random(size) < 0.8
+        booking_location = _zipf(rng, BOOKING_LOCATIONS, size)
+        columns = [
+            _strings(190000000 + first + np.arange(size)),
+            np.where(rng.random(size) < 0.9, "BOOKING", "RFC"),
+            _dates(days),
+            _times(rng, size),
+            np.char.zfill(_strings(places.areas[place] + 1), 2),
+            np.array(AREAS)[places.areas[place]],
+            _strings(places.districts[place]),
+            _strings(rng.integers(10, 80, size)),
+            np.array(SEXES)[_zipf(rng, len(SEXES), size)],
+            np.array(DESCENTS)[_zipf(rng, len(DESCENTS), size)],
+            _strings(group + 1),
+            np.char.add("CHARGE GROUP ", _strings(group + 1)),
+            np.array(ARREST_TYPES)[_zipf(rng, len(ARREST_TYPES), size)],
+            _strings(10000 + charge),
+            np.char.add("CHARGE ", _strings(charge)),
+            np.array(DISPOSITIONS)[_zipf(rng, len(DISPOSITIONS), size)],
+            places.addresses[place],
+            places.cross_streets[place],
+            _strings(places.latitudes[place]),
+            _strings(places.longitudes[place]),
+            np.char.add(np.char.add("POINT (", _strings(places.longitudes[place])), np.char.add(" ", np.char.add(_strings(places.latitudes[place]), ")"))),
+            np.where(booked, _dates(days + rng.integers(0, 2, size)), ""),
+            np.where(booked, _times(rng, size), ""),
+            np.where(booked, np.char.add("BOOKING LOCATION ", _strings(booking_location)), ""),
+            np.where(booked, _strings(4200 + booking_location), "")]
+        yield from _rows(columns)
+
+
+def generate_crime_reports(count, seed=0, block_size=100000):
+    """Generate crime reports shaped like the LAPD crime reports dataset
+
+    Args:
+        count (int): number of reports
+        seed (int, optional): seed of the random number generator. Defaults to 0.
+        block_size (int, optional): number of reports to generate at a time. Defaults to 100000.
+
+    Yields:
+        [string]: header followed by the reports
+    """
+    rng = np.random.default_rng(seed + 1)
+    places = _Places(rng, max(100, count // 5))
+    yield list(CRIME_REPORTS_HEADER)
+
+    for first in range(0, count, block_size):
+        size = min(block_size, count - first)
+        place = rng.integers(0, len(places.areas), size)
+        crime = _zipf(rng, 140, size)
+        premise = _zipf(rng, 300, size)
+        armed = rng.random(size) < 0.35
+        weapon = _zipf(rng, 80, size)
+        status = _zipf(rng, len(STATUSES), size)
+        days = rng.integers(FIRST_DAY, LAST_DAY, size)
+        second_crime = rng.random(size) < 0.07
+        columns = [
+            _strings(200000000 + first + np.arange(size)),
+            _dates(days + rng.integers(0, 30, size)),
+            _dates(days),
+            _times(rng, size),
+            np.char.zfill(_strings(places.areas[place] + 1), 2),
+            np.array(AREAS)[places.areas[place]],
+            _strings(places.districts[place]),
+            _strings(1 + (crime % 2)),
+            _strings(110 + crime),
+            np.char.add("CRIME ", _strings(crime)),
+            np.char.add(np.char.zfill(_strings(rng.integers(100, 2100, size)), 4), np.char.add(" ", np.char.zfill(_strings(rng.integers(100, 2100, size)), 4))),
+            _strings(rng.integers(0, 99, size)),
+            np.array(SEXES)[_zipf(rng, len(SEXES), size)],
+            np.array(DESCENTS)[_zipf(rng, len(DESCENTS), size)],
+            _strings(101 + premise),
+            np.char.add("PREMISE ", _strings(premise)),
+            np.where(armed, _strings(100 + weapon), ""),
+            np.where(armed, np.char.add("WEAPON ", _strings(weapon)), ""),
+            np.array([code for code, _ in STATUSES])[status],
+            np.array([description for _, description in STATUSES])[status],
+            _strings(110 + crime),
+            np.where(second_crime, _strings(110 + _zipf(rng, 140, size)), ""),
+            np.full(size, ""),
+            np.full(size, ""),
+            places.addresses[place],
+            places.cross_streets[place],
+            _strings(places.latitudes[place]),
+            _strings(places.longitudes[place])]
+        yield from _rows(columns)
@@ -0,0 +1,183 @@
+import csv
+import hashlib
+import io
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+
+class SocrataServer:
+    def __init__(self):
+        """Serve datasets over HTTP as the Socrata endpoints that SocrataDownloader requests, on a free local port
+
+        Datasets are published as rows, header first, by their path such as "/resource/amvf-fr72", with the time they are
+        published and a row identifier as the system fields :created_at and :id. Requests are recorded and faults can be
+        injected to answer some of them with an error status or after a delay.
+        """
+        self.datasets = {}
+        self.requests = []
+        self.faults = []
+        self.modified = "Mon, 01 Jan 2024 00:00:00 GMT"
+        self.lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = "http://127.0.0.1:%s" % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+    def add(self, path, rows, published="2024-01-01T00:00:00.000Z"):
+        """Publish a dataset, or more rows of a dataset that has already been published
+
+        Args:
+            path (string): path of the dataset such as "/resource/amvf-fr72"
+            rows ([[string]]): rows of the dataset, header first
+            published (string, optional): publication time of the rows. Defaults to "2024-01-01T00:00:00.000Z".
+
+        Returns:
+            string: URL of the dataset
+        """
+        header, *rows = rows
+        header = [":created_at", ":id"] + header
+
+        #Rows are numbered in the order they are published
+        published_rows = self.datasets.get(path, [header])[1:]
+        published_rows += [[published, "row-%08d" % number] + row for number, row in enumerate(rows, len(published_rows))]
+        self.datasets[path] = [header] + published_rows
+        return self.url + path
+
+
+    def fault(self, status=None, delay=0, times=1, offset=None):
+        """Answer the next requests, or the next requests of the page at an offset, with an error status or after a delay
+
+        Args:
+            status (int, optional): status to answer with. Defaults to None to answer normally.
+            delay (float, optional): seconds to wait before answering. Defaults to 0.
+            times (int, optional): number of requests to answer this way. Defaults to 1.
+            offset (int, optional): offset of the page whose requests to answer this way. Defaults to None for any request.
+        """
+        with self.lock:
+            self.faults.append({"status": status, "delay": delay, "times": times, "offset": offset})
+
+
+    def pages(self):
+        """Find the offset of every page that has been requested
+
+        Returns:
+            [int]: offsets in the order they were requested
+        """
+        return [int(params["$offset"]) for path, params in self.requests if path.endswith(".csv") and "$offset" in params]
+
+
+    def _take_fault(self, params):
+        with self.lock:
+            for fault in self.faults:
+                if fault["offset"] is None or str(fault["offset"]) == params.get("$offset"):
+                    fault["times"] -= 1
+                    if not fault["times"]:
+                        self.faults.remove(fault)
+                    return fault
+        return None
+
+
+    def _rows(self, path, params):
+        """Select the rows of a dataset as Socrata does for the parameters of a request
+
+        Conditions are comparisons of a field with a quoted value, compared as text, combined with AND, OR and parentheses.
+        """
+        header, *rows = self.datasets[path]
+        where = params.get("$where")
+        if where is None and params.get("$query", "").startswith("SELECT COUNT(*) WHERE "):
+            where = params["$query"][len("SELECT COUNT(*) WHERE "):]
+        if where is not None:
+            condition = re.sub(r"(:?\w+) (>|=) '([^']*)'", lambda match: "row[%s] %s %r" % (header.index(match.group(1)),
+                "==" if match.group(2) == "=" else match.group(2), match.group(3)), where)
+            condition = condition.replace(" AND ", " and ").replace(" OR ", " or ")
+            rows = [row for row in rows if eval(condition, {"row": row})]
+
+        if "$order" in params:
+            positions = [header.index(field) for field in params["$order"].split(",")]
+            rows = sorted(rows, key=lambda row: [row[position] for position in positions])
+        offset = int(params.get("$offset", 0))
+        rows = rows[offset:offset + int(params.get("$limit", len(rows)))]
+
+        #Every field of the dataset is selected without the system fields unless they are asked for
+        fields = []
+        for field in params.get("$select", "*").split(","):
+            fields.extend(header[2:] if field == "*" else [field])
+        positions = [header.index(field) for field in fields]
+        return fields, [[row[position] for position in positions] for row in rows]
+
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                params = {name: values[0] for name, values in parse_qs(url.query).items()}
+                with server.lock:
+                    server.requests.append((url.path, params))
+
+                fault = server._take_fault(params)
+                if fault is not None:
+                    time.sleep(fault["delay"])
+                    if fault["status"] is not None:
+                        self.send_response(fault["status"])
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+
+                path, extension = url.path.rsplit(".", 1)
+                if path not in server.datasets:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                header, rows = server._rows(path, params)
+
+                if extension == "json":
+                    body = json.dumps([{"COUNT": str(len(rows))}]).encode("utf-8")
+                else:
+                    text = io.StringIO()
+                    csv.writer(text, lineterminator="\n").writerows([header] + rows)
+                    body = text.getvalue().encode("utf-8")
+
+                #Responses that have not changed are revalidated with their ETag
+                etag = "\"%s\"" % hashlib.sha1(body).hexdigest()
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.send_header("X-SODA2-Truth-Last-Modified", server.modified)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+@pytest.fixture
+def socrata():
+    """A local stand-in for a Socrata server"""
+    server = SocrataServer()
+    yield server
+    server.close()
@@ -0,0 +1,266 @@
+import csv
+import gzip
+import pickle
+
+import pytest
+from rdflib import Graph, Literal, URIRef
+from rdflib.compare import isomorphic
+from rdflib.namespace import RDF, XSD
+
+from src.rdf import RDF_Graph
+from src.synthetic import generate_arrest_reports, generate_crime_reports
+
+
+#Number of reports of each dataset and of reports per chunk, so that every build converts several chunks
+REPORTS = 500
+CHUNK_SIZE = 100
+
+
+@pytest.fixture(scope="module")
+def reports():
+    """Synthetic arrest and crime reports, header first"""
+    return list(generate_arrest_reports(REPORTS)), list(generate_crime_reports(REPORTS))
+
+
+def _build(reports, **options):
+    """Build a graph from synthetic reports
+
+    Args:
+        reports (([[string]], [[string]])): rows of the arrest and crime reports, header first
+        **options: other arguments of RDF_Graph
+
+    Returns:
+        RDF_Graph: the built graph
+    """
+    arrest_reports, crime_reports = reports
+    options.setdefault("arrest_reports", list(arrest_reports))
+    options.setdefault("crime_reports", list(crime_reports))
+    return RDF_Graph(max_data_count=REPORTS, chunk_size=CHUNK_SIZE, **options)
+
+
+def _serve(socrata, reports):
+    """Publish synthetic reports on a Socrata stand-in
+
+    Args:
+        socrata (SocrataServer): the stand-in
+        reports (([[string]], [[string]])): rows of the arrest and crime reports, header first
+
+    Returns:
+        dict: URLs of the datasets as arguments of RDF_Graph
+    """
+    arrest_reports, crime_reports = reports
+    return {"arrest_reports_url": socrata.add("/resource/amvf-fr72", arrest_reports), "crime_reports_url": socrata.add("/resource/2nrs-mtv8", crime_reports)}
+
+
+def test_streaming_build_is_isomorphic(reports, socrata):
+    urls = _serve(socrata, reports)
+    kept = RDF_Graph(max_data_count=REPORTS, chunk_size=CHUNK_SIZE, page_size=150, **urls)
+    streamed = RDF_Graph(max_data_count=REPORTS, chunk_size=CHUNK_SIZE, page_size=150, streaming=True, **urls)
+
+    assert isomorphic(_build(reports).graph, kept.graph)
+    assert isomorphic(kept.graph, streamed.graph)
+    assert kept.arrest_reports_dataset == reports[0]
+    assert streamed.arrest_reports_dataset is None and streamed.crime_reports_dataset is None
+
+
+@pytest.mark.parametrize("filename", ["graph.nt", "graph.nt.gz"])
+def test_streamed_output_is_isomorphic(reports, tmp_path, filename):
+    path = str(tmp_path / filename)
+    written = _build(reports, output=path)
+    with (gzip.open if filename.endswith(".gz") else open)(path, "rt", encoding="utf-8") as fp:
+        data = fp.read()
+
+    assert len(data.splitlines()) == len(written.graph)
+    assert isomorphic(_build(reports).graph, Graph().parse(data=data, format="nt"))
+
+
+def test_crime_reports_link_an_entity_per_natural_key(reports):
+    _, (header, *rows) = reports
+    built = _build(reports, datasets=["CrimeReport"])
+    graph, namespace = built.graph, built.namespace
+    by_id = {row[0]: row for row in rows}
+
+    #Reports without a weapon share the weapon with empty properties
+    assert built.entities.counters["Weapon"] == len({(row[16], row[17]) for row in rows})
+    for report in graph.subjects(RDF.type, namespace["CrimeReport"]):
+        row = by_id[str(graph.value(report, namespace["hasID"]))]
+        assert graph.value(report, namespace["hasDate"]) == Literal(row[2], datatype=XSD.date)
+        weapon = graph.value(report, namespace["hasWeapon"])
+        assert graph.value(weapon, namespace["hasWeaponCode"]) == Literal(row[16], datatype=XSD.integer)
+        assert str(graph.value(weapon, namespace["hasWeaponDescription"])) == row[17]
+
+
+def test_parallel_build_is_isomorphic(reports):
+    sequential = _build(reports, build_workers=1)
+    parallel = _build(reports, build_workers=4)
+
+    assert len(sequential.graph) > 0
+    assert isomorphic(sequential.graph, parallel.graph)
+
+
+@pytest.mark.parametrize("build_workers", [1, 4])
+def test_shared_entities_build_is_isomorphic(reports, tmp_path, build_workers):
+    default = _build(reports)
+    shared = _build(reports, shared_entities=True, build_workers=build_workers)
+    dedup = _build(reports, shared_entities=True, build_workers=build_workers, dedup_dir=str(tmp_path), dedup_memory=1 << 16)
+
+    assert isomorphic(default.graph, shared.graph)
+    assert isomorphic(default.graph, dedup.graph)
+
+
+
+def test_selective_build_only_has_the_chosen_triples(reports):
+    default = _build(reports)
+    selective = _build(reports, datasets=["CrimeReport"], entity_classes=["Weapon"], predicates=["hasDate"])
+    namespace = default.namespace
+
+    #Reports are numbered from the first chosen dataset, so they are compared by what they link to
+    def links(graph):
+        crime_reports = set(graph.subjects(RDF.type, namespace["CrimeReport"]))
+        return sorted((str(predicate), str(value)) for report in crime_reports for predicate, value in graph.predicate_objects(report))
+
+    assert set(selective.graph.objects(None, RDF.type)) == {namespace["CrimeReport"], namespace["Weapon"]}
+    assert set(selective.graph.predicates()) == {RDF.type, namespace["hasDate"], namespace["hasWeapon"], namespace["hasWeaponCode"], namespace["hasWeaponDescription"]}
+    chosen = {RDF.type, namespace["hasDate"], namespace["hasWeapon"]}
+    assert links(selective.graph) == [link for link in links(default.graph) if URIRef(link[0]) in chosen]
+    with pytest.raises(ValueError):
+        _build(reports, datasets=["ArrestReport"], entity_classes=["Weapon"])
+
+
+@pytest.mark.parametrize("build_workers", [1, 4])
+def test_dedup_build_is_isomorphic(reports, tmp_path, build_workers):
+    default = _build(reports)
+    dedup = _build(reports, dedup_dir=str(tmp_path), dedup_memory=1 << 16, build_workers=build_workers)
+
+    assert isomorphic(default.graph, dedup.graph)
+    assert dedup.index is None
+
+
+def _write_csv(path, rows):
+    with open(path, "wt", newline="") as fp:
+        csv.writer(fp).writerows(rows)
+    return str(path)
+
+
+@pytest.mark.parametrize("build_workers", [1, 4])
+def test_truncated_rows_are_read_with_empty_fields(reports, build_workers, caplog):
+    arrest_reports, _ = reports
+    truncated = [row[:10] if index == 3 else row for index, row in enumerate(arrest_reports)]
+    padded = [row[:10] + [""] * (len(row) - 10) if index == 3 else row for index, row in enumerate(arrest_reports)]
+    expected = _build(reports, arrest_reports=padded)
+    graph = _build(reports, arrest_reports=truncated, build_workers=build_workers)
+
+    assert isomorphic(expected.graph, graph.graph)
+    assert graph.metrics.get("malformed_rows.ArrestReport") == 1
+    assert "missing or extra fields" in caplog.text
+
+
+@pytest.mark.parametrize("staged", [False, True])
+def test_empty_rows_are_skipped(reports, tmp_path, staged):
+    arrest_reports, crime_reports = reports
+    blank = arrest_reports[:3] + [[]] + arrest_reports[3:] + [[]]
+    options = {"staging_dir": str(tmp_path)} if staged else {}
+    graph = _build(reports, arrest_reports=blank, build_workers=2, **options)
+
+    assert isomorphic(_build(reports).graph, graph.graph)
+    assert graph.metrics.get("empty_rows") == 2
+    assert graph.metrics.get("malformed_rows.ArrestReport") == 0
+    if staged:
+        from src.staging import StagedReports
+        assert len(StagedReports(str(tmp_path / RDF_Graph.STAGED_FILENAMES["ArrestReport"]))) == REPORTS
+
+def test_local_file_with_missing_columns_is_read_with_empty_fields(reports, tmp_path):
+    arrest_reports, crime_reports = reports
+    padded = [row[:20] + [""] * (len(row) - 20) for row in arrest_reports]
+    expected = _build(reports, arrest_reports=padded)
+    graph = _build(reports, arrest_reports=_write_csv(tmp_path / "arrest_reports.csv", [row[:20] for row in arrest_reports]),
+        crime_reports=_write_csv(tmp_path / "crime_reports.csv", crime_reports))
+
+    assert isomorphic(expected.graph, graph.graph)
+
+
+def test_local_build_is_isomorphic(reports, tmp_path):
+    arrest_reports, crime_reports = reports
+    with gzip.open(tmp_path / "crime_reports.csv.gz", "wt", newline="") as fp:
+        csv.writer(fp).writerows(crime_reports)
+    local = _build(reports, arrest_reports=_write_csv(tmp_path / "arrest_reports.csv", arrest_reports),
+        crime_reports=str(tmp_path / "crime_reports.csv.gz"), build_workers=4)
+
+    assert isomorphic(_build(reports).graph, local.graph)
+
+
+def test_given_reports_can_not_be_continued_from_a_state(reports, tmp_path):
+    with pytest.raises(ValueError):
+        _build(reports, state=str(tmp_path / "state.pkl"))
+
+
+def _download(urls, **options):
+    """Build a graph from reports served by a Socrata stand-in
+
+    Args:
+        urls (dict): URLs of the datasets as arguments of RDF_Graph
+        **options: other arguments of RDF_Graph
+
+    Returns:
+        RDF_Graph: the built graph
+    """
+    options.setdefault("max_data_count", REPORTS)
+    return RDF_Graph(chunk_size=CHUNK_SIZE, page_size=150, **urls, **options)
+
+
+def _downloads(socrata):
+    """Count the datasets downloaded from a Socrata stand-in, each of which is counted first"""
+    return sum(path.endswith(".json") for path, _ in socrata.requests)
+
+
+def _report_ids(rdf_graph):
+    return sorted(int(value) for value in rdf_graph.graph.objects(None, rdf_graph.namespace["hasID"]))
+
+
+def test_staged_build_is_isomorphic(reports, socrata, tmp_path):
+    urls = _serve(socrata, reports)
+    downloaded = _download(urls, staging_dir=str(tmp_path))
+    staged = _download(urls, staging_dir=str(tmp_path), build_workers=4)
+
+    assert _downloads(socrata) == 2
+    assert isomorphic(downloaded.graph, staged.graph)
+
+
+def test_staged_build_downloads_more_reports_than_staged(reports, socrata, tmp_path):
+    urls = _serve(socrata, reports)
+    _download(urls, staging_dir=str(tmp_path), max_data_count=300)
+    larger = _download(urls, staging_dir=str(tmp_path))
+    assert _downloads(socrata) == 4
+    assert len(_report_ids(larger)) == 2 * REPORTS
+
+    #Fewer reports are read from the staged datasets
+    smaller = _download(urls, staging_dir=str(tmp_path), max_data_count=200)
+    assert _downloads(socrata) == 4
+    assert len(_report_ids(smaller)) == 400
+
+
+def test_state_only_adds_reports_published_since(reports, socrata, tmp_path):
+    (arrest_header, *arrest_reports), (crime_header, *crime_reports) = reports
+    state = str(tmp_path / "state.pkl")
+
+    #The first run stops among reports published at the same time
+    urls = {"arrest_reports_url": socrata.add("/resource/amvf-fr72", [arrest_header] + arrest_reports[200:]),
+        "crime_reports_url": socrata.add("/resource/2nrs-mtv8", [crime_header] + crime_reports[200:])}
+    first = _download(urls, max_data_count=250, state=state, staging_dir=str(tmp_path / "staging"))
+    assert not (tmp_path / "staging").exists()
+
+    #Reports with lower IDs are published later
+    socrata.add("/resource/amvf-fr72", [arrest_header] + arrest_reports[:200], published="2024-01-08T00:00:00.000Z")
+    socrata.add("/resource/2nrs-mtv8", [crime_header] + crime_reports[:200], published="2024-01-08T00:00:00.000Z")
+    second = _download(urls, state=state)
+    assert second.entities.counters["Report"] == 2 * REPORTS
+    assert sorted(_report_ids(first) + _report_ids(second)) == _report_ids(_build(reports))
+
+
+def test_state_of_an_older_version_is_not_continued_from(reports, socrata, tmp_path):
+    state = tmp_path / "state.pkl"
+    with open(state, "wb") as fp:
+        pickle.dump({"counters": {}, "entities": {}, "watermarks": {"ArrestReport": ("rpt_id", 190000299)}}, fp)
+
+    with pytest.raises(ValueError):
+        _download(_serve(socrata, reports), state=str(state))
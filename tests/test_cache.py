@@ -0,0 +1,63 @@
+import pytest
+import requests
+
+from src.cache import ResponseCache
+from src.socrata import SocrataDownloader
+
+
+@pytest.fixture
+def dataset(socrata):
+    """URL and rows, header first, of a dataset served by the stand-in"""
+    rows = [["rpt_id", "area_desc"]] + [[str(190000000 + number), "Area %s" % (number % 3)] for number in range(20)]
+    return socrata.add("/resource/amvf-fr72", rows), rows
+
+
+def _downloader(cache_dir, **options):
+    return SocrataDownloader(page_size=7, cache_dir=str(cache_dir), **options)
+
+
+def test_unchanged_dataset_is_served_from_the_cache(socrata, dataset, tmp_path):
+    url, rows = dataset
+    assert _downloader(tmp_path).download(url, 20) == rows
+    del socrata.requests[:]
+
+    #Only the count is revalidated with its ETag, pages of the same version of the dataset are used as they are
+    downloader = _downloader(tmp_path)
+    assert downloader.download(url, 20) == rows
+    assert [path for path, _ in socrata.requests] == ["/resource/amvf-fr72.json"]
+    assert downloader.metrics.get("bytes_downloaded") == 0
+    assert downloader.metrics.get("bytes_from_cache") > 0
+
+
+def test_changed_dataset_is_downloaded_again(socrata, dataset, tmp_path):
+    url, rows = dataset
+    _downloader(tmp_path).download(url, 30)
+
+    socrata.add("/resource/amvf-fr72", [rows[0], ["190000020", "Area 2"]], published="2024-01-08T00:00:00.000Z")
+    socrata.modified = "Mon, 08 Jan 2024 00:00:00 GMT"
+    assert _downloader(tmp_path).download(url, 30) == rows + [["190000020", "Area 2"]]
+
+
+def test_offline_downloads_only_read_the_cache(socrata, dataset, tmp_path):
+    url, rows = dataset
+    _downloader(tmp_path).download(url, 20)
+    del socrata.requests[:]
+
+    assert _downloader(tmp_path, offline=True).download(url, 20) == rows
+    assert socrata.requests == []
+    with pytest.raises(requests.ConnectionError):
+        _downloader(tmp_path, offline=True).download(url, 10)
+
+
+def test_least_recently_used_responses_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_size=10)
+    cache.put("a", b"aaaa", {})
+    cache.put("b", b"bbbb", {"ETag": "\"b\""})
+    assert cache.get("a") == (b"aaaa", {})
+    cache.put("c", b"cccc", {})
+
+    assert cache.get("b") is None
+    assert cache.size == 8
+
+    #Responses are found again by a new cache in the same directory
+    assert ResponseCache(str(tmp_path), max_size=10).get("c") == (b"cccc", {})
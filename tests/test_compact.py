@@ -0,0 +1,57 @@
+import itertools
+
+import numpy as np
+from rdflib import Graph, Literal, Namespace
+from rdflib.namespace import RDF, XSD
+
+from src.compact import CompactStore
+
+
+EX = Namespace("http://example.org/")
+
+
+def _triples():
+    """Triples of reports that share people and values, with some triples repeated"""
+    for number in range(50):
+        report = EX["Report#" + str(number)]
+        yield report, RDF.type, EX.ArrestReport if number % 2 else EX.CrimeReport
+        yield report, EX.hasPerson, EX["Person#" + str(number % 7)]
+        yield report, EX.hasDate, Literal("2020-01-%02d" % (number % 28 + 1), datatype=XSD.date)
+        yield EX["Person#" + str(number % 7)], EX.hasAge, Literal(str(number % 7 + 20), datatype=XSD.integer)
+
+
+def test_every_triple_pattern_matches_as_in_a_graph():
+    graph, compact = Graph(), Graph(store=CompactStore())
+    for triple in _triples():
+        graph.add(triple)
+        compact.add(triple)
+    assert len(compact) == len(graph)
+
+    #Patterns of every combination of bound terms, including terms that are not in the graph
+    terms = [EX["Report#3"], EX["Person#3"], RDF.type, EX.hasAge, EX.ArrestReport, Literal("23", datatype=XSD.integer), EX.Unknown]
+    for pattern in itertools.product([None] + terms, repeat=3):
+        assert set(compact.triples(pattern)) == set(graph.triples(pattern)), pattern
+
+
+def test_columns_of_term_numbers_are_deduplicated_with_added_triples():
+    store = CompactStore()
+    reports = np.array([EX["Report#" + str(number % 5)] for number in range(10)], dtype=object)
+    store.add((EX["Report#0"], RDF.type, EX.ArrestReport), None)
+    store.add_columns(store.encode(reports), store.term_id(RDF.type), store.term_id(EX.ArrestReport))
+    assert len(store) == 5
+
+    subjects, predicates, objects = store.sorted_columns()
+    assert list(subjects) == sorted(subjects)
+    assert {store.terms[subject] for subject in subjects} == set(reports)
+
+
+def test_removed_triples_are_not_found():
+    graph = Graph(store=CompactStore())
+    for triple in _triples():
+        graph.add(triple)
+
+    graph.remove((None, EX.hasPerson, EX["Person#0"]))
+    assert list(graph.subjects(EX.hasPerson, EX["Person#0"])) == []
+    assert len(list(graph.subjects(EX.hasPerson, None))) == 50 - 8
+    graph.add((EX["Report#0"], EX.hasPerson, EX["Person#0"]))
+    assert list(graph.subjects(EX.hasPerson, EX["Person#0"])) == [EX["Report#0"]]
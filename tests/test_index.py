@@ -0,0 +1,51 @@
+from collections import Counter
+
+import pytest
+from rdflib import Literal
+from rdflib.namespace import RDF, XSD
+
+from src.rdf import RDF_Graph
+from src.synthetic import generate_arrest_reports, generate_crime_reports
+
+
+@pytest.fixture(scope="module")
+def graph():
+    """Graph of synthetic reports, indexed"""
+    return RDF_Graph(arrest_reports=list(generate_arrest_reports(300)), crime_reports=list(generate_crime_reports(300)), chunk_size=100)
+
+
+def _crime_reports(graph):
+    return set(graph.graph.subjects(RDF.type, graph.namespace.CrimeReport))
+
+
+def test_counts_match_the_graph(graph):
+    ns = graph.namespace
+    expected = Counter(str(area) for report in _crime_reports(graph) for location in graph.graph.objects(report, ns.hasLocation)
+        for area in graph.graph.objects(location, ns.hasAreaName))
+
+    counts = graph.index.count(["hasLocation/hasAreaName"], report_class="CrimeReport")
+    assert counts.to_dict() == dict(expected)
+    assert counts.is_monotonic_decreasing
+
+
+def test_reports_are_found_by_date_and_value(graph):
+    ns = graph.namespace
+    weapon = Literal("WEAPON 0", datatype=XSD.string)
+    expected = {report for report in _crime_reports(graph) if any("2012-01-01" <= str(date) < "2018-01-01" for date in graph.graph.objects(report, ns.hasDate))
+        and any((weapon_node, ns.hasWeaponDescription, weapon) in graph.graph for weapon_node in graph.graph.objects(report, ns.hasWeapon))}
+
+    reports = graph.index.reports("CrimeReport", start="2012-01-01", end="2018-01-01", where={"hasWeapon/hasWeaponDescription": "WEAPON 0"})
+    assert len(expected) > 0
+    assert set(reports) == expected
+
+
+@pytest.mark.parametrize("option", ["output", "dedup_dir", "state"])
+def test_reports_are_not_indexed_by_default_when_they_are_not_kept(option, tmp_path):
+    assert RDF_Graph(lazy=True).index is not None
+    assert RDF_Graph(lazy=True, **{option: str(tmp_path / option)}).index is None
+
+
+@pytest.mark.parametrize("option", ["dedup_dir", "state"])
+def test_reports_can_not_be_indexed_without_every_entity_in_memory(option, tmp_path):
+    with pytest.raises(ValueError):
+        RDF_Graph(index=True, lazy=True, **{option: str(tmp_path / option)})
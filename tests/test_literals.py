@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+from rdflib import Literal
+from rdflib.namespace import XSD
+
+from src.literals import SAMPLES, LiteralCache
+from src.rdf import RDF_Graph
+from src.synthetic import ARREST_REPORTS_HEADER, generate_arrest_reports, generate_crime_reports
+
+
+def test_ill_typed_values_are_counted_per_row():
+    cache = LiteralCache()
+    values = pd.Series(["1", "", "x", "2", "", " 3 "])
+    literals = cache.convert(values, XSD.integer, "Age")
+
+    #Ill-typed values are still converted as rdflib does
+    assert list(literals) == [Literal(value, datatype=XSD.integer) for value in values]
+    stats = cache.take_stats()
+    assert stats["invalid"] == {"Age": 3}
+    assert stats["samples"] == {"Age": ["", "x"]}
+    assert (stats["hits"], stats["misses"]) == (0, 5)
+
+    #Remembered literals keep counting as ill-typed, and the counters start over after they are taken
+    cache.convert(pd.Series(["", "4"]), XSD.integer, "Age")
+    assert cache.take_stats() == {"hits": 1, "misses": 1, "invalid": {"Age": 1}, "samples": {"Age": [""]}}
+
+
+@pytest.mark.parametrize("datatype, valid, invalid", [
+    (XSD.double, ["1.5", "-2e3", "NaN", ".5"], ["", "1,5"]),
+    (XSD.date, ["2020-01-31", "1999-12-01"], ["", "01/31/2020", "2020-13-01"]),
+    (XSD.time, ["2359", "23:59:00"], ["", "noon", "2500"])])
+def test_values_are_checked_against_their_datatype(datatype, valid, invalid):
+    cache = LiteralCache()
+    cache.convert(pd.Series(valid + invalid), datatype, "column")
+    assert cache.take_stats()["samples"] == {"column": invalid}
+
+
+def test_samples_and_remembered_literals_are_bounded():
+    cache = LiteralCache(max_size=5)
+    cache.convert(pd.Series(["x%s" % number for number in range(20)]), XSD.integer, "Age")
+    assert len(cache.literals) == 5
+    assert len(cache.take_stats()["samples"]["Age"]) == SAMPLES
+
+
+@pytest.mark.parametrize("build_workers", [1, 2])
+def test_build_counts_ill_typed_values(build_workers):
+    reports = list(generate_arrest_reports(300))
+    column = ARREST_REPORTS_HEADER.index("bkg_loc_cd")
+    empty = sum(1 for report in reports[1:] if report[column] == "")
+
+    graph = RDF_Graph(arrest_reports=reports, crime_reports=list(generate_crime_reports(0)), chunk_size=100, build_workers=build_workers)
+    assert empty > 0
+    assert graph.metrics.get("invalid_literals.ArrestReport.BookingLocationCode") == empty
+    assert graph.metrics.extra["invalid_literal_samples"]["ArrestReport.BookingLocationCode"] == [""]
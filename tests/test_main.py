@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from main import EXIT_USAGE, _parse_arguments, _parser, main
+
+
+@pytest.mark.parametrize("argv", [
+    ["--state", "state.pkl", "-o", "graph.ttl"],
+    ["--state", "state.pkl", "--store", "graph.db", "-o", "graph.csv"],
+    ["--state", "state.pkl", "--store", "graph.db", "--arrest-reports-file", "arrest_reports.csv", "--crime-reports-file", "crime_reports.csv"]])
+def test_state_needs_a_graph_kept_between_runs(argv, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert main(argv) == EXIT_USAGE
+    assert not (tmp_path / "graph.db").exists()
+
+
+@pytest.mark.parametrize("option", [["--streaming"], ["--staging-dir", "staging"], ["--arrest-reports-file", "arrest_reports.csv", "--crime-reports-file", "crime_reports.csv"]])
+@pytest.mark.parametrize("output", ["datasets.csv", "datasets.parquet"])
+def test_dataset_outputs_need_the_rows_of_the_datasets(option, output, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert main(option + ["-o", output]) == EXIT_USAGE
+
+
+@pytest.mark.parametrize("option", [["--state", "state.pkl", "--store", "graph.db"], ["--dedup-dir", "dedup"]])
+def test_reports_can_not_be_indexed_without_every_entity_in_memory(option, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert main(option + ["--index", "-o", "graph.ttl"]) == EXIT_USAGE
+
+
+def test_options_of_the_command_line_replace_the_config_file(tmp_path):
+    config = tmp_path / "config.json"
+    config.write_text(json.dumps({"output": ["graph.ttl", "graph.nt"], "format": ["turtle", "nt"], "max_data_count": 10}))
+
+    args = _parse_arguments(_parser(), ["-c", str(config), "-o", "graph.jsonld", "-f", "json-ld"])
+    assert (args.output, args.format, args.max_data_count) == (["graph.jsonld"], ["json-ld"], 10)
+    args = _parse_arguments(_parser(), ["-c", str(config), "-n", "20"])
+    assert (args.output, args.format, args.max_data_count) == (["graph.ttl", "graph.nt"], ["turtle", "nt"], 20)
+
+
+def test_entities_deduplicated_on_disk_can_not_be_continued_from_a_state(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert main(["--dedup-dir", "dedup", "--state", "state.pkl", "--stream-output", "graph.nt"]) == EXIT_USAGE
@@ -0,0 +1,52 @@
+import gzip
+import json
+
+import pytest
+from rdflib import Graph
+from rdflib.compare import isomorphic
+
+from src.rdf import RDF_Graph
+from src.serialize import serialize, shard_path
+from src.synthetic import generate_arrest_reports, generate_crime_reports
+
+
+@pytest.fixture(scope="module")
+def graph():
+    return RDF_Graph(arrest_reports=list(generate_arrest_reports(200)), crime_reports=list(generate_crime_reports(200))).graph
+
+
+def _read(path):
+    with (gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")) as fp:
+        return fp.read()
+
+
+@pytest.mark.parametrize("format", ["nt", "turtle", "jsonld-lines"])
+def test_output_is_the_same_with_any_number_of_workers(graph, format, tmp_path):
+    outputs = []
+    for workers in (1, 3):
+        destination = str(tmp_path / ("graph-%s.out" % workers))
+        assert serialize(graph, destination, format=format, workers=workers, chunk_size=500) == 1
+        outputs.append(_read(destination))
+    assert outputs[0] == outputs[1]
+
+    #Every subject is written once, as a whole
+    if format == "jsonld-lines":
+        subjects = [json.loads(line)["@id"] for line in outputs[0].decode("utf-8").splitlines()]
+        assert len(subjects) == len(set(subjects)) == len(set(graph.subjects()))
+    else:
+        assert isomorphic(Graph().parse(data=outputs[0].decode("utf-8"), format=format), graph)
+
+
+def test_shards_concatenate_to_the_single_file(graph, tmp_path):
+    destination = str(tmp_path / "graph.nt.gz")
+    serialize(graph, destination, workers=2, chunk_size=500)
+
+    files = serialize(graph, str(tmp_path / "shards.nt.gz"), workers=2, chunk_size=500, shards=True)
+    assert files > 1
+    assert shard_path(str(tmp_path / "shards.nt.gz"), 0) == str(tmp_path / "shards-00000.nt.gz")
+    assert b"".join(_read(shard_path(str(tmp_path / "shards.nt.gz"), index)) for index in range(files)) == _read(destination)
+
+
+def test_formats_that_can_not_be_serialized_in_chunks_are_rejected(graph, tmp_path):
+    with pytest.raises(ValueError):
+        serialize(graph, str(tmp_path / "graph.xml"), format="pretty-xml")
@@ -0,0 +1,65 @@
+import itertools
+
+import pytest
+from rdflib import BNode, Graph, Literal, Namespace
+from rdflib.compare import isomorphic
+from rdflib.namespace import RDF, XSD
+
+from src.rdf import RDF_Graph
+from src.snapshot import SnapshotStore, write_snapshot
+from src.synthetic import generate_arrest_reports, generate_crime_reports
+
+
+EX = Namespace("http://example.org/")
+
+
+@pytest.fixture(scope="module")
+def graph():
+    graph = RDF_Graph(arrest_reports=list(generate_arrest_reports(100)), crime_reports=list(generate_crime_reports(100))).graph
+
+    #Terms of every kind, including ones that only differ by their language or datatype
+    graph.add((EX["Report#0"], EX.hasNote, Literal("note", lang="en")))
+    graph.add((EX["Report#0"], EX.hasNote, Literal("note", datatype=XSD.string)))
+    graph.add((EX["Report#0"], EX.hasNote, Literal("line\nbreak \"quoted\" é")))
+    graph.add((BNode("person"), RDF.type, EX.Person))
+    return graph
+
+
+@pytest.fixture(scope="module")
+def snapshot(graph, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("snapshot") / "graph.snap")
+    assert write_snapshot(graph, path) > 0
+    return Graph(store=SnapshotStore(path))
+
+
+def test_snapshot_holds_the_graph(graph, snapshot):
+    assert len(snapshot) == len(graph)
+    assert isomorphic(snapshot, graph)
+    assert dict(snapshot.namespaces()) == dict(graph.namespaces())
+
+
+def test_every_triple_pattern_matches_as_in_the_graph(graph, snapshot):
+    report = next(iter(graph.subjects(RDF.type, None)))
+    predicate, object = next(iter(graph.predicate_objects(report)))
+    terms = [report, predicate, object, RDF.type, EX.hasNote, Literal("note", lang="en"), Literal("note", datatype=XSD.string),
+        BNode("person"), EX.Unknown, Literal("note")]
+    for pattern in itertools.product([None] + terms, repeat=3):
+        if pattern == (None, None, None):
+            continue
+        assert sorted(snapshot.triples(pattern)) == sorted(graph.triples(pattern)), pattern
+
+
+def test_every_term_is_found_by_its_number(graph, snapshot):
+    store = snapshot.store
+    for term in set(graph.subjects()) | set(graph.predicates()) | set(graph.objects()):
+        assert store.term(store.term_id(term)) == term
+
+
+def test_snapshots_are_read_only(snapshot, tmp_path):
+    with pytest.raises(TypeError):
+        snapshot.add((EX["Report#0"], RDF.type, EX.ArrestReport))
+
+    path = tmp_path / "graph.nt"
+    path.write_text("")
+    with pytest.raises(ValueError):
+        SnapshotStore(str(path))
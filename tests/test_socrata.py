@@ -0,0 +1,119 @@
+import time
+
+import pytest
+import requests
+
+from src.socrata import SocrataDownloader
+
+
+#Number of rows of the dataset and of rows per page, so that every download has several pages and a partial last page
+ROWS = 50
+PAGE_SIZE = 7
+
+
+@pytest.fixture
+def dataset(socrata):
+    """URL and rows, header first, of a dataset served by the stand-in"""
+    rows = [["rpt_id", "area_desc"]] + [[str(190000000 + number), "Area %s" % (number % 3)] for number in range(ROWS)]
+    return socrata.add("/resource/amvf-fr72", rows), rows
+
+
+def _downloader(**options):
+    options.setdefault("page_size", PAGE_SIZE)
+    options.setdefault("backoff", 0.01)
+    return SocrataDownloader(**options)
+
+
+def test_download_requests_every_page_once(socrata, dataset):
+    url, rows = dataset
+    assert _downloader(workers=3).download(url, ROWS) == rows
+    assert sorted(socrata.pages()) == list(range(0, ROWS, PAGE_SIZE))
+
+    #Fewer rows than the dataset has are downloaded in fewer pages
+    assert _downloader().download(url, 10) == rows[:11]
+
+
+def test_download_selects_newer_rows(socrata, dataset):
+    url, rows = dataset
+    assert _downloader().download(url, ROWS, where="rpt_id > '190000039'", select="rpt_id") == [["rpt_id"]] + [row[:1] for row in rows[41:]]
+
+
+def test_throttled_and_failed_requests_are_retried(socrata, dataset):
+    url, rows = dataset
+    socrata.fault(status=429)
+    socrata.fault(status=503)
+    downloader = _downloader()
+
+    assert downloader.download(url, ROWS) == rows
+    assert downloader.metrics.get("request_retries") == 2
+
+
+def test_requests_are_retried_with_exponential_backoff(socrata, dataset):
+    url, _ = dataset
+    socrata.fault(status=500, times=3)
+    downloader = _downloader(backoff=0.1, retries=3)
+
+    start = time.perf_counter()
+    downloader.count(url)
+    assert time.perf_counter() - start >= 0.1 + 0.2 + 0.4
+
+
+def test_requests_fail_once_retries_are_exhausted(socrata, dataset):
+    url, _ = dataset
+    socrata.fault(status=503, times=3)
+    with pytest.raises(requests.HTTPError):
+        _downloader(retries=2).count(url)
+
+    #Other errors are not retried
+    socrata.fault(status=404)
+    downloader = _downloader()
+    with pytest.raises(requests.HTTPError):
+        downloader.count(url)
+    assert downloader.metrics.get("request_retries") == 0
+
+
+def test_stalled_requests_time_out_and_are_retried(socrata, dataset):
+    url, rows = dataset
+    socrata.fault(delay=2, offset=14)
+    downloader = _downloader(timeout=0.2)
+
+    start = time.perf_counter()
+    assert downloader.download(url, ROWS) == rows
+    assert time.perf_counter() - start < 2
+    assert downloader.metrics.get("request_retries") == 1
+
+
+def test_interrupted_download_resumes_from_checkpoints(socrata, dataset, tmp_path):
+    url, rows = dataset
+    socrata.fault(status=503, offset=21, times=2)
+    with pytest.raises(requests.HTTPError):
+        _downloader(workers=1, retries=1, checkpoint_dir=str(tmp_path)).download(url, ROWS)
+    assert socrata.pages() == [0, 7, 14, 21, 21]
+
+    #Pages saved before the interruption are not downloaded again
+    del socrata.requests[:]
+    assert _downloader(workers=1, checkpoint_dir=str(tmp_path)).download(url, ROWS) == rows
+    assert socrata.pages() == list(range(21, ROWS, PAGE_SIZE))
+
+
+def test_prefetched_rows_are_read_as_they_are_downloaded(socrata, dataset):
+    url, rows = dataset
+    with _downloader().prefetch(url, ROWS, pages=1) as prefetched:
+        assert list(prefetched) == rows
+    prefetched.thread.join(5)
+    assert not prefetched.thread.is_alive()
+
+    #Errors of the download are raised when the rows are read
+    socrata.fault(status=404, offset=21)
+    with pytest.raises(requests.HTTPError):
+        list(_downloader().prefetch(url, ROWS))
+
+
+def test_prefetch_stops_once_closed(socrata, dataset):
+    url, rows = dataset
+    with _downloader(workers=1).prefetch(url, ROWS, pages=1) as prefetched:
+        assert next(prefetched) == rows[0]
+    prefetched.thread.join(5)
+
+    assert not prefetched.thread.is_alive()
+    assert len(socrata.pages()) < len(range(0, ROWS, PAGE_SIZE))
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from rdflib import Namespace
+
+from src.rdf import RDF_Graph
+from src.spatial import SpatialIndex, _distance
+from src.synthetic import generate_arrest_reports, generate_crime_reports
+
+
+NS = Namespace("http://example.org/")
+
+
+@pytest.fixture(scope="module")
+def points():
+    """Reports scattered around Los Angeles, with a few at unknown locations"""
+    random = np.random.default_rng(0)
+    latitudes = random.uniform(33.7, 34.3, 1000)
+    longitudes = random.uniform(-118.7, -118.1, 1000)
+    latitudes[:10], longitudes[:10] = 0, 0
+    latitudes[10:20] = np.nan
+    classes = np.where(np.arange(1000) % 2, "CrimeReport", "ArrestReport")
+    return np.arange(1000), classes, latitudes, longitudes
+
+
+def _uris(reports):
+    return {NS["Report#" + str(number)] for number in reports}
+
+
+def test_reports_are_found_within_a_bounding_box(points):
+    reports, classes, latitudes, longitudes = points
+    index = SpatialIndex(NS, reports, classes, latitudes, longitudes)
+    assert len(index.reports) == 980
+
+    inside = (latitudes >= 33.9) & (latitudes <= 34.05) & (longitudes >= -118.4) & (longitudes <= -118.25)
+    assert set(index.within(33.9, -118.4, 34.05, -118.25)) == _uris(reports[inside])
+    assert set(index.within(33.9, -118.4, 34.05, -118.25, report_class="CrimeReport")) == _uris(reports[inside & (classes == "CrimeReport")])
+    assert index.within(40, -75, 41, -74) == []
+
+
+@pytest.mark.parametrize("cell_size", [0.001, 0.01, 1])
+def test_nearest_reports_match_a_full_scan(points, cell_size):
+    reports, classes, latitudes, longitudes = points
+    index = SpatialIndex(NS, reports, classes, latitudes, longitudes, cell_size)
+
+    known = np.isfinite(latitudes) & (latitudes != 0)
+    distances = _distance(34.05, -118.25, latitudes[known], longitudes[known])
+    expected = np.argsort(distances, kind="stable")[:15]
+
+    nearest = index.nearest(34.05, -118.25, k=15)
+    assert [uri for uri, _ in nearest] == [NS["Report#" + str(number)] for number in reports[known][expected]]
+    assert [distance for _, distance in nearest] == pytest.approx(distances[expected].tolist())
+
+    #Points away from every report still find them
+    assert len(index.nearest(34.5, -118.4, k=3, report_class="ArrestReport")) == 3
+
+
+def test_saved_index_is_loaded_as_it_was(points, tmp_path):
+    index = SpatialIndex(NS, *points)
+    index.save(str(tmp_path / "graph.spatial.npz"))
+    loaded = SpatialIndex.load(NS, str(tmp_path / "graph.spatial.npz"))
+
+    assert loaded.cell_size == index.cell_size
+    assert loaded.nearest(34.05, -118.25, k=5) == index.nearest(34.05, -118.25, k=5)
+    assert loaded.within(33.9, -118.4, 34.05, -118.25, report_class="CrimeReport") == index.within(33.9, -118.4, 34.05, -118.25, report_class="CrimeReport")
+
+
+def test_graph_indexes_the_location_of_both_datasets():
+    graph = RDF_Graph(arrest_reports=list(generate_arrest_reports(100)), crime_reports=list(generate_crime_reports(100)))
+    index = graph.spatial_index()
+    assert set(index.classes) == {"ArrestReport", "CrimeReport"}
+    assert set(index.within(-90, -180, 90, 180)) == {graph.namespace["Report#" + str(number)] for number in index.reports}
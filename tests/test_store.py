@@ -0,0 +1,59 @@
+from rdflib import BNode, Graph, Literal, Namespace
+from rdflib.compare import isomorphic
+from rdflib.namespace import RDF, XSD
+
+from src.rdf import RDF_Graph
+from src.store import SQLiteStore
+from src.synthetic import generate_arrest_reports, generate_crime_reports
+
+
+EX = Namespace("http://example.org/")
+
+#Triples with every kind of term
+TRIPLES = {
+    (EX["Report#0"], RDF.type, EX.ArrestReport),
+    (EX["Report#0"], EX.hasDate, Literal("2020-01-01", datatype=XSD.date)),
+    (EX["Report#0"], EX.hasArea, Literal("Central", lang="en")),
+    (EX["Report#0"], EX.hasNote, Literal("line\nbreak")),
+    (EX["Report#1"], EX.hasDate, Literal("2020-01-01", datatype=XSD.date)),
+    (EX["Report#1"], EX.hasPerson, BNode("person"))}
+
+
+def test_triples_are_kept_between_openings(tmp_path):
+    path = str(tmp_path / "graph.db")
+    graph = Graph(store=SQLiteStore(path))
+    for triple in TRIPLES:
+        graph.add(triple)
+    graph.commit()
+    graph.close()
+
+    graph = Graph(store=SQLiteStore(path))
+    assert set(graph) == TRIPLES
+    assert set(graph.subjects(EX.hasDate, Literal("2020-01-01", datatype=XSD.date))) == {EX["Report#0"], EX["Report#1"]}
+    assert set(graph.predicate_objects(EX["Report#1"])) == {(EX.hasDate, Literal("2020-01-01", datatype=XSD.date)), (EX.hasPerson, BNode("person"))}
+    assert list(graph.triples((None, None, Literal("2020-01-01")))) == []
+    graph.close()
+
+
+def test_uncommitted_triples_are_rolled_back(tmp_path):
+    path = str(tmp_path / "graph.db")
+    graph = Graph(store=SQLiteStore(path))
+    graph.add((EX["Report#0"], RDF.type, EX.ArrestReport))
+    graph.commit()
+    graph.add((EX["Report#1"], RDF.type, EX.ArrestReport))
+    graph.rollback()
+
+    assert set(graph) == {(EX["Report#0"], RDF.type, EX.ArrestReport)}
+    graph.remove((EX["Report#0"], None, None))
+    assert len(graph) == 0
+    graph.close()
+
+
+def test_build_into_a_store_is_isomorphic(tmp_path):
+    reports = {"arrest_reports": list(generate_arrest_reports(200)), "crime_reports": list(generate_crime_reports(200)), "chunk_size": 50}
+    path = str(tmp_path / "graph.db")
+    RDF_Graph(store=path, **reports)
+
+    graph = Graph(store=SQLiteStore(path))
+    assert isomorphic(RDF_Graph(**reports).graph, graph)
+    graph.close()